@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Çevrimdışı bot benchmark'ı ve regresyon kontrolü
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+bench/fixtures altındaki sentetik doviz.com sayfalarını (gerçek sayfaların
+fiyat tablosu yapısını taklit eden, gerçekçi boyuta script bloklarıyla
+şişirilmiş HTML; canlı sayfa kaydı değildir) yerel bir HTTP sunucusundan
+yayınlar, lap.SAYFALAR'ı bu sunucuya yönlendirir ve ağ olmadan:
+  - her get_*_data fonksiyonunu (indirme + ayrıştırma),
+  - her komut handler'ını sahte Update nesneleriyle (önbellek sıcak/soğuk)
+çalıştırır. Her durum için ops/sn, p50/p95 gecikme ve tracemalloc ile çağrı
+başına tepe bellek raporlanır. Ölçümden önce KONTROLLER'deki davranış
+kontrolleri çalışır; biri başarısızsa betik 1 ile çıkar.
+
+--kaydet sonuçları referans dosyasına yazar. Referans varsa medyan gecikmesi
+--esik oranından fazla uzayan ya da tepe belleği o oranda artan durumlar
+regresyon sayılır ve betik 1 ile çıkar. Ölçümler makineye bağlı olduğundan
+referans depoda tutulmaz, karşılaştırmanın yapılacağı makinede üretilmelidir.
+--esik açıkça verildiğinde referans yoksa karşılaştırma yapılamadığı için
+betik 1 ile çıkar (CI'da sessizce geçmesin); verilmezse yalnızca not düşülür.
+
+Kullanım:
+  python bench/bench_bot.py --kaydet          # referansı oluştur
+  python bench/bench_bot.py --esik 0.25       # karşılaştır (referans şart)
+  python bench/bench_bot.py --filtre komut    # sadece eşleşen durumlar
+"""
+
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(BENCH_DIR, "fixtures")
+VARSAYILAN_REFERANS = os.path.join(BENCH_DIR, "baseline.json")
+VARSAYILAN_ESIK = 0.25
+
+# lap import edilmeden önce: kalıcı dosyalar geçici dizine, arka plan işleri kapalı
+_GECICI = tempfile.mkdtemp(prefix="finbot_bench_")
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ["DB_PATH"] = os.path.join(_GECICI, "bench.db")
+os.environ["DATA_FILE_PATH"] = os.path.join(_GECICI, "bench.json")
+os.environ["HISTORY_DIR"] = os.path.join(_GECICI, "gecmis")
+os.environ["PROFILE_DIR"] = os.path.join(_GECICI, "profiller")
+os.environ.setdefault("PROFILE_MODE", "0")
+# Yedek sağlayıcılar ağ ister; ölçüm yalnızca yerel fixture'larla yapılır
+os.environ["HEDGE_ENABLED"] = "0"
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+import lap  # noqa: E402
+
+# kaynak -> (yerel yol, fixture dosyası)
+FIXTURE_HARITASI = {
+    "gram": ("/gram-altin", "gram-altin.html"),
+    "altin_turleri": ("/", "altin.html"),
+    "para": ("/kur", "kur.html"),
+    "borsa": ("/borsa", "borsa.html"),
+    "kripto": ("/kripto-paralar", "kripto-paralar.html"),
+}
+
+BENCH_USER_ID = 424242
+
+
+# ========== YEREL SUNUCU ==========
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """Fixture dosyalarını doğrulayıcı başlık (ETag) olmadan sunar; her istek tam ayrıştırılır."""
+
+    protocol_version = "HTTP/1.1"
+    # başlık ve gövde ayrı yazıldığından Nagle + gecikmeli ACK her isteğe ~40 ms ekler
+    disable_nagle_algorithm = True
+    sayfalar = {}
+
+    def do_GET(self):
+        body = self.sayfalar.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fixture_server():
+    """Sunucuyu rastgele bir portta başlatır ve lap.SAYFALAR'ı ona yönlendirir."""
+    for yol, dosya in FIXTURE_HARITASI.values():
+        with open(os.path.join(FIXTURES, dosya), "rb") as f:
+            FixtureHandler.sayfalar[yol] = f.read()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adres = f"http://127.0.0.1:{server.server_address[1]}"
+    for kaynak, (yol, _dosya) in FIXTURE_HARITASI.items():
+        lap.SAYFALAR[kaynak] = adres + yol
+    return server
+
+
+# ========== SAHTE TELEGRAM NESNELERİ ==========
+class FakeMessage:
+    """Handler'ların kullandığı kadarıyla telegram.Message taklidi; yanıtları biriktirir."""
+
+    def __init__(self, user_id, chat_id):
+        self.from_user = types.SimpleNamespace(id=user_id)
+        self.chat_id = chat_id
+        self.chat = types.SimpleNamespace(id=chat_id)
+        self.yanitlar = []
+
+    async def reply_text(self, text, **kwargs):
+        self.yanitlar.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.yanitlar.append(text)
+        return self
+
+
+def fake_update(user_id=BENCH_USER_ID):
+    message = FakeMessage(user_id, user_id)
+    return types.SimpleNamespace(
+        message=message,
+        effective_message=message,
+        effective_user=message.from_user,
+        effective_chat=message.chat,
+    )
+
+
+def fake_context(*args):
+    return types.SimpleNamespace(args=list(args), bot=None, application=None)
+
+
+# ========== DURUMLAR ==========
+def scrape_cases():
+    """Her get_*_data fonksiyonunu boş sonuçta hata verecek şekilde sarar."""
+    durumlar = []
+    for kaynak, func in lap.SCRAPERS.items():
+        def calistir(func=func, kaynak=kaynak):
+            if not func():
+                raise RuntimeError(f"{kaynak} fixture'ından veri çıkmadı")
+        durumlar.append((f"scrape:{kaynak}", calistir))
+    return durumlar
+
+
+KOMUTLAR = [
+    ("start", lap.start, ()),
+    ("au", lap.au, ()),
+    ("para", lap.para, ()),
+    ("borsa", lap.borsa, ()),
+    ("kripto", lap.kripto, ()),
+    ("all", lap.all_data, ()),
+    ("kasa", lap.kasa, ()),
+    ("grafik", lap.grafik, ("usd", "24s")),
+    ("alarmlar", lap.alarmlar, ()),
+]
+
+
+def command_cases(soguk):
+    """Komut handler'larını sahte Update ile çağıran asenkron durumlar."""
+    etiket = "komut-soguk" if soguk else "komut"
+    durumlar = []
+    for ad, handler, args in KOMUTLAR:
+        wrapped = lap.instrumented(ad, handler)
+
+        async def calistir(wrapped=wrapped, args=args):
+            if soguk:
+                # Bayat veri beklemeden sunulduğundan soğuk durum önbellek boşken ölçülür
+                lap.PRICE_CACHE._snapshots.clear()
+            update = fake_update()
+            await wrapped(update, fake_context(*args))
+            if not update.message.yanitlar:
+                raise RuntimeError("handler yanıt üretmedi")
+
+        durumlar.append((f"{etiket}:/{ad}", calistir))
+    return durumlar
+
+
+# ========== DAVRANIŞ KONTROLLERİ ==========
+def telegram_update(update_id, user_id):
+    """Sıra anahtarı için gerçek telegram.Update (ağ gerektirmez)."""
+    return lap.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "/all",
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+        },
+    }, None)
+
+
+async def kontrol_update_sirasi():
+    """Tek kullanıcının biriken yavaş komutları diğer kullanıcıları bekletmemeli."""
+    yuva = 4
+    islemci = lap.SiraliUpdateProcessor(yuva)
+    bitenler = []
+    baslangic = time.perf_counter()
+
+    async def komut(user_id, no, sure):
+        await asyncio.sleep(sure)
+        bitenler.append((user_id, no, time.perf_counter() - baslangic))
+
+    # Application her güncelleme için ayrı task açıp process_update'i çağırır
+    gorevler = [asyncio.ensure_future(islemci.process_update(telegram_update(no, 1), komut(1, no, 0.2)))
+                for no in range(yuva)]
+    gorevler.append(asyncio.ensure_future(
+        islemci.process_update(telegram_update(yuva, 2), komut(2, 0, 0))))
+    await asyncio.gather(*gorevler)
+
+    hatalar = []
+    diger = next(sure for user_id, _no, sure in bitenler if user_id == 2)
+    if diger > 0.1:
+        hatalar.append(f"update sırası: 2. kullanıcı 1. kullanıcının kuyruğunu {diger:.2f} sn bekledi")
+    if [no for user_id, no, _sure in bitenler if user_id == 1] != list(range(yuva)):
+        hatalar.append("update sırası: aynı kullanıcının güncellemeleri sırasını korumadı")
+
+    # Farklı kullanıcılar aynı anda en fazla yuva kadar güncelleme çalıştırır
+    en_cok = 0
+
+    async def say():
+        nonlocal en_cok
+        en_cok = max(en_cok, islemci.islenen)
+        await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(islemci.process_update(telegram_update(100 + no, 100 + no), say())
+                           for no in range(yuva * 2)))
+    if en_cok > yuva:
+        hatalar.append(f"update sırası: {yuva} yuva varken {en_cok} güncelleme aynı anda çalıştı")
+    return hatalar
+
+
+async def kontrol_replika_esitleme():
+    """Kullanıcı verisi değişmeyen eşitleme turu store'ları yeniden yüklememeli."""
+    hatalar = []
+    # Replika eşitleyicisinin bir turunda yapılan ortak tablo yazımları
+    ortak = lap.SharedSnapshotStore(lap.DB_PATH, "bench-kopya")
+    ortak.kira_al("lider", 15)
+    ortak.talep_yaz({"para": time.time()})
+    ortak.yayinla("para", {"USD": {"alis": 1.0, "satis": 1.0}}, time.time())
+    # Bu kopyanın kendi yazımları da yeniden yükleme gerektirmez
+    alarm = lap.ALARMLAR.add("bench", BENCH_USER_ID, "usd", "alis", "yukari", 99.0)
+    lap.ALARMLAR.remove(alarm.id)
+    yuklenen = await lap.replika_verilerini_esitle()
+    if yuklenen:
+        hatalar.append(f"replika eşitleme: değişiklik yokken yeniden yüklendi: {', '.join(yuklenen)}")
+
+    # Başka bir bağlantının (kopyanın) eklediği alarm ise yüklenmeli
+    diger = lap.AlarmStore(lap.DB_PATH).add("bench", BENCH_USER_ID, "usd", "alis", "yukari", 99.0)
+    yuklenen = await lap.replika_verilerini_esitle()
+    if yuklenen != ["alarmlar"] or diger.id not in lap.ALARMLAR.alarms:
+        hatalar.append(f"replika eşitleme: başka kopyanın alarmı yüklenmedi ({yuklenen})")
+    lap.ALARMLAR.remove(diger.id)
+    return hatalar
+
+
+async def kontrol_alarm_esigi():
+    """Alarm eşiği Türkçe sayı biçimiyle okunmalı (5.000 -> 5000)."""
+    hatalar = []
+    # Koşulun "zaten sağlanıyor" sayılmaması için elde fiyat olmasın
+    kaynak = lap.ENSTRUMANLAR["gram-has-altin"][0]
+    snap = lap.PRICE_CACHE._snapshots.pop(kaynak, None)
+    try:
+        update = fake_update()
+        await lap.alarm(update, fake_context("gram", ">", "5.000"))
+        kurulan = [a for a in lap.ALARMLAR.user_alarms(str(BENCH_USER_ID)) if a.sembol == "gram-has-altin"]
+        if [a.esik for a in kurulan] != [5000.0]:
+            hatalar.append(f"alarm eşiği: /alarm gram > 5.000 -> {[a.esik for a in kurulan]} "
+                           f"({' | '.join(update.message.yanitlar)})")
+        for a in kurulan:
+            lap.ALARMLAR.remove(a.id)
+    finally:
+        if snap is not None:
+            lap.PRICE_CACHE._snapshots[kaynak] = snap
+    return hatalar
+
+
+async def kontrol_komut_birlestirme():
+    """Aynı komut yalnızca ilki sürerken birleştirilmeli; sonraki tekrar yanıt almalı."""
+    hatalar = []
+    user_id = BENCH_USER_ID + 1  # ölçümlerin kovasını harcamasın
+    cagrilar = []
+
+    async def komut(update, context):
+        cagrilar.append(update)
+        await asyncio.sleep(0.1)
+        await update.message.reply_text("yanıt")
+
+    sarili = lap.kisitli("bench", komut)
+    ilk, ikinci, sonraki = fake_update(user_id), fake_update(user_id), fake_update(user_id)
+    await asyncio.gather(sarili(ilk, fake_context()), sarili(ikinci, fake_context()))
+    if len(cagrilar) != 1 or ikinci.message.yanitlar:
+        hatalar.append(f"komut birleştirme: süren komut {len(cagrilar)} kez çalıştı")
+    await sarili(sonraki, fake_context())
+    if not sonraki.message.yanitlar:
+        hatalar.append("komut birleştirme: biten komutun tekrarı yanıtsız kaldı")
+    return hatalar
+
+
+async def kontrol_http_bosta_kapatma():
+    """HTTP sunucusu boşta kalan ve yarım istek gönderen bağlantıları kapatmalı."""
+    hatalar = []
+    zaman_asimi = lap.HTTP_READ_TIMEOUT
+    lap.HTTP_READ_TIMEOUT = 0.2
+    sunucu = lap.HttpServer(0)
+
+    async def saglik(request):
+        return 200, "text/plain", b"OK"
+
+    sunucu.route("GET", "/", saglik)
+    await sunucu.start()
+    port = sunucu._server.sockets[0].getsockname()[1]
+    try:
+        durumlar = {
+            "boşta keep-alive": b"GET / HTTP/1.1\r\nHost: x\r\n\r\n",
+            "yarım başlık": b"GET / HTTP/1.1\r\nHost",
+            "yarım gövde": b"POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\nabc",
+        }
+        for ad, istek in durumlar.items():
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(istek)
+            try:
+                # Kapatılan bağlantıda read EOF'a ulaşır; kapatılmazsa süre dolar
+                await asyncio.wait_for(reader.read(), 2)
+            except asyncio.TimeoutError:
+                hatalar.append(f"http zaman aşımı: {ad} bağlantısı açık kaldı")
+            writer.close()
+    finally:
+        await sunucu.stop()
+        lap.HTTP_READ_TIMEOUT = zaman_asimi
+    return hatalar
+
+
+KONTROLLER = [
+    kontrol_update_sirasi, kontrol_replika_esitleme, kontrol_alarm_esigi,
+    kontrol_komut_birlestirme, kontrol_http_bosta_kapatma,
+]
+
+
+async def kontrolleri_calistir():
+    hatalar = []
+    for kontrol in KONTROLLER:
+        sonuc = await kontrol()
+        print(f"{'❌' if sonuc else '✅'} {kontrol.__doc__}")
+        hatalar.extend(sonuc)
+    return hatalar
+
+
+# ========== ÖLÇÜM ==========
+def yuzdelik(sirali, oran):
+    return sirali[min(len(sirali) - 1, int(len(sirali) * oran))]
+
+
+async def olc(func, sure, en_az, bellek_tekrar):
+    """
+    func'ı (senkron ya da coroutine fonksiyonu) en az `sure` saniye ve
+    `en_az` kez çalıştırır. Ardından tracemalloc altında `bellek_tekrar`
+    çağrının ortalama tepe belleğini ölçer.
+    """
+    async def cagir():
+        sonuc = func()
+        if asyncio.iscoroutine(sonuc):
+            await sonuc
+
+    await cagir()  # ısınma
+    sureler = []
+    baslangic = time.perf_counter()
+    while len(sureler) < en_az or time.perf_counter() - baslangic < sure:
+        t0 = time.perf_counter()
+        await cagir()
+        sureler.append(time.perf_counter() - t0)
+    toplam = time.perf_counter() - baslangic
+
+    tepeler = []
+    tracemalloc.start()
+    try:
+        for _ in range(bellek_tekrar):
+            taban = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await cagir()
+            tepeler.append(tracemalloc.get_traced_memory()[1] - taban)
+    finally:
+        tracemalloc.stop()
+
+    sureler.sort()
+    return {
+        "ops_sn": len(sureler) / toplam,
+        "p50_ms": yuzdelik(sureler, 0.50) * 1000,
+        "p95_ms": yuzdelik(sureler, 0.95) * 1000,
+        "tepe_kib": sum(tepeler) / len(tepeler) / 1024,
+    }
+
+
+# Mikrosaniye mertebesindeki durumlarda ölçüm gürültüsünü regresyon saymamak için
+MIN_FARK_MS = 0.02
+
+
+def karsilastir(sonuclar, referans, esik):
+    """Referansa göre regresyona giren durumların açıklamalarını döndürür."""
+    regresyonlar = []
+    for ad, olcum in sonuclar.items():
+        eski = referans.get(ad)
+        if not eski:
+            continue
+        # ops/sn birkaç yavaş çağrıdan kolayca etkilendiği için medyan gecikme karşılaştırılır
+        if olcum["p50_ms"] > eski["p50_ms"] * (1 + esik) + MIN_FARK_MS:
+            regresyonlar.append(
+                f"{ad}: p50 {eski['p50_ms']:.2f} ms -> {olcum['p50_ms']:.2f} ms "
+                f"(ops/sn {eski['ops_sn']:.1f} -> {olcum['ops_sn']:.1f})"
+            )
+        if olcum["tepe_kib"] > eski["tepe_kib"] * (1 + esik) + 1:
+            regresyonlar.append(
+                f"{ad}: tepe bellek {eski['tepe_kib']:.1f} KiB -> {olcum['tepe_kib']:.1f} KiB"
+            )
+    return regresyonlar
+
+
+async def calistir(args):
+    portfoy = {
+        "enpara_gr": 30, "ziraat_gr": 35, "ata": 2, "ceyrek": 3,
+        "borsa": 50000, "kripto": 1000, "diger": 25000,
+    }
+    hatalar = await kontrolleri_calistir()
+    await lap.run_blocking(lap.PORTFOY.put, str(BENCH_USER_ID), portfoy)
+    lap.PORTFOY_DEFTERI.upsert(str(BENCH_USER_ID), portfoy)
+
+    gruplar = [("scrape", scrape_cases()), ("komut", command_cases(soguk=False)),
+               ("komut-soguk", command_cases(soguk=True))]
+    sonuclar = {}
+
+    print(f"Parser: {lap.HTML_PARSER} | Strainer: {'açık' if lap.HTML_STRAINER else 'kapalı'}")
+    print(f"{'Durum':<26}{'ops/sn':>10}{'p50 ms':>10}{'p95 ms':>10}{'tepe KiB':>11}")
+    for _grup, durumlar in gruplar:
+        for ad, func in durumlar:
+            if args.filtre and args.filtre not in ad:
+                continue
+            olcum = await olc(func, args.sure, args.en_az, args.bellek_tekrar)
+            sonuclar[ad] = olcum
+            print(f"{ad:<26}{olcum['ops_sn']:>10.1f}{olcum['p50_ms']:>10.2f}"
+                  f"{olcum['p95_ms']:>10.2f}{olcum['tepe_kib']:>11.1f}")
+    return sonuclar, hatalar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sure", type=float, default=1.0, help="durum başına ölçüm süresi (sn)")
+    parser.add_argument("--en-az", type=int, default=20, help="durum başına en az çağrı")
+    parser.add_argument("--bellek-tekrar", type=int, default=5, help="tracemalloc altında çağrı sayısı")
+    parser.add_argument("--esik", type=float, default=None,
+                        help=f"izin verilen göreli kötüleşme (varsayılan {VARSAYILAN_ESIK})")
+    parser.add_argument("--referans", default=VARSAYILAN_REFERANS)
+    parser.add_argument("--kaydet", action="store_true", help="sonuçları referans olarak yaz")
+    parser.add_argument("--filtre", default="", help="sadece adı bunu içeren durumlar")
+    args = parser.parse_args()
+
+    server = start_fixture_server()
+    try:
+        sonuclar, hatalar = asyncio.run(calistir(args))
+    finally:
+        server.shutdown()
+        lap.SCRAPE_EXECUTOR.shutdown(wait=False)
+
+    if hatalar:
+        for satir in hatalar:
+            print(f"❌ {satir}")
+        return 1
+
+    if args.kaydet:
+        referans = {}
+        if os.path.exists(args.referans):
+            with open(args.referans, encoding="utf-8") as f:
+                referans = json.load(f)
+        referans.update(sonuclar)
+        with open(args.referans, "w", encoding="utf-8") as f:
+            json.dump(referans, f, indent=2, sort_keys=True)
+        print(f"💾 Referans kaydedildi: {args.referans}")
+        return 0
+
+    if not os.path.exists(args.referans):
+        if args.esik is not None:
+            print(f"❌ Referans yok ({args.referans}); önce --kaydet ile oluşturun.")
+            return 1
+        print("ℹ️ Referans yok, karşılaştırma atlandı (--kaydet ile oluşturun).")
+        return 0
+    esik = VARSAYILAN_ESIK if args.esik is None else args.esik
+
+    with open(args.referans, encoding="utf-8") as f:
+        referans = json.load(f)
+    regresyonlar = karsilastir(sonuclar, referans, esik)
+    if regresyonlar:
+        print(f"❌ %{esik * 100:.0f} eşiğini aşan regresyon:")
+        for satir in regresyonlar:
+            print(f"  {satir}")
+        return 1
+    print(f"✅ Regresyon yok (eşik %{esik * 100:.0f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
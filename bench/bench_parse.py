@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+HTML ayrıştırma mikro-benchmark'ı
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+bench/fixtures altındaki sentetik doviz.com sayfalarını eski (sembol başına
+soup.find / satır başına metin taraması) yöntemle ve PageIndex tabanlı tek
+geçişli yöntemle ayrıştırıp süreleri karşılaştırır. İki yöntemin aynı sonucu
+verdiği de kontrol edilir. Fixture'lar gerçek sayfa kaydı değildir; fiyat
+tablosu yapısı taklit edilip gerçekçi boyuta şişirilmiştir. Yedek sağlayıcıların
+(truncgil, CoinGecko) API biçiminde elle hazırlanmış JSON yanıtları da
+ayrıştırılıp kaynağın tüm enstrümanlarını doğru alanlardan okudukları kontrol
+edilir.
+
+Kullanım:
+  python bench/bench_parse.py [--tekrar 50]
+  HTML_PARSER=lxml python bench/bench_parse.py
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# lap import edilmeden önce: kalıcı dosyalar geçici dizine (import sırasında
+# JSON -> SQLite göçü çalışır, gerçek veri dosyasına dokunulmamalı)
+_GECICI = tempfile.mkdtemp(prefix="finbot_bench_")
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ["DB_PATH"] = os.path.join(_GECICI, "bench.db")
+os.environ["DATA_FILE_PATH"] = os.path.join(_GECICI, "bench.json")
+os.environ["HISTORY_DIR"] = os.path.join(_GECICI, "gecmis")
+os.environ["PROFILE_DIR"] = os.path.join(_GECICI, "profiller")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import lap  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+# ========== ESKİ YÖNTEM (KARŞILAŞTIRMA İÇİN) ==========
+def legacy_gold(html):
+    soup = BeautifulSoup(html, "html.parser")
+    results = {}
+    for row in soup.find_all("tr"):
+        row_text = row.get_text()
+        for kaynak in lap.SECICILER["gram"]:
+            if kaynak in row_text:
+                cells = row.find_all("td")
+                if len(cells) >= 4:
+                    alis = lap.parse_price(cells[1].get_text())
+                    satis = lap.parse_price(cells[2].get_text())
+                    if alis and satis:
+                        results[kaynak] = lap.fiyat_kaydi(alis, satis)
+                break
+    return results
+
+
+def _legacy_socket(html, anahtarlar, kayit):
+    soup = BeautifulSoup(html, "html.parser")
+    results = {}
+    for isim, key in anahtarlar:
+        alis_elem = soup.find("td", {"data-socket-key": key, "data-socket-attr": "bid"})
+        satis_elem = soup.find("td", {"data-socket-key": key, "data-socket-attr": "ask"})
+        if alis_elem and satis_elem:
+            alis = lap.parse_price(alis_elem.get_text(strip=True))
+            satis = lap.parse_price(satis_elem.get_text(strip=True))
+            if alis and satis:
+                results[isim] = kayit(alis, satis)
+    return results
+
+
+def legacy_altin_turleri(html):
+    return _legacy_socket(html, [(isim, key) for key, isim in lap.SECICILER["altin_turleri"].items()],
+                          lap.fiyat_kaydi)
+
+
+def legacy_para(html):
+    return _legacy_socket(html, [(k, k) for k in lap.SECICILER["para"]],
+                          lambda a, s: {"alis": a, "satis": s})
+
+
+def legacy_borsa(html):
+    soup = BeautifulSoup(html, "html.parser")
+    results = {}
+    for kod in lap.SECICILER["borsa"]:
+        li_elem = soup.find("li", {"data-container": kod})
+        if li_elem:
+            change_elem = li_elem.find("span", class_="change")
+            if change_elem:
+                results[kod] = {"degisim": change_elem.get_text(strip=True)}
+    return results
+
+
+def legacy_kripto(html):
+    soup = BeautifulSoup(html, "html.parser")
+    results = {}
+    for row in soup.find_all("tr"):
+        if not row.find("a"):
+            continue
+        details = row.find("div", class_="currency-details")
+        if not details or not details.find("div"):
+            continue
+        kod = details.find("div").get_text(strip=True)
+        if kod in lap.SECICILER["kripto"]:
+            cells = row.find_all("td")
+            if len(cells) >= 6:
+                results[kod] = {"fiyat_usd": cells[1].get_text(strip=True),
+                                "degisim": cells[5].get_text(strip=True)}
+    return results
+
+
+SAYFALAR = [
+    ("gram-altin.html", legacy_gold, lap.parse_gold_page),
+    ("altin.html", legacy_altin_turleri, lap.parse_altin_turleri_page),
+    ("kur.html", legacy_para, lap.parse_para_page),
+    ("borsa.html", legacy_borsa, lap.parse_borsa_page),
+    ("kripto-paralar.html", legacy_kripto, lap.parse_kripto_page),
+]
+
+
+# (fixture, ayrıştırıcı, kaynak, (anahtar, alan, beklenen değer))
+YEDEKLER = [
+    ("truncgil-today.json", lap.parse_truncgil_altin_turleri, "altin_turleri",
+     ("Gram Has Altın", "alis", 2421.37)),
+    ("truncgil-today.json", lap.parse_truncgil_para, "para", ("USD", "satis", 32.3599)),
+    ("coingecko-price.json", lap.parse_coingecko_kripto, "kripto", ("XRP", "fiyat_usd", "$0,4871")),
+]
+
+
+def yedekleri_kontrol_et():
+    """Yedek ayrıştırıcıların hatalarını döndürür."""
+    hatalar = []
+    for dosya, ayristir, kaynak, (anahtar, alan, beklenen) in YEDEKLER:
+        with open(os.path.join(FIXTURES, dosya), encoding="utf-8") as f:
+            sonuc = ayristir(json.load(f))
+        eksik = [e.anahtar for e in lap.REGISTRY.kaynak_enstrumanlari(kaynak) if e.anahtar not in sonuc]
+        if eksik:
+            hatalar.append(f"{dosya} -> {kaynak}: eksik {', '.join(eksik)}")
+        deger = sonuc.get(anahtar, {}).get(alan)
+        if deger != beklenen:
+            hatalar.append(f"{dosya} -> {kaynak}: {anahtar}.{alan} = {deger!r}, beklenen {beklenen!r}")
+    return hatalar
+
+
+def olc(func, html, tekrar):
+    """Fonksiyonun çağrı başına ortalama süresini milisaniye olarak döndürür."""
+    func(html)  # ısınma
+    baslangic = time.perf_counter()
+    for _ in range(tekrar):
+        func(html)
+    return (time.perf_counter() - baslangic) / tekrar * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tekrar", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Parser: {lap.HTML_PARSER} | Strainer: {'açık' if lap.HTML_STRAINER else 'kapalı'}")
+    print(f"{'Sayfa':<22}{'Eski (ms)':>12}{'Yeni (ms)':>12}{'Hızlanma':>10}")
+
+    hatali = False
+    for dosya, eski, yeni in SAYFALAR:
+        with open(os.path.join(FIXTURES, dosya), encoding="utf-8") as f:
+            html = f.read()
+        if eski(html) != yeni(html):
+            print(f"❌ {dosya}: sonuçlar farklı!")
+            hatali = True
+        eski_ms = olc(eski, html, args.tekrar)
+        yeni_ms = olc(yeni, html, args.tekrar)
+        print(f"{dosya:<22}{eski_ms:>12.2f}{yeni_ms:>12.2f}{eski_ms / yeni_ms:>9.1f}x")
+
+    for satir in yedekleri_kontrol_et():
+        print(f"❌ {satir}")
+        hatali = True
+    if not hatali:
+        print("✅ Yedek sağlayıcı ayrıştırıcıları fixture'larla uyumlu")
+
+    return 1 if hatali else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,24 +10,83 @@ Sürüm: 2.1 (Koyeb Fixed)
 
 Environment Variables (Koyeb'de tanımlanmalı):
   - BOT_TOKEN: Telegram Bot Token (@BotFather'dan alınır)
-  - CHAT_ID: Telegram Chat ID (opsiyonel)
+  - CHAT_ID: Günlük özetlerin gönderileceği Telegram Chat ID (opsiyonel)
+  - INLINE_CACHE_TIME: Inline sorgu sonuçlarının önbellek süresi, saniye (opsiyonel)
+  - ADMIN_IDS: /stats kullanabilecek kullanıcı id'leri, virgülle (opsiyonel)
+  - PROFILE_MODE: 1 ise en yavaş istekler cProfile ile kaydedilir (opsiyonel)
+  - CACHE_TTL: Fiyat önbelleği süresi, saniye (opsiyonel, varsayılan 60)
+  - SCRAPE_WORKERS: Eşzamanlı scrape thread sayısı (opsiyonel, varsayılan 4)
+  - STORAGE_BACKEND: Portföy deposu, sqlite veya json (opsiyonel, varsayılan sqlite)
+  - DB_PATH: SQLite dosyası (opsiyonel, varsayılan /tmp/kullanici_verileri.db)
+  - HISTORY_DIR: Fiyat geçmişi dizini (opsiyonel, varsayılan /tmp/fiyat_gecmisi)
+  - BROADCAST_SABAH / BROADCAST_KAPANIS: Yayın saatleri (opsiyonel, 09:30 / 18:15)
+  - PORT: Health/webhook HTTP portu (opsiyonel, varsayılan 8000)
+  - WEBHOOK_URL: Tanımlıysa webhook modu, ör. https://app.koyeb.app (opsiyonel)
+  - WEBHOOK_SECRET: Webhook gizli token'ı (opsiyonel, token'dan türetilir)
+  - HEALTH_MAX_AGE: /healthz için talep edilen kaynakların bayatlık eşiği, saniye (opsiyonel, varsayılan 900)
+  - HTML_PARSER: BeautifulSoup parser'ı (opsiyonel, lxml varsa lxml)
+  - REFRESH_ENABLED: Arka plan fiyat yenileyici (opsiyonel, varsayılan 1)
+  - HEDGE_ENABLED: Yavaş/boş doviz.com yanıtında yedek sağlayıcı (opsiyonel, varsayılan 1)
+  - BREAKER_THRESHOLD: Devre kesicinin açılacağı ardışık hata sayısı (opsiyonel, varsayılan 3)
+  - STALE_MAX_AGE: Kaynak çökünce gösterilecek son verinin azami yaşı, saniye (opsiyonel, varsayılan 86400)
+  - INSTRUMENTS_FILE: Enstrüman kaydı (opsiyonel, varsayılan enstrumanlar.json)
+  - DEMAND_WINDOW: Son komuttan sonra kaynağın arka planda yenilenme süresi, saniye (opsiyonel, varsayılan 1800)
+  - NISAB_BILDIRIM: Portföy nisab eşiğini geçince kullanıcıya bildirim (opsiyonel, varsayılan 1)
+  - UPDATE_CONCURRENCY: Aynı anda işlenen güncelleme sayısı, 1 ise sıralı (opsiyonel, varsayılan 32)
+  - STREAM_REPLIES: /all, /au ve /kasa yanıtını kaynak geldikçe yerinde güncelle (opsiyonel, varsayılan 1)
+  - REPLICA_MODE: 1 ise birden fazla kopya ortak SQLite üzerinden lider seçerek çalışır (opsiyonel, varsayılan 0)
+  - SHARED_DB_PATH: Replikalar arası ortak snapshot/kira dosyası (opsiyonel, varsayılan DB_PATH)
+  - WARM_STATE_PATH: Kapanışta son fiyatların yazıldığı, açılışta okunduğu dosya; boşsa kapalı (opsiyonel)
+  - USER_RATE_PER_MIN / CHAT_RATE_PER_MIN: Kullanıcı/sohbet başına dakikalık pahalı komut sınırı (opsiyonel, 10 / 30)
+  - HTTP_READ_TIMEOUT: HTTP sunucusunda istek okuma ve keep-alive boşta bekleme süresi, saniye (opsiyonel, varsayılan 15)
+  - WEBHOOK_DROP_PENDING: Açılışta Telegram'da bekleyen güncellemeleri at (opsiyonel, varsayılan 1; REPLICA_MODE'da 0)
+  - SOURCE_TIMEOUT: Çok kaynaklı komutlarda kaynak başına süre, saniye (opsiyonel, varsayılan 8)
 """
 
 # ================== ZORUNLU IMPORTLAR ==================
-import requests
-from bs4 import BeautifulSoup
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+# Başlangıç süresi ölçümü için ilk iş saat alınır
+import time
+_SUREC_BASLANGIC = time.perf_counter()
+
+# requests, bs4 ve numpy ilk kullanıldıkları yerde import edilir; bot ilk
+# sayfa çekiminden önce güncelleme almaya başlar. telegram ise güncelleme
+# almak için zaten gerektiğinden burada yüklenir.
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import (
+    Application, BaseUpdateProcessor, CommandHandler, ContextTypes, InlineQueryHandler,
+)
+from telegram.error import Forbidden, RetryAfter
+from telegram.request import HTTPXRequest
 import json
 import os
 import sys
 import logging
+import re
+import sqlite3
+import struct
+import mmap
+import bisect
+import asyncio
+import functools
+import contextvars
+import importlib.util
+import cProfile
+import heapq
+import random
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
+from typing import NamedTuple
+from urllib.parse import urlsplit
 
-# +++++++++++++++++++++++++++++++++++++++++++++++++++++++
-# [EKLENDI] KOYEB BYPASS ICIN GEREKLI KUTUPHANELER
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
-# +++++++++++++++++++++++++++++++++++++++++++++++++++++++
+import signal
+import hmac
+import socket
+import hashlib
 
 # ========== LOGGING AYARLARI ==========
 # Bulut ortamında log takibi için
@@ -38,33 +97,280 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# +++++++++++++++++++++++++++++++++++++++++++++++++++++++
-# [EKLENDI] KOYEB DUMMY SERVER SINIFI VE FONKSIYONU
-# Bu kısım Koyeb'in "Web Service" beklentisini karşılar.
-# Bot çalışırken arka planda 8000 portunu dinler.
-class DummyHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b"OK - Bot Calisiyor")
-    
-    # Logları kirletmemesi için log fonksiyonunu susturabiliriz (isteğe bağlı)
-    def log_message(self, format, *args):
-        pass
+# ========== METRİKLER (PROMETHEUS) ==========
+# Harici kütüphane olmadan Prometheus metin formatında sayaç, gauge ve
+# histogram. /metrics endpoint'i METRICS.render() çıktısını döner.
+class Metric:
+    """Etiket değerlerine göre ayrılmış tek bir metrik ailesi."""
+
+    tip = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _etiket(self, labels, ek=None):
+        ciftler = list(zip(self.labelnames, labels))
+        if ek:
+            ciftler.append(ek)
+        if not ciftler:
+            return ""
+        return "{" + ",".join(f'{ad}="{deger}"' for ad, deger in ciftler) + "}"
+
+    def samples(self):
+        with self._lock:
+            return [(f"{self.name}{self._etiket(labels)}", deger) for labels, deger in self._values.items()]
+
+class Counter(Metric):
+    tip = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+class Gauge(Metric):
+    tip = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        # callback tanımlıysa değerler okuma anında {etiketler: değer} olarak hesaplanır
+        self.callback = callback
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        return [(f"{self.name}{self._etiket(labels)}", deger) for labels, deger in self.callback().items()]
+
+class Histogram(Metric):
+    tip = "histogram"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help_text, labelnames=(), buckets=None):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets or self.BUCKETS
+
+    def observe(self, value, *labels):
+        with self._lock:
+            kayit = self._values.get(labels)
+            if kayit is None:
+                kayit = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, sinir in enumerate(self.buckets):
+                if value <= sinir:
+                    kayit[0][i] += 1
+            kayit[1] += value
+            kayit[2] += 1
+
+    def samples(self):
+        sonuc = []
+        with self._lock:
+            for labels, (sayaclar, toplam, adet) in self._values.items():
+                for sinir, sayi in zip(self.buckets, sayaclar):
+                    sonuc.append((f"{self.name}_bucket{self._etiket(labels, ('le', sinir))}", sayi))
+                sonuc.append((f"{self.name}_bucket{self._etiket(labels, ('le', '+Inf'))}", adet))
+                sonuc.append((f"{self.name}_sum{self._etiket(labels)}", toplam))
+                sonuc.append((f"{self.name}_count{self._etiket(labels)}", adet))
+        return sonuc
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        satirlar = []
+        for metric in self._metrics:
+            satirlar.append(f"# HELP {metric.name} {metric.help_text}")
+            satirlar.append(f"# TYPE {metric.name} {metric.tip}")
+            satirlar.extend(f"{ad} {deger}" for ad, deger in metric.samples())
+        return "\n".join(satirlar) + "\n"
+
+METRICS = MetricsRegistry()
+SCRAPE_DURATION = METRICS.register(Histogram(
+    "finbot_scrape_duration_seconds", "doviz.com HTTP isteği süresi", ("host",)))
+PARSE_DURATION = METRICS.register(Histogram(
+    "finbot_parse_duration_seconds", "Sayfa ayrıştırma süresi", ("page",)))
+CACHE_REQUESTS = METRICS.register(Counter(
+    "finbot_cache_requests_total", "Snapshot önbelleği istekleri", ("kaynak", "sonuc")))
+HANDLER_DURATION = METRICS.register(Histogram(
+    "finbot_handler_duration_seconds", "Komut işleme süresi", ("command",)))
+TELEGRAM_DURATION = METRICS.register(Histogram(
+    "finbot_telegram_request_duration_seconds", "Bot API istek süresi", ("method",)))
+ERRORS = METRICS.register(Counter(
+    "finbot_errors_total", "Hata sayısı", ("kategori",)))
+STARTUP_DURATION = METRICS.register(Gauge(
+    "finbot_startup_seconds", "Süreç başlangıcından itibaren geçen süre", ("asama",)))
+
+def report_error(kategori, mesaj):
+    """Hatayı loglar ve kategori bazında sayar."""
+    ERRORS.inc(kategori)
+    logger.error(mesaj)
+
+# ========== KOMUT PROFİLLEME ==========
+# Her komut bir "iz" (Trace) açar; fetch, parse, extract, render ve reply
+# aşamalarının süreleri bu ize eklenir ve komut bazında son PROFILE_WINDOW
+# çağrı üzerinden p50/p95/p99 hesaplanır (/stats). fetch, verinin beklendiği
+# toplam süredir; parse/extract bu süre içinde harcanan ayrıştırma kısmıdır.
+# PROFILE_MODE=1 iken istekler PROFILE_SAMPLE_RATE oranında cProfile ile
+# örneklenir ve en yavaş PROFILE_TOP_N tanesi PROFILE_DIR'e .prof olarak
+# yazılır (snakeviz/flameprof ile flame graph'a çevrilebilir).
+# Not: profiler event loop thread'inde açılır ve komutun await'leri boyunca
+# açık kalır; o sırada aynı thread'de çalışan diğer handler'lar, dinleyiciler
+# ve yenileyici de profile girer. Scrape thread'lerindeki iş ise girmez
+# (cProfile thread başınadır). Profiller komutun kendi maliyeti değil, o
+# aralıkta loop'un ne yaptığı olarak okunmalıdır.
+PROFILE_WINDOW = int(os.getenv("PROFILE_WINDOW", "1000"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/finbot_profiles")
+
+PHASES = ("fetch", "parse", "extract", "render", "reply")
+
+class Trace:
+    """Tek bir komut çağrısının aşama süreleri."""
+
+    def __init__(self, command):
+        self.command = command
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._lock = threading.Lock()
+
+    def add(self, ad, sure):
+        # parse/extract scrape thread'lerinden de eklenebilir
+        with self._lock:
+            self.phases[ad] = self.phases.get(ad, 0.0) + sure
+
+_AKTIF_IZ = contextvars.ContextVar("aktif_iz", default=None)
+
+@contextmanager
+def phase(ad):
+    """Bloğun süresini aktif komut izine ekler (iz yoksa yalnızca çalıştırır)."""
+    iz = _AKTIF_IZ.get()
+    if iz is None:
+        yield
+        return
+    baslangic = time.perf_counter()
+    try:
+        yield
+    finally:
+        iz.add(ad, time.perf_counter() - baslangic)
 
-def run_dummy_server():
-    # Koyeb genelde PORT env değişkenini atar, yoksa 8000 kullanır
-    port = int(os.environ.get("PORT", 8000))
-    server = HTTPServer(("0.0.0.0", port), DummyHandler)
-    logger.info(f"🔌 Koyeb Dummy Server {port} portunda başlatıldı.")
-    server.serve_forever()
-# +++++++++++++++++++++++++++++++++++++++++++++++++++++++
+class CommandStats:
+    """Komut ve aşama bazında son N ölçümü tutar, yüzdelikleri hesaplar."""
 
+    def __init__(self, window):
+        self.window = window
+        self._olcumler = {}   # komut -> {"total"|aşama: deque}
+
+    def record(self, trace, toplam):
+        komut = self._olcumler.setdefault(trace.command, {})
+        komut.setdefault("total", deque(maxlen=self.window)).append(toplam)
+        for ad, sure in trace.phases.items():
+            komut.setdefault(ad, deque(maxlen=self.window)).append(sure)
+
+    @staticmethod
+    def percentiles(degerler):
+        sirali = sorted(degerler)
+        son = len(sirali) - 1
+        return tuple(sirali[min(son, int(round(q * son)))] for q in (0.50, 0.95, 0.99))
+
+    def summary(self):
+        """{komut: {ölçüm: (n, p50, p95, p99)}} döndürür."""
+        return {
+            komut: {ad: (len(d), *self.percentiles(d)) for ad, d in olcumler.items() if d}
+            for komut, olcumler in self._olcumler.items()
+        }
+
+COMMAND_STATS = CommandStats(PROFILE_WINDOW)
+
+class SlowestProfiles:
+    """Örneklenen cProfile çıktılarından en yavaş N tanesini diskte tutar."""
+
+    def __init__(self, directory, top_n):
+        self.directory = directory
+        self.top_n = top_n
+        self._heap = []   # (süre, dosya) min-heap
+        self.active = False
+
+    async def maybe_keep(self, profiler, command, sure):
+        """İlk N'e giren profili disk işlemleri loop dışında olacak şekilde yazar."""
+        if len(self._heap) >= self.top_n and sure <= self._heap[0][0]:
+            return
+        dosya = os.path.join(self.directory, f"{command}-{sure * 1000:.0f}ms-{int(time.time())}.prof")
+        heapq.heappush(self._heap, (sure, dosya))
+        eski = None
+        if len(self._heap) > self.top_n:
+            _sure, eski = heapq.heappop(self._heap)
+        await run_blocking(self._yaz, profiler, dosya, eski)
+
+    def _yaz(self, profiler, dosya, eski):
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(dosya)
+        if eski:
+            try:
+                os.remove(eski)
+            except OSError:
+                pass
+
+    def listing(self):
+        return sorted(self._heap, reverse=True)
+
+SLOW_PROFILES = SlowestProfiles(PROFILE_DIR, PROFILE_TOP_N)
+
+def instrumented(command, handler):
+    """Handler'ın süresini ve aşamalarını ölçen, gerekirse profilleyen sarmalayıcı."""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        iz = Trace(command)
+        token = _AKTIF_IZ.set(iz)
+        # cProfile thread başına tek profiler destekler; aynı anda bir örnek
+        profiler = None
+        if PROFILE_MODE and not SLOW_PROFILES.active and random.random() < PROFILE_SAMPLE_RATE:
+            SLOW_PROFILES.active = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        baslangic = time.perf_counter()
+        try:
+            return await handler(update, context)
+        finally:
+            sure = time.perf_counter() - baslangic
+            if profiler is not None:
+                profiler.disable()
+                SLOW_PROFILES.active = False
+                try:
+                    await SLOW_PROFILES.maybe_keep(profiler, command, sure)
+                except Exception as e:
+                    report_error("background", f"Profil yazılamadı: {e}")
+            _AKTIF_IZ.reset(token)
+            HANDLER_DURATION.observe(sure, command)
+            COMMAND_STATS.record(iz, sure)
+    return wrapper
+
+
+# Süreç başlangıcı (/healthz uptime)
+STARTED_AT = time.time()
 
 # ========== ENVIRONMENT VARIABLES ==========
 # Gizli bilgiler environment variable olarak alınır (Koyeb'de tanımlanmalı)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID", "")
+# /stats gibi yönetici komutlarını kullanabilecek Telegram kullanıcı id'leri
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
 
 # Token kontrolü
 if not BOT_TOKEN:
@@ -85,24 +391,257 @@ def load_user_data():
             with open(DATA_FILE, "r", encoding="utf-8") as f:
                 return json.load(f)
     except Exception as e:
-        print(f"Veri yükleme hatası: {e}")
+        report_error("storage", f"Veri yükleme hatası: {e}")
     return {}
 
 def save_user_data(data):
-    """Kullanıcı verilerini dosyaya kaydeder."""
+    """Kullanıcı verilerini dosyaya kaydeder (geçici dosya + rename ile atomik)."""
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
+        tmp_path = f"{DATA_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, DATA_FILE)
         return True
     except Exception as e:
-        print(f"Veri kaydetme hatası: {e}")
+        report_error("storage", f"Veri kaydetme hatası: {e}")
         return False
 
-KAYNAKLAR = {
-    "Kapalıçarşı": "🏦",
-    "Enpara": "🏪",
-    "Ziraat Bankası": "🏪"
-}
+# ========== PORTFÖY DEPOSU ==========
+# STORAGE_BACKEND=sqlite (varsayılan): kullanıcı başına tek satır, WAL modu,
+#   atomik upsert ve bellek içi okuma önbelleği. İlk açılışta eski JSON
+#   dosyası bir kez içeri aktarılır.
+# STORAGE_BACKEND=json: eski davranış, tüm kullanıcılar tek JSON dosyasında.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+DB_PATH = os.getenv("DB_PATH", "/tmp/kullanici_verileri.db")
+
+PORTFOY_ALANLARI = ("enpara_gr", "ziraat_gr", "ata", "ceyrek", "borsa", "kripto", "diger")
+
+# Replikalar kullanıcı verisindeki değişiklikleri tablo başına sürüm sayacıyla
+# fark eder. PRAGMA data_version aynı dosyaya yazan her bağlantıda (kira,
+# talep tabloları dahil) arttığından kullanılmaz; sayacı yalnızca kullanıcı
+# verisi yazan store'lar artırır.
+def degisiklik_tablosu(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS degisiklik (tablo TEXT PRIMARY KEY, surum INTEGER NOT NULL)")
+
+def tablo_surumu(conn, tablo):
+    row = conn.execute("SELECT surum FROM degisiklik WHERE tablo = ?", (tablo,)).fetchone()
+    return row[0] if row else 0
+
+def tablo_degisti(conn, tablo, bilinen):
+    """
+    Tablonun sayacını artırır. Araya başka yazan girmediyse yeni sürümü,
+    girdiyse bilineni döndürür; o zaman sonraki yenile() tabloyu yeniden yükler.
+    """
+    yeni = conn.execute(
+        "INSERT INTO degisiklik (tablo, surum) VALUES (?, 1) "
+        "ON CONFLICT(tablo) DO UPDATE SET surum = surum + 1 RETURNING surum",
+        (tablo,),
+    ).fetchone()[0]
+    return yeni if yeni == bilinen + 1 else bilinen
+
+class JsonPortfolioStore:
+    """Portföyleri DATA_FILE içindeki tek JSON belgesinde tutar."""
+
+    def __init__(self):
+        # Oku-değiştir-yaz döngüsü aynı anda iki thread'de çalışmasın
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        return load_user_data().get(user_id)
+
+    def all(self):
+        return load_user_data()
+
+    def put(self, user_id, veriler):
+        with self._lock:
+            tum_veriler = load_user_data()
+            tum_veriler[user_id] = veriler
+            return save_user_data(tum_veriler)
+
+class SqlitePortfolioStore:
+    """Portföyleri SQLite'ta kullanıcı başına bir satır olarak tutar."""
+
+    def __init__(self, path, json_path=None):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        kolonlar = ", ".join(f"{alan} REAL NOT NULL" for alan in PORTFOY_ALANLARI)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS portfoy (user_id TEXT PRIMARY KEY, {kolonlar}, updated_at REAL NOT NULL)"
+        )
+        degisiklik_tablosu(self._conn)
+        self._veri_surumu = 0
+        if json_path:
+            self._migrate_json(json_path)
+        self._veri_surumu = tablo_surumu(self._conn, "portfoy")
+
+    def _migrate_json(self, json_path):
+        """Eski JSON dosyasını (tablo boşsa) bir kez içeri aktarır."""
+        if not os.path.exists(json_path):
+            return
+        with self._lock:
+            dolu = self._conn.execute("SELECT 1 FROM portfoy LIMIT 1").fetchone()
+            if dolu:
+                return
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    eski = json.load(f)
+                satirlar = [
+                    (user_id, *(float(v[alan]) for alan in PORTFOY_ALANLARI), time.time())
+                    for user_id, v in eski.items()
+                ]
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(self._upsert_sql(), satirlar)
+                tablo_degisti(self._conn, "portfoy", 0)
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                report_error("storage", f"JSON aktarım hatası: {e}")
+                return
+        os.replace(json_path, f"{json_path}.migrated")
+        logger.info(f"📦 {len(satirlar)} portföy JSON'dan SQLite'a aktarıldı.")
+
+    @staticmethod
+    def _upsert_sql():
+        kolonlar = ", ".join(PORTFOY_ALANLARI)
+        yer_tutucular = ", ".join("?" for _ in range(len(PORTFOY_ALANLARI) + 2))
+        guncelle = ", ".join(f"{alan}=excluded.{alan}" for alan in PORTFOY_ALANLARI)
+        return (
+            f"INSERT INTO portfoy (user_id, {kolonlar}, updated_at) VALUES ({yer_tutucular}) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {guncelle}, updated_at=excluded.updated_at"
+        )
+
+    def get(self, user_id):
+        veriler = self._cache.get(user_id)
+        if veriler is not None:
+            return veriler
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(PORTFOY_ALANLARI)} FROM portfoy WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        veriler = dict(zip(PORTFOY_ALANLARI, row))
+        self._cache[user_id] = veriler
+        return veriler
+
+    def yenile(self):
+        """Başka bir replika yazdıysa okuma önbelleğini boşaltır; değişiklik varsa True."""
+        with self._lock:
+            surum = tablo_surumu(self._conn, "portfoy")
+            if surum == self._veri_surumu:
+                return False
+            self._veri_surumu = surum
+            self._cache.clear()
+        return True
+
+    def all(self):
+        """Tüm portföyler; {user_id: veriler}."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT user_id, {', '.join(PORTFOY_ALANLARI)} FROM portfoy"
+            ).fetchall()
+        return {row[0]: dict(zip(PORTFOY_ALANLARI, row[1:])) for row in rows}
+
+    def put(self, user_id, veriler):
+        try:
+            with self._lock:
+                self._conn.execute(
+                    self._upsert_sql(),
+                    (user_id, *(veriler[alan] for alan in PORTFOY_ALANLARI), time.time()),
+                )
+                self._veri_surumu = tablo_degisti(self._conn, "portfoy", self._veri_surumu)
+            self._cache[user_id] = dict(veriler)
+            return True
+        except Exception as e:
+            report_error("storage", f"Portföy kaydetme hatası: {e}")
+            return False
+
+def create_portfolio_store():
+    if STORAGE_BACKEND == "json":
+        return JsonPortfolioStore()
+    return SqlitePortfolioStore(DB_PATH, json_path=DATA_FILE)
+
+PORTFOY = create_portfolio_store()
+
+# ========== ENSTRÜMAN KAYDI ==========
+# Takip edilebilen tüm enstrümanlar enstrumanlar.json'da tanımlıdır: her
+# sembolün hangi sayfadan (kaynak), sayfada hangi seçiciyle okunacağı ve
+# mesajlarda nasıl gösterileceği. "varsayilan" olanlar /au, /para gibi
+# komutlarda görünür, diğerleri /ekle ile izleme listesine alınabilir.
+INSTRUMENTS_FILE = os.getenv(
+    "INSTRUMENTS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "enstrumanlar.json")
+)
+
+class Enstruman(NamedTuple):
+    sembol: str
+    kaynak: str
+    anahtar: str      # ayrıştırılmış veride kullanılan ad/kod
+    secici: str       # sayfadaki data-socket-key, data-container ya da satır metni
+    ad: str           # /grafik, /alarm, /liste ve inline'da görünen ad
+    etiket: str       # fiyat mesajlarındaki kısa ad
+    emoji: str
+    varsayilan: bool
+    coingecko: str    # yedek sağlayıcı id'si (yalnızca kripto)
+
+class InstrumentRegistry:
+    """enstrumanlar.json'daki kaynak ve enstrüman tanımları."""
+
+    def __init__(self, path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        self.kaynaklar = config["kaynaklar"]
+        self.enstrumanlar = {}
+        for kayit in config["enstrumanlar"]:
+            if kayit["kaynak"] not in self.kaynaklar:
+                raise ValueError(f"{kayit['sembol']}: bilinmeyen kaynak {kayit['kaynak']}")
+            anahtar = kayit["anahtar"]
+            self.enstrumanlar[kayit["sembol"]] = Enstruman(
+                sembol=kayit["sembol"],
+                kaynak=kayit["kaynak"],
+                anahtar=anahtar,
+                secici=kayit.get("secici", anahtar),
+                ad=kayit.get("ad", anahtar),
+                etiket=kayit.get("etiket", anahtar),
+                emoji=kayit.get("emoji", ""),
+                varsayilan=kayit.get("varsayilan", False),
+                coingecko=kayit.get("coingecko", ""),
+            )
+        # (kaynak, anahtar) -> Enstruman
+        self.anahtarlar = {(e.kaynak, e.anahtar): e for e in self.enstrumanlar.values()}
+
+    def kaynak_enstrumanlari(self, kaynak, yalniz_varsayilan=False):
+        """Kaynağın enstrümanları, dosyadaki sırayla."""
+        return [
+            e for e in self.enstrumanlar.values()
+            if e.kaynak == kaynak and (e.varsayilan or not yalniz_varsayilan)
+        ]
+
+    def secici_haritasi(self, kaynak):
+        """Ayrıştırıcıların aradığı {seçici: anahtar} eşlemesi (kayıtlı tüm enstrümanlar)."""
+        return {e.secici: e.anahtar for e in self.kaynak_enstrumanlari(kaynak)}
+
+    def bicim(self, kaynak):
+        return self.kaynaklar[kaynak]["bicim"]
+
+try:
+    REGISTRY = InstrumentRegistry(INSTRUMENTS_FILE)
+except (OSError, ValueError, KeyError) as e:
+    logger.error(f"❌ Enstrüman kaydı okunamadı ({INSTRUMENTS_FILE}): {e}")
+    sys.exit(1)
+
+# Sayfa başına ayrıştırılacak seçiciler: komutlarda gösterilmeyenler de
+# okunur ki izleme listeleri ve alarmlar aynı snapshot'tan beslensin
+SECICILER = {kaynak: REGISTRY.secici_haritasi(kaynak) for kaynak in REGISTRY.kaynaklar}
+
+def varsayilan_anahtarlar(kaynak):
+    return [e.anahtar for e in REGISTRY.kaynak_enstrumanlari(kaynak, yalniz_varsayilan=True)]
+
+KAYNAKLAR = {e.anahtar: e.emoji for e in REGISTRY.kaynak_enstrumanlari("gram", yalniz_varsayilan=True)}
 
 # Varsayılan miktar (gram)
 DEFAULT_MIKTAR = 65.0
@@ -114,333 +653,2159 @@ def parse_price(text):
     except:
         return None
 
+# ========== HTML ÇIKARIM MOTORU ==========
+# Sayfa tek geçişte dolaşılır; fiyat hücreleri data-socket-key/data-socket-attr,
+# data-container ve tablo satırı bazında indekslenir. Her sembol için ayrı
+# soup.find() taraması yapılmadığından sembol sayısı arttıkça maliyet artmaz.
+# lxml kuruluysa otomatik kullanılır, HTML_PARSER ile değiştirilebilir.
+# Kurulu olup olmadığına import etmeden bakılır; bs4/lxml ilk ayrıştırmada yüklenir
+_VARSAYILAN_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+HTML_PARSER = os.getenv("HTML_PARSER", _VARSAYILAN_PARSER)
+
+# SoupStrainer ile sayfanın yalnızca ilgili etiketleri ağaca dönüştürülür
+HTML_STRAINER = os.getenv("HTML_STRAINER", "1") == "1"
+
+STRAINER_TANIMLARI = {
+    "socket": {"attrs": {"data-socket-key": True}},
+    "container": {"attrs": {"data-container": True}},
+    "rows": {"name": "tr"},
+}
+
+@functools.lru_cache(maxsize=None)
+def strainer(ad):
+    from bs4 import SoupStrainer
+    return SoupStrainer(**STRAINER_TANIMLARI[ad])
+
+# Sınıf adına göre de indekslenecek etiketler (ör. kripto satırlarındaki kod kutusu)
+INDEXED_CLASSES = {"currency-details"}
+
+# Kaynak adı -> doviz.com sayfası
+SAYFALAR = {kaynak: ayar["sayfa"] for kaynak, ayar in REGISTRY.kaynaklar.items()}
+
+class PageIndex:
+    """Bir HTML sayfasını tek geçişte dolaşıp fiyat etiketlerini indeksler."""
+
+    def __init__(self, html, strainer_adi=None):
+        from bs4 import BeautifulSoup
+        parse_only = strainer(strainer_adi) if strainer_adi and HTML_STRAINER else None
+        with phase("parse"):
+            soup = BeautifulSoup(html, HTML_PARSER, parse_only=parse_only)
+        with phase("extract"):
+            self._build(soup)
+
+    def _build(self, soup):
+        self.socket = {}      # (etiket, data-socket-key, data-socket-attr) -> Tag
+        self.container = {}   # (etiket, data-container) -> Tag
+        self.rows = []        # <tr> etiketleri, sayfa sırasıyla
+        self.classes = {}     # INDEXED_CLASSES sınıfı -> [Tag]
+        
+        for tag in soup.find_all(True):
+            attrs = tag.attrs
+            for cls in attrs.get("class", ()):
+                if cls in INDEXED_CLASSES:
+                    self.classes.setdefault(cls, []).append(tag)
+            key = attrs.get("data-socket-key")
+            if key is not None:
+                # soup.find() gibi ilk eşleşme geçerli olsun
+                self.socket.setdefault((tag.name, key, attrs.get("data-socket-attr")), tag)
+            container = attrs.get("data-container")
+            if container is not None:
+                self.container.setdefault((tag.name, container), tag)
+            if tag.name == "tr":
+                self.rows.append(tag)
+
+    def socket_text(self, key, attr, name="td"):
+        tag = self.socket.get((name, key, attr))
+        return tag.get_text(strip=True) if tag is not None else None
+
+    def find_container(self, key, name="li"):
+        return self.container.get((name, key))
+
+    def by_class(self, cls):
+        return self.classes.get(cls, [])
+
+# ========== HTTP OTURUMLARI (KEEP-ALIVE + KOŞULLU İSTEK) ==========
+# Her host için bağlantı havuzlu tek bir requests.Session kullanılır; her
+# çekimde yeniden TCP+TLS el sıkışması yapılmaz. Sıkıştırılmış yanıt istenir
+# (brotli paketi kuruluysa br de). ETag/Last-Modified saklanır ve koşullu
+# istek gönderilir; 304 gelirse sayfa hiç ayrıştırılmadan son sonuç kullanılır.
+ACCEPT_ENCODING = "gzip, deflate, br" if importlib.util.find_spec("brotli") else "gzip, deflate"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept-Encoding": ACCEPT_ENCODING,
+}
+
+HTTP_TIMEOUT = 10
+
+_SESSIONS = {}
+_SESSION_LOCK = threading.Lock()
+
+# URL -> {"etag", "last_modified", "result"}
+_PAGE_STATE = {}
+
+def get_session(url):
+    """URL'nin host'una ait paylaşılan oturumu döndürür (yoksa oluşturur)."""
+    host = urlsplit(url).netloc
+    session = _SESSIONS.get(host)
+    if session is None:
+        with _SESSION_LOCK:
+            session = _SESSIONS.get(host)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SCRAPE_WORKERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSIONS[host] = session
+    return session
+
+def fetch_page(url, parser):
+    """
+    Sayfayı koşullu istekle indirir ve parser ile ayrıştırır.
+    Sunucu 304 dönerse önceki ayrıştırma sonucu aynen döndürülür.
+    """
+    state = _PAGE_STATE.get(url)
+    headers = {}
+    if state:
+        if state["etag"]:
+            headers["If-None-Match"] = state["etag"]
+        if state["last_modified"]:
+            headers["If-Modified-Since"] = state["last_modified"]
+    
+    parcalar = urlsplit(url)
+    baslangic = time.perf_counter()
+    try:
+        response = get_session(url).get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    finally:
+        SCRAPE_DURATION.observe(time.perf_counter() - baslangic, parcalar.netloc)
+    if response.status_code == 304 and state:
+        return state["result"]
+    response.raise_for_status()
+    
+    baslangic = time.perf_counter()
+    result = parser(response.text)
+    PARSE_DURATION.observe(time.perf_counter() - baslangic, parcalar.netloc + parcalar.path)
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if result and (etag or last_modified):
+        _PAGE_STATE[url] = {"etag": etag, "last_modified": last_modified, "result": result}
+    else:
+        _PAGE_STATE.pop(url, None)
+    return result
+
+def fiyat_kaydi(alis, satis):
+    """Alış/satış fiyatından makas bilgisiyle birlikte kayıt üretir."""
+    makas_tl = satis - alis
+    makas_yuzde = (makas_tl / alis) * 100
+    return {
+        "alis": alis,
+        "satis": satis,
+        "makas_tl": makas_tl,
+        "makas_yuzde": makas_yuzde
+    }
+
+# Uzun adlar önce denensin (ör. "Ziraat Bankası" ile olası "Ziraat")
+_KAYNAK_DESENI = re.compile("|".join(re.escape(k) for k in sorted(SECICILER["gram"], key=len, reverse=True)))
+
+def parse_gold_page(html):
+    """Gram altın sayfasından kayıtlı kaynakların satırlarını ayrıştırır."""
+    index = PageIndex(html, "rows")
+    results = {}
+    
+    for row in index.rows:
+        # Satır metni tek kez taranır, tüm kaynak adları tek desende
+        eslesme = _KAYNAK_DESENI.search(row.get_text())
+        if not eslesme:
+            continue
+        cells = row.find_all("td")
+        if len(cells) >= 4:
+            alis = parse_price(cells[1].get_text())
+            satis = parse_price(cells[2].get_text())
+            
+            if alis and satis:
+                results[SECICILER["gram"][eslesme.group(0)]] = fiyat_kaydi(alis, satis)
+    
+    return results
+
 def get_gold_data():
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        response = requests.get("https://altin.doviz.com/gram-altin", headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        results = {}
-        rows = soup.find_all("tr")
-        
-        for row in rows:
-            row_text = row.get_text()
-            for kaynak in KAYNAKLAR.keys():
-                if kaynak in row_text:
-                    cells = row.find_all("td")
-                    if len(cells) >= 4:
-                        alis = parse_price(cells[1].get_text())
-                        satis = parse_price(cells[2].get_text())
-                        
-                        if alis and satis:
-                            makas_tl = satis - alis
-                            makas_yuzde = (makas_tl / alis) * 100
-                            
-                            results[kaynak] = {
-                                "alis": alis,
-                                "satis": satis,
-                                "makas_tl": makas_tl,
-                                "makas_yuzde": makas_yuzde
-                            }
-                    break
-        
-        return results
+        return fetch_page(SAYFALAR["gram"], parse_gold_page)
     except Exception as e:
-        print(f"Scraping hatası: {e}")
+        report_error("scrape", f"Scraping hatası: {e}")
         return {}
 
+def gram_bloklari(data):
+    """Gram altın kaynaklarının mesaj bloklarını KAYNAKLAR sırasıyla üretir."""
+    for kaynak, emoji in KAYNAKLAR.items():
+        info = data.get(kaynak)
+        if info is not None:
+            yield (
+                f"\n{emoji} {kaynak}\n"
+                f"Alış: {info['alis']:.2f} TL\n"
+                f"Satış: {info['satis']:.2f} TL\n"
+                f"Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:.2f} TL\n"
+            )
+
 def format_message(data):
     if not data:
         return "❌ Veri alınamadı."
     
-    message = "📊 Gram Altın Karşılaştırması\n"
-    
-    for kaynak in KAYNAKLAR.keys():
-        if kaynak in data:
-            info = data[kaynak]
-            emoji = KAYNAKLAR[kaynak]
-            message += f"\n{emoji} {kaynak}\n"
-            message += f"Alış: {info['alis']:.2f} TL\n"
-            message += f"Satış: {info['satis']:.2f} TL\n"
-            message += f"Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:.2f} TL\n"
-    
-    return message
+    return "".join(["📊 Gram Altın Karşılaştırması\n", *gram_bloklari(data)])
 
-# Altın türleri için socket key eşleştirmeleri
+# Komutlarda gösterilen altın türleri ve socket key'leri
 ALTIN_TURLERI = {
-    "Gram Has Altın": "gram-has-altin",
-    "Çeyrek Altın": "ceyrek-altin",
-    "Yarım Altın": "yarim-altin",
-    "Ata Altın": "ata-altin",
+    e.anahtar: e.secici for e in REGISTRY.kaynak_enstrumanlari("altin_turleri", yalniz_varsayilan=True)
 }
 
+def parse_altin_turleri_page(html):
+    """Altın ana sayfasından kayıtlı altın türlerinin fiyatlarını ayrıştırır."""
+    index = PageIndex(html, "socket")
+    results = {}
+    
+    for socket_key, isim in SECICILER["altin_turleri"].items():
+        try:
+            # data-socket-key ve data-socket-attr indeksinden fiyatları al
+            alis_text = index.socket_text(socket_key, "bid")
+            satis_text = index.socket_text(socket_key, "ask")
+            
+            if alis_text and satis_text:
+                alis = parse_price(alis_text)
+                satis = parse_price(satis_text)
+                
+                if alis and satis:
+                    results[isim] = fiyat_kaydi(alis, satis)
+        except Exception as e:
+            report_error("parse", f"{isim} parse hatası: {e}")
+            continue
+    
+    return results
+
 def get_altin_turleri_data():
     """altin.doviz.com'dan Ata, Yarım, Çeyrek ve Gram Has Altın fiyatlarını çeker."""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        response = requests.get("https://altin.doviz.com/", headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        results = {}
-        
-        for isim, socket_key in ALTIN_TURLERI.items():
-            try:
-                # data-socket-key ve data-socket-attr ile fiyatları bul
-                alis_elem = soup.find("td", {"data-socket-key": socket_key, "data-socket-attr": "bid"})
-                satis_elem = soup.find("td", {"data-socket-key": socket_key, "data-socket-attr": "ask"})
-                
-                if alis_elem and satis_elem:
-                    alis = parse_price(alis_elem.get_text(strip=True))
-                    satis = parse_price(satis_elem.get_text(strip=True))
-                    
-                    if alis and satis:
-                        makas_tl = satis - alis
-                        makas_yuzde = (makas_tl / alis) * 100
-                        
-                        results[isim] = {
-                            "alis": alis,
-                            "satis": satis,
-                            "makas_tl": makas_tl,
-                            "makas_yuzde": makas_yuzde
-                        }
-            except Exception as e:
-                print(f"{isim} parse hatası: {e}")
-                continue
-        
-        return results
+        return fetch_page(SAYFALAR["altin_turleri"], parse_altin_turleri_page)
     except Exception as e:
-        print(f"Altın türleri scraping hatası: {e}")
+        report_error("scrape", f"Altın türleri scraping hatası: {e}")
         return {}
 
+def altin_turu_bloklari(data, isaret="•"):
+    """Altın türlerinin mesaj bloklarını ALTIN_TURLERI sırasıyla üretir."""
+    for isim in ALTIN_TURLERI:
+        info = data.get(isim)
+        if info is not None:
+            yield (
+                f"\n{isaret} {isim}\n"
+                f"  Alış: {info['alis']:,.2f} TL\n"
+                f"  Satış: {info['satis']:,.2f} TL\n"
+                f"  Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:,.2f} TL\n"
+            )
+
 def format_altin_turleri_message(data):
     if not data:
         return "❌ Altın türleri verisi alınamadı."
     
-    message = "🪙 Altın Fiyatları (doviz.com)\n"
-    
-    for isim in ALTIN_TURLERI.keys():
-        if isim in data:
-            info = data[isim]
-            message += f"\n• {isim}\n"
-            message += f"  Alış: {info['alis']:,.2f} TL\n"
-            message += f"  Satış: {info['satis']:,.2f} TL\n"
-            message += f"  Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:,.2f} TL\n"
+    return "".join(["🪙 Altın Fiyatları (doviz.com)\n", *altin_turu_bloklari(data)])
+
+def format_au_message(gram_data, tur_data):
+    """/au ve /all için gram altın kaynakları ile altın türlerini tek mesajda birleştirir."""
+    if not gram_data and not tur_data:
+        return "❌ Altın verisi alınamadı."
     
-    return message
+    return "".join([
+        "📊 Altın Fiyatları\n",
+        *gram_bloklari(gram_data),
+        *altin_turu_bloklari(tur_data, isaret=""),
+    ])
 
 # ========== PARA BİRİMLERİ (USD/EUR) ==========
 PARA_BIRIMLERI = {
-    "USD": "🇺🇸",
-    "EUR": "🇪🇺",
+    e.anahtar: e.emoji for e in REGISTRY.kaynak_enstrumanlari("para", yalniz_varsayilan=True)
 }
 
+def parse_para_page(html):
+    """Kur sayfasından kayıtlı döviz kodlarının alış/satış fiyatlarını ayrıştırır."""
+    index = PageIndex(html, "socket")
+    results = {}
+    
+    for socket_key, kod in SECICILER["para"].items():
+        try:
+            alis_text = index.socket_text(socket_key, "bid")
+            satis_text = index.socket_text(socket_key, "ask")
+            
+            if alis_text and satis_text:
+                alis = parse_price(alis_text)
+                satis = parse_price(satis_text)
+                
+                if alis and satis:
+                    results[kod] = {"alis": alis, "satis": satis}
+        except Exception as e:
+            report_error("parse", f"{kod} parse hatası: {e}")
+            continue
+    
+    return results
+
 def get_para_data():
     """kur.doviz.com'dan USD ve EUR fiyatlarını çeker."""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        response = requests.get("https://kur.doviz.com/", headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        results = {}
-        
-        for kod in PARA_BIRIMLERI.keys():
-            try:
-                alis_elem = soup.find("td", {"data-socket-key": kod, "data-socket-attr": "bid"})
-                satis_elem = soup.find("td", {"data-socket-key": kod, "data-socket-attr": "ask"})
-                
-                if alis_elem and satis_elem:
-                    alis = parse_price(alis_elem.get_text(strip=True))
-                    satis = parse_price(satis_elem.get_text(strip=True))
-                    
-                    if alis and satis:
-                        results[kod] = {"alis": alis, "satis": satis}
-            except Exception as e:
-                print(f"{kod} parse hatası: {e}")
-                continue
-        
-        return results
+        return fetch_page(SAYFALAR["para"], parse_para_page)
     except Exception as e:
-        print(f"Para birimi scraping hatası: {e}")
+        report_error("scrape", f"Para birimi scraping hatası: {e}")
         return {}
 
 def format_para_message(data):
     if not data:
         return "❌ Döviz verisi alınamadı."
     
-    message = "💱 Döviz Kurları\n"
+    parcalar = ["💱 Döviz Kurları\n"]
     
-    for kod in PARA_BIRIMLERI.keys():
-        if kod in data:
-            info = data[kod]
-            emoji = PARA_BIRIMLERI[kod]
-            message += f"\n{emoji} {kod}\n"
-            message += f"  Alış: {info['alis']:.4f} TL\n"
-            message += f"  Satış: {info['satis']:.4f} TL\n"
+    for kod, emoji in PARA_BIRIMLERI.items():
+        info = data.get(kod)
+        if info is not None:
+            parcalar.append(
+                f"\n{emoji} {kod}\n"
+                f"  Alış: {info['alis']:.4f} TL\n"
+                f"  Satış: {info['satis']:.4f} TL\n"
+            )
     
-    return message
+    return "".join(parcalar)
 
 # ========== BORSA (BIST100/BIST30) ==========
+BORSA_ENDEKSLERI = varsayilan_anahtarlar("borsa")
+
+def parse_borsa_page(html):
+    """Borsa sayfasından kayıtlı endekslerin değişimlerini ayrıştırır."""
+    index = PageIndex(html, "container")
+    results = {}
+    
+    for container, kod in SECICILER["borsa"].items():
+        try:
+            li_elem = index.find_container(container)
+            if li_elem:
+                change_elem = li_elem.find("span", class_="change")
+                if change_elem:
+                    degisim = change_elem.get_text(strip=True)
+                    results[kod] = {"degisim": degisim}
+        except Exception as e:
+            report_error("parse", f"{kod} parse hatası: {e}")
+            continue
+    
+    return results
+
 def get_borsa_data():
     """borsa.doviz.com'dan BIST100 ve BIST30 verilerini çeker."""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        response = requests.get("https://borsa.doviz.com/", headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        results = {}
-        
-        for kod in ["XU100", "XU030"]:
-            try:
-                li_elem = soup.find("li", {"data-container": kod})
-                if li_elem:
-                    change_elem = li_elem.find("span", class_="change")
-                    if change_elem:
-                        degisim = change_elem.get_text(strip=True)
-                        results[kod] = {"degisim": degisim}
-            except Exception as e:
-                print(f"{kod} parse hatası: {e}")
-                continue
-        
-        return results
+        return fetch_page(SAYFALAR["borsa"], parse_borsa_page)
     except Exception as e:
-        print(f"Borsa scraping hatası: {e}")
+        report_error("scrape", f"Borsa scraping hatası: {e}")
         return {}
 
 def format_borsa_message(data):
     if not data:
         return "❌ Borsa verisi alınamadı."
     
-    message = "📈 Borsa İstanbul\n"
+    parcalar = ["📈 Borsa İstanbul\n"]
     
-    isimler = {"XU100": "BIST 100", "XU030": "BIST 30"}
-    
-    for kod in ["XU100", "XU030"]:
-        if kod in data:
-            info = data[kod]
-            isim = isimler.get(kod, kod)
+    for kod in BORSA_ENDEKSLERI:
+        info = data.get(kod)
+        if info is not None:
+            isim = REGISTRY.anahtarlar[("borsa", kod)].etiket
             emoji = "🟢" if "+" in info["degisim"] or info["degisim"].startswith("%") and "-" not in info["degisim"] else "🔴"
-            message += f"\n{emoji} {isim}: {info['degisim']}\n"
+            parcalar.append(f"\n{emoji} {isim}: {info['degisim']}\n")
     
-    return message
+    return "".join(parcalar)
 
 # ========== KRİPTO (BTC/ETH) ==========
-KRIPTO_LISTESI = ["BTC", "ETH"]
+KRIPTO_LISTESI = varsayilan_anahtarlar("kripto")
+
+def parse_kripto_page(html):
+    """Kripto sayfasından kayıtlı kripto paraların satırlarını ayrıştırır."""
+    index = PageIndex(html, "rows")
+    aranan = SECICILER["kripto"]
+    results = {}
+    
+    # Her kripto satırında kodu taşıyan "currency-details" kutusu indekslidir
+    for details in index.by_class("currency-details"):
+        try:
+            row = details.find_parent("tr")
+            if row is None or not row.find("a"):
+                continue
+                
+            kod_div = details.find("div")
+            if not kod_div:
+                continue
+                
+            kod = kod_div.get_text(strip=True)
+            
+            if kod in aranan:
+                cells = row.find_all("td")
+                if len(cells) >= 6:
+                    # İkinci td: USD fiyat (örn: $87.342)
+                    fiyat_usd = cells[1].get_text(strip=True)
+                    # Altıncı td: Değişim (örn: %-0,80)
+                    degisim = cells[5].get_text(strip=True)
+                    
+                    results[aranan[kod]] = {
+                        "fiyat_usd": fiyat_usd,
+                        "degisim": degisim
+                    }
+        except Exception as e:
+            report_error("parse", f"Kripto satır parse hatası: {e}")
+            continue
+    
+    return results
 
 def get_kripto_data():
     """doviz.com/kripto-paralar'dan BTC ve ETH verilerini çeker."""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        response = requests.get("https://www.doviz.com/kripto-paralar", headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        results = {}
-        rows = soup.find_all("tr")
-        
-        for row in rows:
-            try:
-                link = row.find("a")
-                if not link:
-                    continue
-                    
-                details = row.find("div", class_="currency-details")
-                if not details:
-                    continue
-                    
-                kod_div = details.find("div")
-                if not kod_div:
-                    continue
-                    
-                kod = kod_div.get_text(strip=True)
-                
-                if kod in KRIPTO_LISTESI:
-                    cells = row.find_all("td")
-                    if len(cells) >= 6:
-                        # İkinci td: USD fiyat (örn: $87.342)
-                        fiyat_usd = cells[1].get_text(strip=True)
-                        # Altıncı td: Değişim (örn: %-0,80)
-                        degisim = cells[5].get_text(strip=True)
-                        
-                        results[kod] = {
-                            "fiyat_usd": fiyat_usd,
-                            "degisim": degisim
-                        }
-            except Exception as e:
-                print(f"Kripto satır parse hatası: {e}")
-                continue
-        
-        return results
+        return fetch_page(SAYFALAR["kripto"], parse_kripto_page)
     except Exception as e:
-        print(f"Kripto scraping hatası: {e}")
+        report_error("scrape", f"Kripto scraping hatası: {e}")
         return {}
 
 def format_kripto_message(data):
     if not data:
         return "❌ Kripto verisi alınamadı."
     
-    message = "₿ Kripto Paralar\n"
-    
-    emojiler = {"BTC": "🟠", "ETH": "🔷"}
+    parcalar = ["₿ Kripto Paralar\n"]
     
     for kod in KRIPTO_LISTESI:
-        if kod in data:
-            info = data[kod]
-            emoji = emojiler.get(kod, "🪙")
-            message += f"\n{emoji} {kod}\n"
-            message += f"  Fiyat: {info['fiyat_usd']}\n"
-            message += f"  Değişim: {info['degisim']}\n"
+        info = data.get(kod)
+        if info is not None:
+            emoji = REGISTRY.anahtarlar[("kripto", kod)].emoji or "🪙"
+            parcalar.append(
+                f"\n{emoji} {kod}\n"
+                f"  Fiyat: {info['fiyat_usd']}\n"
+                f"  Değişim: {info['degisim']}\n"
+            )
     
-    return message
+    return "".join(parcalar)
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Yardım mesajı gösterir."""
+# ========== ASENKRON ÇEKİM KATMANI ==========
+# requests ve BeautifulSoup senkron çalışır; handler'lar içinde doğrudan
+# çağrılırsa event loop kilitlenir ve diğer kullanıcılar bekler.
+# Scraper'lar sınırlı bir thread havuzunda, dosya işlemleri ise
+# varsayılan executor'da çalıştırılır.
+
+# Kaynak adı -> scraper fonksiyonu
+SCRAPERS = {
+    "gram": get_gold_data,
+    "altin_turleri": get_altin_turleri_data,
+    "para": get_para_data,
+    "borsa": get_borsa_data,
+    "kripto": get_kripto_data,
+}
+
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "4"))
+SCRAPE_EXECUTOR = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix="scrape")
+
+async def run_blocking(func, *args, executor=None):
+    """Senkron bir fonksiyonu event loop'u bloklamadan çalıştırır."""
+    loop = asyncio.get_running_loop()
+    # contextvars (aktif komut izi) thread'e taşınsın
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, func, *args))
+
+# ========== FİYAT SAĞLAYICILARI ==========
+# doviz.com birincil sağlayıcıdır. Altın türleri ve döviz için truncgil,
+# kripto için CoinGecko yedek sağlayıcıdır; sonuçları doviz.com
+# scraper'larıyla aynı biçime ({alis, satis, makas_tl, makas_yuzde} vb.)
+# çevrilir, formatlayıcılar değişmez. Birincil sağlayıcı kendi p95 süresi
+# içinde yanıt vermezse ya da boş dönerse sıradaki sağlayıcı da başlatılır ve
+# ilk geçerli sonuç alınır (hedged request). Yedek sonucu kaynağın varsayılan
+# enstrümanlarının (portföy fiyatları dahil) hepsini içermiyorsa kullanılmaz;
+# eksik veri son iyi snapshot'ın üzerine yazılmaz. Banka gram altın fiyatlarının
+# yedeği yoktur, doviz.com çökünce son iyi veri sunulur.
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+# p95 hesaplanacak kadar örnek yokken beklenecek süre (saniye)
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "3"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_MIN_SAMPLES = 20
+
+TRUNCGIL_URL = os.getenv("TRUNCGIL_URL", "https://finans.truncgil.com/v3/today.json")
+COINGECKO_URL = os.getenv("COINGECKO_URL", "https://api.coingecko.com/api/v3/simple/price")
+
+# Kripto kodu -> CoinGecko id (enstrumanlar.json'daki "coingecko" alanı)
+COINGECKO_IDS = {e.anahtar: e.coingecko for e in REGISTRY.kaynak_enstrumanlari("kripto") if e.coingecko}
+
+FETCH_RESULTS = METRICS.register(Counter(
+    "finbot_fetch_results_total", "Kaynak başına sonucu kullanılan sağlayıcı", ("kaynak", "saglayici")))
+HEDGED_FETCHES = METRICS.register(Counter(
+    "finbot_hedged_fetches_total", "Yedek sağlayıcının başlatılma sayısı", ("kaynak", "neden")))
+INCOMPLETE_FALLBACKS = METRICS.register(Counter(
+    "finbot_fallback_incomplete_total", "Eksik olduğu için kullanılmayan yedek sonuçlar", ("kaynak", "saglayici")))
+
+# Aynı JSON altın ve döviz için kullanılır; eşzamanlı çekimler tek istek yapar
+_TRUNCGIL_LOCK = threading.Lock()
+_TRUNCGIL_STATE = {"zaman": 0.0, "veri": None}
+TRUNCGIL_REUSE = 5
+
+def fetch_json(url, params=None):
+    """JSON API'den veri çeker (paylaşılan oturum, süre metriği)."""
+    baslangic = time.perf_counter()
     try:
-        help_msg = (
-            "🤖 Finans Botu\n\n"
-            "/au - Altın fiyatları\n"
-            "/para - USD/EUR\n"
-            "/borsa - BIST 100/30\n"
-            "/kripto - BTC/ETH\n"
-            "/all - Tüm veriler\n"
-            "/duzenle - Portföy gir\n"
-            "/kasa - Portföy değeri\n\n"
-            "💡Furkan ÖZTÜRK sunar... 🚀"
-        )
-        if update.message is not None:
-            await update.message.reply_text(help_msg)
+        response = get_session(url).get(url, params=params, timeout=HTTP_TIMEOUT)
+    finally:
+        SCRAPE_DURATION.observe(time.perf_counter() - baslangic, urlsplit(url).netloc)
+    response.raise_for_status()
+    return response.json()
+
+def truncgil_today():
+    with _TRUNCGIL_LOCK:
+        if _TRUNCGIL_STATE["veri"] is None or time.time() - _TRUNCGIL_STATE["zaman"] > TRUNCGIL_REUSE:
+            _TRUNCGIL_STATE["veri"] = fetch_json(TRUNCGIL_URL)
+            _TRUNCGIL_STATE["zaman"] = time.time()
+        return _TRUNCGIL_STATE["veri"]
+
+def _sayi(deger):
+    """API değerini sayıya çevirir; metinler Türkçe biçimde gelir (3.035,44)."""
+    if isinstance(deger, (int, float)):
+        return float(deger)
+    return parse_price(str(deger or ""))
+
+def _truncgil_alis_satis(info):
+    """v3 yanıtı Buying/Selling, eski sürüm Alış/Satış anahtarlarını kullanır."""
+    if not isinstance(info, dict):
+        return None, None
+    return (_sayi(info.get("Buying", info.get("Alış"))),
+            _sayi(info.get("Selling", info.get("Satış"))))
+
+def parse_truncgil_altin_turleri(veri):
+    """truncgil yanıtından altın türleri (anahtarlar doviz.com socket key'leriyle aynı)."""
+    results = {}
+    for key, isim in SECICILER["altin_turleri"].items():
+        alis, satis = _truncgil_alis_satis(veri.get(key))
+        if alis and satis:
+            results[isim] = fiyat_kaydi(alis, satis)
+    return results
+
+def parse_truncgil_para(veri):
+    """truncgil yanıtından döviz kurları."""
+    results = {}
+    for kod in SECICILER["para"].values():
+        alis, satis = _truncgil_alis_satis(veri.get(kod))
+        if alis and satis:
+            results[kod] = {"alis": alis, "satis": satis}
+    return results
+
+def parse_coingecko_kripto(veri):
+    """CoinGecko fiyatlarını doviz.com metin biçimine ($87.342, %-0,80) çevirir."""
+    results = {}
+    for kod, cg_id in COINGECKO_IDS.items():
+        info = veri.get(cg_id) or {}
+        fiyat, degisim = info.get("usd"), info.get("usd_24h_change")
+        if fiyat is None or degisim is None:
+            continue
+        # Küçük fiyatlar ($0,4871) basamak kaybetmesin
+        basamak = 0 if fiyat >= 1000 else 2 if fiyat >= 1 else 4
+        metin = f"{fiyat:,.{basamak}f}".replace(",", "_").replace(".", ",").replace("_", ".")
+        results[kod] = {
+            "fiyat_usd": "$" + metin,
+            "degisim": "%" + f"{degisim:.2f}".replace(".", ","),
+        }
+    return results
+
+def get_truncgil_altin_turleri_data():
+    """Yedek: truncgil altın türleri."""
+    try:
+        return parse_truncgil_altin_turleri(truncgil_today())
     except Exception as e:
-        print(f"Start hatası: {e}")
+        report_error("scrape", f"truncgil altın türleri hatası: {e}")
+        return {}
 
-async def duzenle(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Kullanıcı portföy verilerini kaydeder."""
+def get_truncgil_para_data():
+    """Yedek: truncgil döviz kurları."""
     try:
-        if update.message is None or update.message.from_user is None:
-            return
-        
-        user_id = str(update.message.from_user.id)
-        
-        if not context.args:
-            await update.message.reply_text(
-                "📝 Portföy Düzenleme\n\n"
-                "/duzenle enpara_gr, ziraat_gr, ata, ceyrek, borsa, kripto, diger\n\n"
-                "Örnek: /duzenle 30,35,2,3,50000,1000,25000"
-            )
-            return
-        
+        return parse_truncgil_para(truncgil_today())
+    except Exception as e:
+        report_error("scrape", f"truncgil döviz hatası: {e}")
+        return {}
+
+def get_coingecko_kripto_data():
+    """Yedek: CoinGecko kripto fiyatları."""
+    try:
+        return parse_coingecko_kripto(fetch_json(COINGECKO_URL, params={
+            "ids": ",".join(COINGECKO_IDS.values()), "vs_currencies": "usd", "include_24hr_change": "true",
+        }))
+    except Exception as e:
+        report_error("scrape", f"CoinGecko hatası: {e}")
+        return {}
+
+# ========== DEVRE KESİCİ ==========
+# Host başına art arda BREAKER_THRESHOLD hata ya da boş ayrıştırma olursa devre
+# açılır ve o host'a istek gönderilmez. Bekleme süresi dolunca tek bir deneme
+# isteğine izin verilir (yarı açık); başarılıysa devre kapanır, değilse bekleme
+# süresi ikiye katlanarak (BREAKER_MAX_BACKOFF'a kadar) yeniden açılır.
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_BACKOFF = float(os.getenv("BREAKER_BACKOFF", "30"))
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", "600"))
+
+BREAKER_REJECTS = METRICS.register(Counter(
+    "finbot_breaker_rejected_total", "Açık devre yüzünden gönderilmeyen istekler", ("host",)))
+
+class CircuitBreaker:
+    KAPALI, ACIK, YARI_ACIK = "kapali", "acik", "yari_acik"
+
+    def __init__(self, host):
+        self.host = host
+        self.hatalar = 0
+        self.acilma = 0
+        self.acik_kadar = 0.0
+        self.deneme_suruyor = False
+
+    @property
+    def state(self):
+        if self.acilma == 0:
+            return self.KAPALI
+        return self.ACIK if time.time() < self.acik_kadar else self.YARI_ACIK
+
+    def allow(self):
+        """İstek gönderilebilir mi? Yarı açık devrede aynı anda tek deneme."""
+        durum = self.state
+        if durum == self.KAPALI:
+            return True
+        if durum == self.YARI_ACIK and not self.deneme_suruyor:
+            self.deneme_suruyor = True
+            return True
+        BREAKER_REJECTS.inc(self.host)
+        return False
+
+    def record_success(self):
+        if self.acilma:
+            logger.info(f"🔌 {self.host} devresi kapandı")
+        self.hatalar = 0
+        self.acilma = 0
+        self.deneme_suruyor = False
+
+    def record_failure(self):
+        self.hatalar += 1
+        if self.deneme_suruyor or (self.acilma == 0 and self.hatalar >= BREAKER_THRESHOLD):
+            self.acilma += 1
+            bekleme = min(BREAKER_BACKOFF * 2 ** (self.acilma - 1), BREAKER_MAX_BACKOFF)
+            self.acik_kadar = time.time() + bekleme
+            self.deneme_suruyor = False
+            logger.warning(f"🔌 {self.host} devresi {bekleme:.0f} sn açık ({self.hatalar} ardışık hata)")
+
+_BREAKERS = {}
+
+def get_breaker(host):
+    breaker = _BREAKERS.get(host)
+    if breaker is None:
+        breaker = _BREAKERS[host] = CircuitBreaker(host)
+    return breaker
+
+BREAKER_STATE = METRICS.register(Gauge(
+    "finbot_breaker_open", "Devre durumu (0 kapalı, 1 açık, 0.5 yarı açık)", ("host",),
+    callback=lambda: {(h,): {"kapali": 0, "acik": 1, "yari_acik": 0.5}[b.state] for h, b in _BREAKERS.items()}))
+
+class PriceProvider:
+    """
+    Bir sağlayıcının kaynak başına senkron çekim fonksiyonları.
+    Başarılı çekimlerin süreleri tutulur; p95'i yedek sağlayıcıya geçme
+    eşiği olarak kullanılır. Her çekim, kaynağın URL'sindeki host'un
+    devre kesicisinden geçer.
+    """
+
+    def __init__(self, ad, fetchers, executor, url_of, window=200):
+        self.ad = ad
+        self.fetchers = fetchers
+        self.executor = executor
+        # kaynak -> istek atılan URL (devre kesici host'u için)
+        self.url_of = url_of
+        self._sureler = {kaynak: deque(maxlen=window) for kaynak in fetchers}
+
+    def supports(self, kaynak):
+        return kaynak in self.fetchers
+
+    def breaker(self, kaynak):
+        return get_breaker(urlsplit(self.url_of(kaynak)).netloc)
+
+    async def fetch(self, kaynak):
+        breaker = self.breaker(kaynak)
+        if not breaker.allow():
+            return {}
+        baslangic = time.perf_counter()
+        try:
+            data = await run_blocking(self.fetchers[kaynak], executor=self.executor)
+        except Exception as e:
+            report_error("scrape", f"{self.ad}/{kaynak} çekim hatası: {e}")
+            data = {}
+        if data:
+            breaker.record_success()
+            self._sureler[kaynak].append(time.perf_counter() - baslangic)
+        else:
+            breaker.record_failure()
+        return data
+
+    def hedge_delay(self, kaynak):
+        """Yedek sağlayıcı başlatılmadan önce beklenecek süre: başarılı çekimlerin p95'i."""
+        sureler = sorted(self._sureler[kaynak])
+        if len(sureler) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY
+        p95 = sureler[min(len(sureler) - 1, int(len(sureler) * 0.95))]
+        return min(max(p95, HEDGE_MIN_DELAY), HTTP_TIMEOUT)
+
+# Yedek sağlayıcılar ayrı havuzda çalışır; takılan doviz.com istekleri onları bekletmez
+ALT_EXECUTOR = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix="alt")
+
+# Öncelik sırasına göre sağlayıcılar
+PROVIDERS = [
+    PriceProvider("doviz.com", SCRAPERS, SCRAPE_EXECUTOR, lambda kaynak: SAYFALAR[kaynak]),
+    PriceProvider("truncgil", {
+        "altin_turleri": get_truncgil_altin_turleri_data,
+        "para": get_truncgil_para_data,
+    }, ALT_EXECUTOR, lambda kaynak: TRUNCGIL_URL),
+    PriceProvider("coingecko", {"kripto": get_coingecko_kripto_data}, ALT_EXECUTOR,
+                  lambda kaynak: COINGECKO_URL),
+]
+
+def source_providers(kaynak):
+    """Kaynağı sağlayabilen sağlayıcılar, öncelik sırasıyla."""
+    adaylar = [p for p in PROVIDERS if p.supports(kaynak)]
+    return adaylar if HEDGE_ENABLED else adaylar[:1]
+
+def yedek_yeterli_mi(kaynak, data):
+    """Yedek sonucu kaynağın varsayılan enstrümanlarının hepsini içeriyor mu."""
+    return all(anahtar in data for anahtar in varsayilan_anahtarlar(kaynak))
+
+def source_state(kaynak):
+    """
+    Kaynağın devre durumu: sağlayıcılardan birinin devresi kapalıysa kapalı,
+    hiçbiri kapalı değil ama deneme zamanı gelmişse yarı açık, değilse açık.
+    """
+    durumlar = {p.breaker(kaynak).state for p in source_providers(kaynak)}
+    for durum in (CircuitBreaker.KAPALI, CircuitBreaker.YARI_ACIK):
+        if durum in durumlar:
+            return durum
+    return CircuitBreaker.ACIK
+
+async def fetch_source(kaynak):
+    """
+    Kaynağı sağlayıcı sırasına göre hedged olarak çeker.
+    Çalışan sağlayıcı kendi p95'i içinde sonuç vermezse ya da boş dönerse
+    sıradaki başlatılır; önce gelen geçerli sonuç kullanılır, diğerleri
+    arka planda tamamlanır (süreleri p95 hesabına katılır).
+    """
+    adaylar = source_providers(kaynak)
+    bekleyen = {}
+    baslatilan = 0
+    
+    def baslat():
+        nonlocal baslatilan
+        saglayici = adaylar[baslatilan]
+        bekleyen[asyncio.ensure_future(saglayici.fetch(kaynak))] = saglayici
+        baslatilan += 1
+    
+    baslat()
+    while bekleyen:
+        # Sırada sağlayıcı kaldıkça en son başlatılanın p95'i kadar beklenir
+        kalan = baslatilan < len(adaylar)
+        sure = adaylar[baslatilan - 1].hedge_delay(kaynak) if kalan else None
+        done, _ = await asyncio.wait(bekleyen, timeout=sure, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            saglayici = bekleyen.pop(task)
+            data = task.result()
+            if data and saglayici is not adaylar[0] and not yedek_yeterli_mi(kaynak, data):
+                INCOMPLETE_FALLBACKS.inc(kaynak, saglayici.ad)
+                data = {}
+            if data:
+                FETCH_RESULTS.inc(kaynak, saglayici.ad)
+                return data
+        if kalan and (not done or not bekleyen):
+            HEDGED_FETCHES.inc(kaynak, "bos" if done else "gecikme")
+            baslat()
+    return {}
+
+# ========== FİYAT ÖNBELLEĞİ (SNAPSHOT CACHE) ==========
+# Aynı anda gelen onlarca /au isteği doviz.com'a tek bir istek olarak gider.
+# Her kaynağın TTL süresi (saniye) env ile ayarlanabilir:
+#   CACHE_TTL (varsayılan), CACHE_TTL_GRAM, CACHE_TTL_ALTIN_TURLERI,
+#   CACHE_TTL_PARA, CACHE_TTL_BORSA, CACHE_TTL_KRIPTO
+CACHE_TTL_VARSAYILAN = float(os.getenv("CACHE_TTL", "60"))
+CACHE_TTL = {
+    kaynak: float(os.getenv(f"CACHE_TTL_{kaynak.upper()}", CACHE_TTL_VARSAYILAN))
+    for kaynak in SCRAPERS
+}
+
+# Türkiye saati (UTC+3, yaz saati uygulaması yok)
+TR_TZ = timezone(timedelta(hours=3))
+
+class Snapshot(NamedTuple):
+    """Bir kaynağın belirli bir andaki fiyat verisi."""
+    kaynak: str
+    data: dict
+    version: int
+    fetched_at: float
+
+def freeze(data):
+    """İç içe dict'leri salt okunur MappingProxyType'a çevirir."""
+    if isinstance(data, dict):
+        return MappingProxyType({k: freeze(v) for k, v in data.items()})
+    return data
+
+class SnapshotCache:
+    """
+    Kaynak başına TTL'li fiyat önbelleği.
+    Aynı kaynak için aynı anda yalnızca bir çekim yapılır (single-flight);
+    o sırada gelen diğer istekler aynı çekimin sonucunu bekler.
+    Yayınlanan snapshot'lar salt okunurdur, handler'lar paylaşarak okur.
+    """
+
+    def __init__(self, fetcher, ttls, state=None):
+        self.fetcher = fetcher
+        self.ttls = ttls
+        # kaynak -> devre durumu; açıkken bayat veri beklemeden sunulur
+        self.state = state
+        self._snapshots = {}
+        self._inflight = {}
+        self._version = 0
+        # Arka plan yenileyici bağlıysa geçerlilik süresini o belirler
+        self.refresher = None
+        # Yeni snapshot yayınlandığında çağrılacak async fonksiyonlar
+        self._listeners = []
+        self._listener_tasks = set()
+        # /healthz için kaynak başına son başarısız çekim zamanı
+        self.last_failure = {}
+        # Kaynak başına son kullanıcı talebi (yenileyici yalnızca talep olanları çeker)
+        self.last_access = {}
+
+    def peek(self, kaynak):
+        """Elde bulunan son snapshot'ı (yoksa None) döndürür, çekim yapmaz."""
+        return self._snapshots.get(kaynak)
+
+    def subscribe(self, callback):
+        """callback(snap, onceki_snap) her yeni snapshot'ta arka planda çağrılır."""
+        self._listeners.append(callback)
+
+    def _notify(self, snap, onceki):
+        for callback in self._listeners:
+            task = asyncio.ensure_future(self._run_listener(callback, snap, onceki))
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_tasks.discard)
+
+    @staticmethod
+    async def _run_listener(callback, snap, onceki):
+        try:
+            await callback(snap, onceki)
+        except Exception as e:
+            report_error("background", f"Snapshot dinleyici hatası ({snap.kaynak}): {e}")
+
+    def max_age(self, kaynak):
+        if self.refresher is not None:
+            return self.refresher.max_age(kaynak)
+        return self.ttls.get(kaynak, CACHE_TTL_VARSAYILAN)
+
+    def is_fresh(self, snap):
+        return time.time() - snap.fetched_at < self.max_age(snap.kaynak)
+
+    def yenileniyor(self, kaynak):
+        return kaynak in self._inflight
+
+    def beklemeden_sunulur(self, snap):
+        """Snapshot get() içinde çekim beklenmeden döndürülebilir mi (taze ya da yeterince yeni)."""
+        return snap is not None and time.time() - snap.fetched_at < STALE_MAX_AGE
+
+    async def get(self, kaynak):
+        """
+        Taze snapshot varsa onu döndürür. Bayat ama STALE_MAX_AGE'den genç
+        snapshot beklemeden döndürülür ve yenileme arka planda başlatılır
+        (stale-while-revalidate); yalnızca hiç kullanılabilir veri yoksa tek
+        ortak çekim beklenir. Çekim başarısız olursa son iyi veri kullanılır.
+        """
+        self.touch(kaynak)
+        snap = self._snapshots.get(kaynak)
+        if snap is not None:
+            if self.is_fresh(snap):
+                CACHE_REQUESTS.inc(kaynak, "hit")
+                return snap
+            if self.beklemeden_sunulur(snap):
+                durum = self.state(kaynak) if self.state else CircuitBreaker.KAPALI
+                # Devre açıkken istek zaten gönderilmez; yarı açıkken deneme arka planda
+                if durum != CircuitBreaker.ACIK:
+                    self.revalidate(kaynak)
+                CACHE_REQUESTS.inc(kaynak, "stale")
+                return snap
+        CACHE_REQUESTS.inc(kaynak, "miss")
+        yeni = await self.refresh(kaynak)
+        if not yeni.data and snap is not None and time.time() - snap.fetched_at < STALE_MAX_AGE:
+            return snap
+        return yeni
+
+    def touch(self, kaynak):
+        self.last_access[kaynak] = time.time()
+
+    def dump(self):
+        """Diske yazılacak {kaynak: {data, version, fetched_at}}."""
+        return {
+            kaynak: {"data": snap.data, "version": snap.version, "fetched_at": snap.fetched_at}
+            for kaynak, snap in self._snapshots.items()
+        }
+
+    def restore(self, kayitlar):
+        """
+        dump() çıktısını dinleyicileri tetiklemeden yükler ve yüklenen
+        snapshot'ları döndürür. Sürüm sayacı dosyadaki en büyük sürümden devam
+        eder; kayıtlı hazır mesajlar yeni bir snapshot'a yanlışlıkla eşleşmez.
+        """
+        yuklenen = []
+        for kaynak, kayit in kayitlar.items():
+            self._version = max(self._version, kayit["version"])
+            if kaynak in self._snapshots or time.time() - kayit["fetched_at"] >= STALE_MAX_AGE:
+                continue
+            snap = Snapshot(kaynak, freeze(kayit["data"]), kayit["version"], kayit["fetched_at"])
+            self._snapshots[kaynak] = snap
+            yuklenen.append(snap)
+        return yuklenen
+
+    def revalidate(self, kaynak):
+        """Bekleyen yoksa arka planda yenileme başlatır."""
+        if kaynak not in self._inflight:
+            # Çekim hemen kaydedilir; arada gelen get() bayat veriyi beklemeden döner
+            self._baslat(kaynak)
+
+    def _baslat(self, kaynak):
+        task = self._inflight.get(kaynak)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(kaynak))
+            self._inflight[kaynak] = task
+            task.add_done_callback(lambda _t, k=kaynak: self._inflight.pop(k, None))
+        return task
+
+    async def refresh(self, kaynak):
+        """TTL'e bakmadan kaynağı yeniler; süren bir çekim varsa ona katılır."""
+        task = self._baslat(kaynak)
+        # shield: bekleyenlerden biri iptal edilirse ortak çekim yarıda kalmasın
+        return await asyncio.shield(task)
+
+    async def _refresh(self, kaynak):
+        sonuc = await self.fetcher(kaynak)
+        # Replika modunda fetcher, veriyi çeken kopyanın çekim zamanıyla döndürür
+        data, fetched_at = sonuc if isinstance(sonuc, tuple) else (sonuc, time.time())
+        if not data:
+            # Boş sonuç önbelleğe yazılmaz, bir sonraki istek tekrar dener
+            self.last_failure[kaynak] = time.time()
+            return Snapshot(kaynak, {}, 0, time.time())
+        onceki = self._snapshots.get(kaynak)
+        if onceki is not None and onceki.fetched_at >= fetched_at:
+            # Ortak tablodan aynı veri tekrar okundu; yeni sürüm yayınlanmaz
+            return onceki
+        self._version += 1
+        snap = Snapshot(kaynak, freeze(data), self._version, fetched_at)
+        self._snapshots[kaynak] = snap
+        self._notify(snap, onceki)
+        return snap
+
+# Bayat veri en fazla bu kadar eski olabilir (saniye); sonrası "alınamadı" sayılır
+STALE_MAX_AGE = float(os.getenv("STALE_MAX_AGE", "86400"))
+
+# ========== ÇOKLU REPLİKA (LİDER + ORTAK SNAPSHOT) ==========
+# REPLICA_MODE=1 ile birden fazla kopya, paylaşılan diskteki aynı SQLite
+# dosyası (SHARED_DB_PATH, varsayılan DB_PATH) üzerinden birlikte çalışır:
+# - Çekilen fiyatlar ortak tabloya yayınlanır. Bir kaynağı aynı anda tek
+#   kopya çeker (kaynak başına kira); diğerleri yeni sürümü bekler, böylece
+#   doviz.com'a giden istek sayısı kopya sayısıyla artmaz.
+# - Süreli kira (LEADER_LEASE) ile seçilen tek lider arka plan yenileyiciyi,
+#   zamanlı yayınları, alarm/nisab bildirimlerini ve fiyat geçmişi yazımını
+#   yürütür. Lider düşerse kira dolunca başka bir kopya devralır.
+# - Diğer kopyalar yalnızca komutlara yanıt verir; komut talepleri ortak
+#   tabloya yazılır, lider yalnızca talep edilen kaynakları yeniler.
+# - Kullanıcı verileri zaten SQLite'ta (DB_PATH paylaşılan diskte olmalı);
+#   bellek içi kopyalar yalnızca kullanıcı verisi yazımlarında artan tablo
+#   sayaçlarıyla (degisiklik tablosu) eşitlenir; kira/talep yazımları ve
+#   kopyanın kendi yazımları yeniden yükleme tetiklemez.
+REPLICA_MODE = os.getenv("REPLICA_MODE", "0") == "1"
+SHARED_DB_PATH = os.getenv("SHARED_DB_PATH", DB_PATH)
+REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEADER_LEASE = float(os.getenv("LEADER_LEASE", "15"))
+REPLICA_SYNC_INTERVAL = float(os.getenv("REPLICA_SYNC_INTERVAL", "2"))
+# Başka kopyanın çekimini beklerken ortak tablonun yoklanma aralığı (saniye)
+ORTAK_YOKLAMA = 0.25
+
+class OrtakVeri(NamedTuple):
+    """Ortak tablodan gelen veri; çekim zamanı onu çeken kopyanınkidir."""
+    data: dict
+    fetched_at: float
+
+class SharedSnapshotStore:
+    """Kopyalar arasında paylaşılan snapshot'lar, kiralar ve kaynak talepleri."""
+
+    def __init__(self, path, sahip):
+        self.sahip = sahip
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ortak_snapshot ("
+            "kaynak TEXT PRIMARY KEY, surum INTEGER NOT NULL, fetched_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kira (ad TEXT PRIMARY KEY, sahip TEXT NOT NULL, bitis REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ortak_talep (kaynak TEXT PRIMARY KEY, son REAL NOT NULL)"
+        )
+
+    def oku(self, kaynak):
+        """(sürüm, OrtakVeri) ya da None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT surum, fetched_at, data FROM ortak_snapshot WHERE kaynak = ?", (kaynak,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], OrtakVeri(json.loads(row[2]), row[1])
+
+    def cekim_zamanlari(self):
+        """{kaynak: ortak tablodaki son çekim zamanı}; veri okunmaz."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT kaynak, fetched_at FROM ortak_snapshot"))
+
+    def yayinla(self, kaynak, data, fetched_at):
+        """Veriyi yayınlar; tablodaki veri daha yeniyse dokunmaz."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ortak_snapshot (kaynak, surum, fetched_at, data) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(kaynak) DO UPDATE SET surum = surum + 1, fetched_at = excluded.fetched_at, "
+                "data = excluded.data WHERE excluded.fetched_at > ortak_snapshot.fetched_at",
+                (kaynak, fetched_at, json.dumps(data, ensure_ascii=False)),
+            )
+
+    def kira_al(self, ad, sure):
+        """Kira boştaysa, süresi dolduysa ya da zaten bizdeyse alır/uzatır; alındıysa True."""
+        simdi = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO kira (ad, sahip, bitis) VALUES (?, ?, ?) "
+                "ON CONFLICT(ad) DO UPDATE SET sahip = excluded.sahip, bitis = excluded.bitis "
+                "WHERE kira.bitis < ? OR kira.sahip = excluded.sahip",
+                (ad, self.sahip, simdi + sure, simdi),
+            )
+        return cur.rowcount > 0
+
+    def kira_birak(self, ad):
+        with self._lock:
+            self._conn.execute("DELETE FROM kira WHERE ad = ? AND sahip = ?", (ad, self.sahip))
+
+    def talep_yaz(self, zamanlar):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO ortak_talep (kaynak, son) VALUES (?, ?) "
+                "ON CONFLICT(kaynak) DO UPDATE SET son = max(son, excluded.son)",
+                list(zamanlar.items()),
+            )
+
+    def talepler(self, pencere):
+        """Son pencere saniyede herhangi bir kopyada talep edilen kaynaklar."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kaynak FROM ortak_talep WHERE son > ?", (time.time() - pencere,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+class LeaderElector:
+    """Süreli kira ile tek lider seçimi; kira her eşitleme turunda uzatılır."""
+
+    KIRA = "lider"
+
+    def __init__(self, store, sure):
+        self.store = store
+        self.sure = sure
+        self.lider = False
+        self._son_yenileme = 0.0
+
+    def lider_mi(self):
+        # Kira bu kopyada uzatılamadan dolduysa başka bir kopya lider olmuş olabilir
+        return self.lider and time.monotonic() - self._son_yenileme < self.sure
+
+    async def yenile(self):
+        baslangic = time.monotonic()
+        lider = await run_blocking(self.store.kira_al, self.KIRA, self.sure)
+        if lider:
+            self._son_yenileme = baslangic
+        if lider != self.lider:
+            logger.info(f"👑 {REPLICA_ID}: liderlik {'alındı' if lider else 'başka kopyada'}")
+        self.lider = lider
+
+    async def birak(self):
+        if self.lider:
+            self.lider = False
+            await run_blocking(self.store.kira_birak, self.KIRA)
+
+ORTAK = SharedSnapshotStore(SHARED_DB_PATH, REPLICA_ID) if REPLICA_MODE else None
+LIDER = LeaderElector(ORTAK, LEADER_LEASE) if REPLICA_MODE else None
+# Liderde, tüm kopyaların son DEMAND_WINDOW içindeki talepleri (eşitleyici günceller)
+ORTAK_TALEPLER = set()
+
+METRICS.register(Gauge(
+    "finbot_replica_leader", "Bu kopya lider mi (1/0)", callback=lambda: {(): int(lider_mi())}))
+
+def lider_mi():
+    """Tek kopyada her zaman; replika modunda yalnızca lider kirası bizdeyse True."""
+    return LIDER is None or LIDER.lider_mi()
+
+def ortak_taze_sure(kaynak):
+    # Lider her turda çeker; yarım turdan yeni ortak veri tekrar çekilmez
+    return REFRESHER.interval(kaynak) / 2
+
+async def ortak_kaynak(kaynak):
+    """
+    Replika modunda PRICE_CACHE'in çekim fonksiyonu. Ortak tablodaki veri
+    yeterince yeniyse o kullanılır; değilse kaynak kirasını alan kopya sayfayı
+    çekip yayınlar, kirayı alamayanlar yeni sürümün yayınlanmasını bekler.
+    """
+    kayit = await run_blocking(ORTAK.oku, kaynak)
+    if kayit is not None and time.time() - kayit[1].fetched_at < ortak_taze_sure(kaynak):
+        return kayit[1]
+    
+    kira = f"cekim:{kaynak}"
+    if await run_blocking(ORTAK.kira_al, kira, SOURCE_TIMEOUT + HTTP_TIMEOUT):
+        try:
+            data = await fetch_source(kaynak)
+            if not data:
+                return data
+            veri = OrtakVeri(data, time.time())
+            await run_blocking(ORTAK.yayinla, kaynak, veri.data, veri.fetched_at)
+            return veri
+        finally:
+            await run_blocking(ORTAK.kira_birak, kira)
+    
+    gorulen = kayit[0] if kayit is not None else 0
+    bitis = time.monotonic() + SOURCE_TIMEOUT
+    while time.monotonic() < bitis:
+        await asyncio.sleep(ORTAK_YOKLAMA)
+        yeni = await run_blocking(ORTAK.oku, kaynak)
+        if yeni is not None and yeni[0] > gorulen:
+            return yeni[1]
+    # Çeken kopya yetişemedi; elde ne varsa (bayat olarak) döner
+    return kayit[1] if kayit is not None else {}
+
+async def replika_verilerini_esitle():
+    """
+    Başka kopyaların yazdığı kullanıcı verilerini bellek içi kopyalara
+    yansıtır; yeniden yüklenen store'ların adlarını döndürür.
+    """
+    yuklenen = []
+    for ad, store in (("alarmlar", ALARMLAR), ("izleme", IZLEME), ("aboneler", ABONELER)):
+        if await run_blocking(store.yenile):
+            yuklenen.append(ad)
+    if hasattr(PORTFOY, "yenile") and await run_blocking(PORTFOY.yenile):
+        PORTFOY_DEFTERI.load(await run_blocking(PORTFOY.all))
+        yuklenen.append("portfoy")
+    return yuklenen
+
+async def replika_esitleyici():
+    """Lider kirasını yeniler, talepleri paylaşır, ortak snapshot'ları ve verileri eşitler."""
+    global ORTAK_TALEPLER
+    gonderilen = {}
+    while True:
+        try:
+            await LIDER.yenile()
+            
+            # Bu kopyadaki komut talepleri liderin yenileyicisine iletilir
+            yeni = {k: t for k, t in PRICE_CACHE.last_access.items() if t > gonderilen.get(k, 0)}
+            if yeni:
+                await run_blocking(ORTAK.talep_yaz, yeni)
+                gonderilen.update(yeni)
+            if LIDER.lider_mi():
+                ORTAK_TALEPLER = await run_blocking(ORTAK.talepler, DEMAND_WINDOW)
+            
+            # Başka kopyanın yayınladığı daha yeni veri yerel önbelleğe alınır
+            for kaynak, fetched_at in (await run_blocking(ORTAK.cekim_zamanlari)).items():
+                yerel = PRICE_CACHE.peek(kaynak)
+                if yerel is not None and yerel.fetched_at < fetched_at:
+                    PRICE_CACHE.revalidate(kaynak)
+            
+            await replika_verilerini_esitle()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            report_error("background", f"Replika eşitleme hatası: {e}")
+        await asyncio.sleep(REPLICA_SYNC_INTERVAL)
+
+PRICE_CACHE = SnapshotCache(
+    ortak_kaynak if REPLICA_MODE else fetch_source, CACHE_TTL, state=source_state
+)
+
+# /all ve /kasa gibi çok kaynaklı komutlarda her kaynak için üst süre (saniye)
+SOURCE_TIMEOUT = float(os.getenv("SOURCE_TIMEOUT", "8"))
+
+async def snapshot_bekle(kaynak, timeout=None):
+    """
+    Kaynağın snapshot'ını en fazla timeout saniye bekler. Zaman aşımı veya
+    hata durumunda son iyi veri (yeterince yeniyse) ya da boş snapshot döner.
+    """
+    timeout = SOURCE_TIMEOUT if timeout is None else timeout
+    try:
+        return await asyncio.wait_for(PRICE_CACHE.get(kaynak), timeout)
+    except asyncio.TimeoutError:
+        report_error("timeout", f"{kaynak} zaman aşımı ({timeout:.0f} sn)")
+    except Exception as e:
+        report_error("scrape", f"{kaynak} çekim hatası: {e}")
+    # Son iyi veri varsa bayat olarak onu göster
+    onceki = PRICE_CACHE.peek(kaynak)
+    if onceki is not None and time.time() - onceki.fetched_at < STALE_MAX_AGE:
+        return onceki
+    return Snapshot(kaynak, {}, 0, time.time())
+
+async def get_snapshots(*kaynaklar, timeout=None):
+    """
+    Verilen kaynakları eşzamanlı çeker ve {kaynak: Snapshot} döndürür.
+    Zaman aşımına uğrayan veya hata veren kaynak boş snapshot ile döner,
+    diğerlerini bekletmez.
+    """
+    with phase("fetch"):
+        sonuclar = await asyncio.gather(*(snapshot_bekle(k, timeout) for k in kaynaklar))
+    return dict(zip(kaynaklar, sonuclar))
+
+def format_snapshot_footer(*snaps):
+    """Yanıtın sonuna eklenecek güncelleme zamanı ve sürüm bilgisini üretir."""
+    dolu = [s for s in snaps if s.data]
+    if not dolu:
+        return ""
+    en_eski = min(s.fetched_at for s in dolu)
+    surum = max(s.version for s in dolu)
+    saat = datetime.fromtimestamp(en_eski, TR_TZ).strftime("%H:%M:%S")
+    return f"\n🕒 {saat} · v{surum}"
+
+def bayatlik_notu(*snaps):
+    """Taze olmayan (son iyi veriden sunulan) snapshot varsa "x dk önce" uyarısı üretir."""
+    simdi = time.time()
+    bayat = [s for s in snaps if s.data and not PRICE_CACHE.is_fresh(s)]
+    if not bayat:
+        return ""
+    dakika = int((simdi - min(s.fetched_at for s in bayat)) // 60)
+    zaman = f"{dakika} dk önceki" if dakika else "1 dk'dan yeni"
+    # Bayat veri yenileme sürerken de (stale-while-revalidate) sunulur
+    if all(PRICE_CACHE.yenileniyor(s.kaynak) for s in bayat):
+        return f"\n⏳ {zaman} veri (arka planda güncelleniyor)"
+    return f"\n⏳ {zaman} veri (kaynak şu an güncellenemiyor)"
+
+# ========== HAZIR MESAJ ÖNBELLEĞİ ==========
+# Yanıt metinleri yalnızca fiyatlar değişince değişir. Her mesaj, üretildiği
+# snapshot sürümleriyle birlikte saklanır; sürümler aynı kaldıkça bütün
+# istekler aynı metni alır, yeni snapshot gelince ilk istek yeniden üretir.
+RENDER_REQUESTS = METRICS.register(Counter(
+    "finbot_render_cache_requests_total", "Hazır mesaj önbelleği istekleri", ("mesaj", "sonuc")))
+
+class RenderCache:
+    def __init__(self):
+        # mesaj adı -> (snapshot sürümleri, metin)
+        self._entries = {}
+
+    def render(self, ad, formatter, *snaps):
+        """
+        formatter(*veriler) + alt bilgi metnini snapshot sürümleri değişmedikçe
+        bir kez üretir. Bayatlık uyarısı zamana bağlı olduğundan her seferinde eklenir.
+        """
+        anahtar = tuple(s.version for s in snaps)
+        entry = self._entries.get(ad)
+        if entry is not None and entry[0] == anahtar:
+            RENDER_REQUESTS.inc(ad, "hit")
+            return entry[1] + bayatlik_notu(*snaps)
+        RENDER_REQUESTS.inc(ad, "miss")
+        metin = formatter(*(s.data for s in snaps)) + format_snapshot_footer(*snaps)
+        self._entries[ad] = (anahtar, metin)
+        return metin + bayatlik_notu(*snaps)
+
+    def dump(self):
+        return [[ad, list(anahtar), metin] for ad, (anahtar, metin) in self._entries.items()]
+
+    def restore(self, kayitlar):
+        for ad, anahtar, metin in kayitlar:
+            self._entries.setdefault(ad, (tuple(anahtar), metin))
+
+RENDER_CACHE = RenderCache()
+
+# Tek kaynaklı komutların biçimlendiricileri
+FORMATTERS = {
+    "gram": format_message,
+    "altin_turleri": format_altin_turleri_message,
+    "para": format_para_message,
+    "borsa": format_borsa_message,
+    "kripto": format_kripto_message,
+}
+
+def render_snapshot(snap):
+    """Tek kaynaklı mesajı önbellekten (gerekirse üreterek) döndürür."""
+    return RENDER_CACHE.render(snap.kaynak, FORMATTERS[snap.kaynak], snap)
+
+def render_au(gram_snap, tur_snap):
+    """/au birleşik altın mesajını önbellekten (gerekirse üreterek) döndürür."""
+    return RENDER_CACHE.render("au", format_au_message, gram_snap, tur_snap)
+
+# ========== ENSTRÜMANLAR ==========
+# Her enstrüman kısa bir sembolle (ör. "usd", "ceyrek-altin") anılır.
+# Geçmiş kaydı ve geçmiş sorguları bu sembolleri kullanır.
+_TR_ASCII = str.maketrans("çğıöşüÇĞİÖŞÜ", "cgiosuCGIOSU")
+
+def slugify(text):
+    """Türkçe adı sembole çevirir (Çeyrek Altın -> ceyrek-altin)."""
+    return "-".join(text.translate(_TR_ASCII).lower().split())
+
+def parse_usd(text):
+    """Kripto fiyat metnini ($87.342) sayıya çevirir."""
+    return parse_price(text.replace("$", ""))
+
+def parse_yuzde(text):
+    """Değişim metnini (%-0,80) sayıya çevirir."""
+    return parse_price(text.replace("%", ""))
+
+# sembol -> (kaynak, veri anahtarı, görünen ad); kayıtlı tüm enstrümanlar
+ENSTRUMANLAR = {e.sembol: (e.kaynak, e.anahtar, e.ad) for e in REGISTRY.enstrumanlar.values()}
+
+def find_enstruman(text):
+    """Kullanıcı girdisini sembole çevirir; tam ya da tek anlamlı önek eşleşmesi."""
+    aranan = slugify(text)
+    if aranan in ENSTRUMANLAR:
+        return aranan
+    adaylar = [s for s in ENSTRUMANLAR if s.startswith(aranan)]
+    return adaylar[0] if len(adaylar) == 1 else None
+
+def enstruman_ozeti(kaynak, info):
+    """Tek enstrümanın kısa fiyat özeti (/liste satırları, inline açıklamaları)."""
+    bicim = REGISTRY.bicim(kaynak)
+    if bicim == "endeks":
+        return f"Değişim: {info['degisim']}"
+    if bicim == "kripto":
+        return f"{info['fiyat_usd']} · {info['degisim']}"
+    basamak = 4 if bicim == "kur" else 2
+    return f"Alış: {info['alis']:,.{basamak}f} TL · Satış: {info['satis']:,.{basamak}f} TL"
+
+def enstruman_satiri(sembol, info):
+    """Bir enstrümanın emoji, ad ve fiyat özetinden oluşan mesaj satırı."""
+    kaynak, _anahtar, ad = ENSTRUMANLAR[sembol]
+    emoji = REGISTRY.enstrumanlar[sembol].emoji or "•"
+    return f"{emoji} {ad}\n  {enstruman_ozeti(kaynak, info)}"
+
+def snapshot_degerleri(snap):
+    """Snapshot'taki her enstrüman için (sembol, alış, satış) üretir."""
+    for sembol, (kaynak, anahtar, _ad) in ENSTRUMANLAR.items():
+        if kaynak != snap.kaynak or anahtar not in snap.data:
+            continue
+        info = snap.data[anahtar]
+        if kaynak == "borsa":
+            alis = satis = parse_yuzde(info["degisim"])
+        elif kaynak == "kripto":
+            alis = satis = parse_usd(info["fiyat_usd"])
+        else:
+            alis, satis = info["alis"], info["satis"]
+        if alis is not None and satis is not None:
+            yield sembol, alis, satis
+
+# ========== FİYAT GEÇMİŞİ (ZAMAN SERİSİ) ==========
+# Her sembol için ayrı, yalnızca sona eklenen ikili dosya tutulur:
+#   8 byte başlık (b"FTS1" + kayıt boyu) ve ardından sabit boyutlu kayıtlar
+#   <uint32 unix zamanı, float32 alış, float32 satış> = 12 byte.
+# Kayıtlar zamana göre sıralı olduğundan dosyanın kendisi zaman indeksidir:
+# aralık sorguları mmap üzerinde ikili arama ile yalnızca ilgili dilimi okur.
+# Dakikada bir kayıtla bir sembolün bir aylık geçmişi ~520 KB tutar.
+HISTORY_DIR = os.getenv("HISTORY_DIR", "/tmp/fiyat_gecmisi")
+HISTORY_MIN_INTERVAL = float(os.getenv("HISTORY_MIN_INTERVAL", "60"))
+
+class PriceHistory:
+    """Sembol başına ikili, sona eklemeli fiyat geçmişi."""
+
+    MAGIC = b"FTS1"
+    KAYIT = struct.Struct("<Iff")
+    BASLIK = struct.Struct("<4sHxx")
+
+    def __init__(self, directory, min_interval=HISTORY_MIN_INTERVAL):
+        self.directory = directory
+        self.min_interval = min_interval
+        self._son_kayit = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sembol):
+        return os.path.join(self.directory, f"{sembol}.bin")
+
+    def append(self, sembol, ts, alis, satis):
+        """Kaydı ekler; min_interval'dan sık gelen kayıtlar atlanır."""
+        ts = int(ts)
+        with self._lock:
+            son = self._son_kayit.get(sembol)
+            if son is None:
+                son = self._last_ts(sembol)
+            if son is not None and ts - son < self.min_interval:
+                return False
+            path = self._path(sembol)
+            with open(path, "ab") as f:
+                if f.tell() == 0:
+                    f.write(self.BASLIK.pack(self.MAGIC, self.KAYIT.size))
+                f.write(self.KAYIT.pack(ts, alis, satis))
+            self._son_kayit[sembol] = ts
+        return True
+
+    def _last_ts(self, sembol):
+        path = self._path(sembol)
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < self.BASLIK.size + self.KAYIT.size:
+                    return None
+                f.seek(-self.KAYIT.size, os.SEEK_END)
+                return self.KAYIT.unpack(f.read(self.KAYIT.size))[0]
+        except FileNotFoundError:
+            return None
+
+    def _bisect(self, mm, adet, ts):
+        """ts'den küçük olmayan ilk kaydın sırasını bulur."""
+        lo, hi = 0, adet
+        boyut, baslik = self.KAYIT.size, self.BASLIK.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from("<I", mm, baslik + mid * boyut)[0] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, sembol, baslangic, bitis=None):
+        """[baslangic, bitis] aralığındaki (ts, alış, satış) kayıtlarını döndürür."""
+        bitis = time.time() if bitis is None else bitis
+        try:
+            f = open(self._path(sembol), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            boyut = os.fstat(f.fileno()).st_size
+            adet = (boyut - self.BASLIK.size) // self.KAYIT.size
+            if adet <= 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                ilk = self._bisect(mm, adet, int(baslangic))
+                son = self._bisect(mm, adet, int(bitis) + 1)
+                bas = self.BASLIK.size + ilk * self.KAYIT.size
+                dilim = mm[bas:self.BASLIK.size + son * self.KAYIT.size]
+        return list(self.KAYIT.iter_unpack(dilim))
+
+PRICE_HISTORY = PriceHistory(HISTORY_DIR)
+
+async def record_history(snap, onceki):
+    """Yeni snapshot'taki fiyatları geçmiş dosyalarına ekler."""
+    if not lider_mi():
+        # Replika modunda geçmişi yalnızca lider yazar, diğerleri okur
+        return
+    degerler = list(snapshot_degerleri(snap))
+
+    def yaz():
+        for sembol, alis, satis in degerler:
+            PRICE_HISTORY.append(sembol, snap.fetched_at, alis, satis)
+
+    await run_blocking(yaz)
+
+PRICE_CACHE.subscribe(record_history)
+
+# /grafik periyotları: ad -> saniye
+PERIYOTLAR = {
+    "1s": 3600, "1h": 3600,
+    "24s": 86400, "1g": 86400, "24h": 86400, "1d": 86400,
+    "7g": 7 * 86400, "7d": 7 * 86400,
+    "30g": 30 * 86400, "30d": 30 * 86400,
+}
+PERIYOT_ADLARI = {3600: "son 1 saat", 86400: "son 24 saat", 7 * 86400: "son 7 gün", 30 * 86400: "son 30 gün"}
+
+SPARK = "▁▂▃▄▅▆▇█"
+
+def sparkline(degerler, genislik=24):
+    """Değer dizisini tek satırlık blok grafiğe çevirir."""
+    if not degerler:
+        return ""
+    adim = max(1, len(degerler) // genislik)
+    ornek = [sum(degerler[i:i + adim]) / len(degerler[i:i + adim]) for i in range(0, len(degerler), adim)]
+    en_kucuk, en_buyuk = min(ornek), max(ornek)
+    aralik = en_buyuk - en_kucuk or 1
+    return "".join(SPARK[int((d - en_kucuk) / aralik * (len(SPARK) - 1))] for d in ornek)
+
+def format_sayi(deger):
+    """Büyük değerleri 2, küçük değerleri 4 ondalıkla biçimlendirir."""
+    return f"{deger:,.2f}" if abs(deger) >= 100 else f"{deger:,.4f}"
+
+def format_grafik_message(sembol, sure, kayitlar):
+    _kaynak, _anahtar, ad = ENSTRUMANLAR[sembol]
+    periyot = PERIYOT_ADLARI.get(sure, f"son {sure // 3600} saat")
+    if not kayitlar:
+        return f"❌ {ad} için {periyot} içinde kayıt yok."
+    
+    satislar = [k[2] for k in kayitlar]
+    ilk, son = satislar[0], satislar[-1]
+    degisim = son - ilk
+    yuzde = (degisim / ilk * 100) if ilk else 0
+    emoji = "📈" if degisim >= 0 else "📉"
+    
+    return (
+        f"{emoji} {ad} · {periyot}\n\n"
+        f"Şimdi: {format_sayi(son)}\n"
+        f"Değişim: {'+' if degisim >= 0 else ''}{format_sayi(degisim)} ({yuzde:+.2f}%)\n"
+        f"Min: {format_sayi(min(satislar))} | Maks: {format_sayi(max(satislar))}\n"
+        f"Ort: {format_sayi(sum(satislar) / len(satislar))}\n\n"
+        f"{sparkline(satislar)}\n"
+        f"{len(kayitlar)} kayıt"
+    )
+
+# ========== FİYAT ALARMLARI ==========
+# Alarmlar portföylerle aynı SQLite dosyasında saklanır, bellekte ise
+# (sembol, alan) başına eşiğe göre sıralı listelerde tutulur. Her yeni
+# snapshot'ta yalnızca önceki ve yeni fiyat arasında kalan eşikler ikili
+# arama ile bulunur; binlerce alarm olsa da tüm liste taranmaz.
+# Tetiklenen alarm kullanıcıya bildirilir ve silinir (tek seferlik).
+MAX_ALARM_PER_USER = int(os.getenv("MAX_ALARM_PER_USER", "20"))
+
+ALARM_ALANLARI = {"alis": "alis", "satis": "satis", "fiyat": "satis"}
+ALAN_ADLARI = {"alis": "alış", "satis": "satış"}
+
+class Alarm(NamedTuple):
+    id: int
+    user_id: str
+    chat_id: int
+    sembol: str
+    alan: str
+    yon: str      # ">" veya "<"
+    esik: float
+
+class AlarmIndex:
+    """(sembol, alan) başına yukarı/aşağı eşiklerini sıralı tutan indeks."""
+
+    def __init__(self):
+        # (sembol, alan, yon) -> ([eşikler], [alarm id'leri]) eşiğe göre sıralı
+        self._listeler = {}
+
+    def add(self, alarm):
+        esikler, idler = self._listeler.setdefault((alarm.sembol, alarm.alan, alarm.yon), ([], []))
+        i = bisect.bisect_right(esikler, alarm.esik)
+        esikler.insert(i, alarm.esik)
+        idler.insert(i, alarm.id)
+
+    def remove(self, alarm):
+        liste = self._listeler.get((alarm.sembol, alarm.alan, alarm.yon))
+        if not liste:
+            return
+        esikler, idler = liste
+        i = bisect.bisect_left(esikler, alarm.esik)
+        while i < len(esikler) and esikler[i] == alarm.esik:
+            if idler[i] == alarm.id:
+                del esikler[i], idler[i]
+                return
+            i += 1
+
+    def crossed(self, sembol, alan, onceki, simdi):
+        """Fiyat onceki -> simdi hareket ederken geçilen alarm id'lerini döndürür."""
+        sonuc = []
+        yukari = self._listeler.get((sembol, alan, ">"))
+        if yukari and yukari[0]:
+            esikler, idler = yukari
+            # onceki <= eşik < simdi
+            lo = 0 if onceki is None else bisect.bisect_left(esikler, onceki)
+            hi = bisect.bisect_left(esikler, simdi)
+            sonuc.extend(idler[lo:hi])
+        asagi = self._listeler.get((sembol, alan, "<"))
+        if asagi and asagi[0]:
+            esikler, idler = asagi
+            # simdi < eşik <= onceki
+            lo = bisect.bisect_right(esikler, simdi)
+            hi = len(esikler) if onceki is None else bisect.bisect_right(esikler, onceki)
+            sonuc.extend(idler[lo:hi])
+        return sonuc
+
+class AlarmStore:
+    """Alarmları SQLite'ta saklar ve bellek içi indeksi güncel tutar."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS alarmlar ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, chat_id INTEGER NOT NULL, "
+            "sembol TEXT NOT NULL, alan TEXT NOT NULL, yon TEXT NOT NULL, esik REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS alarmlar_user ON alarmlar (user_id)")
+        degisiklik_tablosu(self._conn)
+        self._veri_surumu = tablo_surumu(self._conn, "alarmlar")
+        self._yukle()
+
+    def _yukle(self):
+        # Yeni kopya hazırlanıp tek seferde değiştirilir; okuyanlar yarım indeks görmez
+        alarms = {}
+        index = AlarmIndex()
+        for row in self._conn.execute(
+            "SELECT id, user_id, chat_id, sembol, alan, yon, esik FROM alarmlar"
+        ):
+            alarm = Alarm(*row)
+            alarms[alarm.id] = alarm
+            index.add(alarm)
+        self.alarms, self.index = alarms, index
+
+    def yenile(self):
+        """Başka bir replika alarm eklediyse/sildiyse bellek içi kopyayı yeniden yükler."""
+        with self._lock:
+            surum = tablo_surumu(self._conn, "alarmlar")
+            if surum == self._veri_surumu:
+                return False
+            self._veri_surumu = surum
+            self._yukle()
+        return True
+
+    def add(self, user_id, chat_id, sembol, alan, yon, esik):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO alarmlar (user_id, chat_id, sembol, alan, yon, esik, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, sembol, alan, yon, esik, time.time()),
+            )
+            self._veri_surumu = tablo_degisti(self._conn, "alarmlar", self._veri_surumu)
+            alarm = Alarm(cur.lastrowid, user_id, chat_id, sembol, alan, yon, esik)
+            self.alarms[alarm.id] = alarm
+            self.index.add(alarm)
+        return alarm
+
+    def remove(self, alarm_id):
+        with self._lock:
+            alarm = self.alarms.pop(alarm_id, None)
+            if alarm is None:
+                return None
+            self._conn.execute("DELETE FROM alarmlar WHERE id = ?", (alarm_id,))
+            self._veri_surumu = tablo_degisti(self._conn, "alarmlar", self._veri_surumu)
+            self.index.remove(alarm)
+        return alarm
+
+    def user_alarms(self, user_id):
+        return sorted((a for a in self.alarms.values() if a.user_id == user_id), key=lambda a: a.id)
+
+ALARMLAR = AlarmStore(DB_PATH)
+
+# Bildirimler için Application başlarken bot nesnesi atanır (on_startup)
+BOT_INSTANCE = None
+
+def son_fiyat(sembol, alan):
+    """Elde bulunan son snapshot'tan enstrümanın alış/satış değerini döndürür."""
+    snap = PRICE_CACHE.peek(ENSTRUMANLAR[sembol][0])
+    if snap is None:
+        return None
+    for s, alis, satis in snapshot_degerleri(snap):
+        if s == sembol:
+            return alis if alan == "alis" else satis
+    return None
+
+def format_alarm(alarm):
+    ad = ENSTRUMANLAR[alarm.sembol][2]
+    return f"#{alarm.id} {ad} {ALAN_ADLARI[alarm.alan]} {alarm.yon} {format_sayi(alarm.esik)}"
+
+async def evaluate_alarms(snap, onceki):
+    """Yeni snapshot'ta eşiği geçilen alarmları bildirir ve siler."""
+    if not ALARMLAR.alarms or not lider_mi():
+        return
+    onceki_degerler = {}
+    if onceki is not None:
+        onceki_degerler = {s: (a, st) for s, a, st in snapshot_degerleri(onceki)}
+    
+    tetiklenen = []
+    for sembol, alis, satis in snapshot_degerleri(snap):
+        eski = onceki_degerler.get(sembol)
+        for alan, simdi, eski_deger in (
+            ("alis", alis, eski[0] if eski else None),
+            ("satis", satis, eski[1] if eski else None),
+        ):
+            for alarm_id in ALARMLAR.index.crossed(sembol, alan, eski_deger, simdi):
+                tetiklenen.append((alarm_id, simdi))
+    
+    for alarm_id, simdi in tetiklenen:
+        alarm = await run_blocking(ALARMLAR.remove, alarm_id)
+        if alarm is None or BOT_INSTANCE is None:
+            continue
+        try:
+            await BOT_INSTANCE.send_message(
+                alarm.chat_id,
+                f"🔔 Alarm: {format_alarm(alarm)}\nŞu an: {format_sayi(simdi)}"
+            )
+        except Exception as e:
+            report_error("telegram", f"Alarm bildirim hatası: {e}")
+
+PRICE_CACHE.subscribe(evaluate_alarms)
+
+# ========== İZLEME LİSTELERİ ==========
+# Kullanıcılar /ekle ile enstrumanlar.json'daki herhangi bir sembolü kendi
+# listelerine ekler. Arka plan yenileyici yalnızca bir izleme listesinin,
+# bir alarmın ya da son DEMAND_WINDOW saniyedeki bir komutun ihtiyaç
+# duyduğu sayfaları çeker; kullanılmayan sembollerin maliyeti olmaz.
+MAX_WATCHLIST = int(os.getenv("MAX_WATCHLIST", "30"))
+DEMAND_WINDOW = float(os.getenv("DEMAND_WINDOW", "1800"))
+
+class WatchlistStore:
+    """İzleme listelerini SQLite'ta saklar; sembol başına izleyen sayısını bellekte tutar."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS izleme ("
+            "user_id TEXT NOT NULL, sembol TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, sembol))"
+        )
+        degisiklik_tablosu(self._conn)
+        self._veri_surumu = tablo_surumu(self._conn, "izleme")
+        self._yukle()
+
+    def _yukle(self):
+        listeler = {}
+        izleyen = {}
+        for user_id, sembol in self._conn.execute(
+            "SELECT user_id, sembol FROM izleme ORDER BY created_at"
+        ):
+            listeler.setdefault(user_id, []).append(sembol)
+            izleyen[sembol] = izleyen.get(sembol, 0) + 1
+        self.listeler, self._izleyen = listeler, izleyen
+
+    def yenile(self):
+        """Başka bir replikanın yaptığı değişiklikleri bellek içi kopyaya yansıtır."""
+        with self._lock:
+            surum = tablo_surumu(self._conn, "izleme")
+            if surum == self._veri_surumu:
+                return False
+            self._veri_surumu = surum
+            self._yukle()
+        return True
+
+    def get(self, user_id):
+        return list(self.listeler.get(user_id, ()))
+
+    def add(self, user_id, sembol):
+        with self._lock:
+            liste = self.listeler.setdefault(user_id, [])
+            if sembol in liste:
+                return False
+            self._conn.execute(
+                "INSERT OR IGNORE INTO izleme (user_id, sembol, created_at) VALUES (?, ?, ?)",
+                (user_id, sembol, time.time()),
+            )
+            self._veri_surumu = tablo_degisti(self._conn, "izleme", self._veri_surumu)
+            liste.append(sembol)
+            self._izleyen[sembol] = self._izleyen.get(sembol, 0) + 1
+        return True
+
+    def remove(self, user_id, sembol):
+        with self._lock:
+            liste = self.listeler.get(user_id, [])
+            if sembol not in liste:
+                return False
+            self._conn.execute("DELETE FROM izleme WHERE user_id = ? AND sembol = ?", (user_id, sembol))
+            self._veri_surumu = tablo_degisti(self._conn, "izleme", self._veri_surumu)
+            liste.remove(sembol)
+            self._izleyen[sembol] -= 1
+            if not self._izleyen[sembol]:
+                del self._izleyen[sembol]
+        return True
+
+    def semboller(self):
+        """En az bir listede bulunan semboller."""
+        return set(self._izleyen)
+
+IZLEME = WatchlistStore(DB_PATH)
+
+def talep_edilen_kaynaklar():
+    """İzleme listeleri, alarmlar ve son komutlar tarafından ihtiyaç duyulan kaynaklar."""
+    semboller = IZLEME.semboller() | {a.sembol for a in list(ALARMLAR.alarms.values())}
+    kaynaklar = {ENSTRUMANLAR[s][0] for s in semboller if s in ENSTRUMANLAR}
+    simdi = time.time()
+    kaynaklar.update(k for k, t in PRICE_CACHE.last_access.items() if simdi - t < DEMAND_WINDOW)
+    # Replika modunda diğer kopyalardaki komut talepleri de sayılır
+    kaynaklar.update(ORTAK_TALEPLER)
+    if NISAB_BILDIRIM and len(PORTFOY_DEFTERI):
+        # Nisab bildirimleri için değerleme kaynakları güncel tutulur
+        kaynaklar.update(DEGERLEME_KAYNAKLARI)
+    return kaynaklar
+
+# ========== TOPLU PORTFÖY DEĞERLEME ==========
+# Tüm portföyler alan başına tek bir float dizisinde (kolon düzeninde)
+# tutulur. Gram, altın türleri veya para snapshot'ı değiştiğinde bütün
+# kullanıcılar fiyat vektörüyle tek geçişte yeniden değerlenir; /kasa yalnızca
+# hazır satırı okur. numpy kuruluysa kolonlar kopyalanmadan numpy ile
+# çarpılır, değilse aynı geçiş saf Python ile yapılır. Nisab eşiğini aşan ya
+# da altına düşen kullanıcılara (NISAB_BILDIRIM=1 ise) bildirim gönderilir.
+NUMPY_VAR = importlib.util.find_spec("numpy") is not None
+_NUMPY = None
+
+def numpy_modulu():
+    """numpy kuruluysa ilk değerlemede yüklenir; yoksa None."""
+    global _NUMPY
+    if _NUMPY is None and NUMPY_VAR:
+        import numpy
+        _NUMPY = numpy
+    return _NUMPY
+
+ZEKAT_NISAB = 80.18  # gram
+NISAB_BILDIRIM = os.getenv("NISAB_BILDIRIM", "1") == "1"
+
+# Portföy alanı -> fiyatın okunduğu (kaynak, anahtar); None ise tutar zaten TL
+PORTFOY_FIYATLARI = {
+    "enpara_gr": ("gram", "Enpara"),
+    "ziraat_gr": ("gram", "Ziraat Bankası"),
+    "ata": ("altin_turleri", "Ata Altın"),
+    "ceyrek": ("altin_turleri", "Çeyrek Altın"),
+    "borsa": None,
+    "kripto": ("para", "USD"),
+    "diger": None,
+}
+DEGERLEME_KAYNAKLARI = ("gram", "altin_turleri", "para")
+
+VALUATION_DURATION = METRICS.register(Histogram(
+    "finbot_valuation_duration_seconds", "Tüm portföylerin toplu değerleme süresi"))
+NISAB_NOTIFICATIONS = METRICS.register(Counter(
+    "finbot_nisab_notifications_total", "Gönderilen nisab geçiş bildirimleri", ("yon",)))
+
+def portfoy_fiyatlari(gram_data, tur_data, para_data):
+    """Fiyat vektörü ({alan: TL çarpanı}) ve Gram Has Altın alış fiyatı."""
+    veriler = {"gram": gram_data, "altin_turleri": tur_data, "para": para_data}
+    fiyatlar = {}
+    for alan, kaynak in PORTFOY_FIYATLARI.items():
+        if kaynak is None:
+            fiyatlar[alan] = 1.0
+        else:
+            fiyatlar[alan] = float(veriler[kaynak[0]].get(kaynak[1], {}).get("alis", 0))
+    return fiyatlar, float(tur_data.get("Gram Has Altın", {}).get("alis", 0))
+
+class Degerleme(NamedTuple):
+    """Bir kullanıcının son toplu değerlemedeki satırı."""
+    miktarlar: dict
+    tutarlar: dict
+    toplam: float
+    altin_gram: float
+    nisab: bool
+
+class PortfolioBook:
+    """Bütün portföylerin kolon düzenindeki kopyası ve son toplu değerlemesi."""
+
+    def __init__(self, alanlar):
+        self.alanlar = alanlar
+        self.user_ids = []
+        self.satir = {}
+        self.kolonlar = {alan: array("d") for alan in alanlar}
+        # Son değerleme: snapshot'lar, fiyat vektörü ve satır başına sonuçlar
+        self.snaps = None
+        self.fiyatlar = None
+        self.gram_has = 0.0
+        self.tam = False
+        self.toplam = array("d")
+        self.altin_gram = array("d")
+        self.nisab = bytearray()
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def load(self, portfoyler):
+        for user_id, veriler in portfoyler.items():
+            self.upsert(user_id, veriler)
+
+    def upsert(self, user_id, veriler):
+        """Satırı ekler/günceller; fiyatlar biliniyorsa yalnızca o satırı yeniden değerler."""
+        i = self.satir.get(user_id)
+        if i is None:
+            i = self.satir[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            for alan in self.alanlar:
+                self.kolonlar[alan].append(float(veriler[alan]))
+        else:
+            for alan in self.alanlar:
+                self.kolonlar[alan][i] = float(veriler[alan])
+        if self.fiyatlar is not None:
+            self._satiri_degerle(i)
+
+    def _satiri_degerle(self, i):
+        toplam = sum(self.kolonlar[alan][i] * self.fiyatlar[alan] for alan in self.alanlar)
+        altin = toplam / self.gram_has if self.gram_has > 0 else 0.0
+        if i == len(self.toplam):
+            self.toplam.append(toplam)
+            self.altin_gram.append(altin)
+            self.nisab.append(altin > ZEKAT_NISAB)
+        else:
+            self.toplam[i] = toplam
+            self.altin_gram[i] = altin
+            self.nisab[i] = altin > ZEKAT_NISAB
+
+    def guncel_mi(self, snaps):
+        return self.snaps is not None and all(
+            a.version == b.version for a, b in zip(self.snaps, snaps)
+        )
+
+    def revalue(self, snaps):
+        """Tüm satırları tek geçişte değerler; nisab durumu değişen (user_id, durum) listesini döndürür."""
+        baslangic = time.perf_counter()
+        fiyatlar, gram_has = portfoy_fiyatlari(*(s.data for s in snaps))
+        n = len(self.user_ids)
+        np = numpy_modulu()
+        if np is not None:
+            # np.frombuffer kolonu kopyalamaz; görünümler fonksiyon bitince bırakılır
+            toplam = np.zeros(n)
+            for alan in self.alanlar:
+                if fiyatlar[alan]:
+                    toplam += np.frombuffer(self.kolonlar[alan], dtype=np.float64, count=n) * fiyatlar[alan]
+            altin = toplam / gram_has if gram_has > 0 else np.zeros(n)
+            nisab = (altin > ZEKAT_NISAB).astype(np.uint8)
+            yeni_toplam = array("d", toplam.tobytes())
+            yeni_altin = array("d", altin.tobytes())
+            yeni_nisab = bytearray(nisab.tobytes())
+        else:
+            yeni_toplam = array("d", bytes(8 * n))
+            for alan in self.alanlar:
+                fiyat = fiyatlar[alan]
+                if not fiyat:
+                    continue
+                kolon = self.kolonlar[alan]
+                for i in range(n):
+                    yeni_toplam[i] += kolon[i] * fiyat
+            if gram_has > 0:
+                yeni_altin = array("d", (t / gram_has for t in yeni_toplam))
+            else:
+                yeni_altin = array("d", bytes(8 * n))
+            yeni_nisab = bytearray(a > ZEKAT_NISAB for a in yeni_altin)
+        
+        # Eksik fiyatla yapılan değerleme toplamı düşürür; bu durumda (ya da
+        # ilk değerlemede) nisab geçişi bildirilmez.
+        tam = gram_has > 0 and all(fiyatlar.values())
+        gecenler = []
+        if tam and self.tam:
+            m = min(len(self.nisab), n)
+            if np is not None:
+                farkli = np.flatnonzero(
+                    np.frombuffer(bytes(self.nisab[:m]), dtype=np.uint8) != nisab[:m]
+                ).tolist()
+            else:
+                farkli = [i for i in range(m) if self.nisab[i] != yeni_nisab[i]]
+            gecenler = [(self.user_ids[i], bool(yeni_nisab[i])) for i in farkli]
+        
+        self.snaps = tuple(snaps)
+        self.fiyatlar = fiyatlar
+        self.gram_has = gram_has
+        self.tam = tam
+        self.toplam, self.altin_gram, self.nisab = yeni_toplam, yeni_altin, yeni_nisab
+        VALUATION_DURATION.observe(time.perf_counter() - baslangic)
+        return gecenler
+
+    def lookup(self, user_id):
+        """Kullanıcının son değerlemedeki satırı; portföyü yoksa None."""
+        i = self.satir.get(user_id)
+        if i is None or self.fiyatlar is None:
+            return None
+        miktarlar = {alan: self.kolonlar[alan][i] for alan in self.alanlar}
+        return Degerleme(
+            miktarlar=miktarlar,
+            tutarlar={alan: miktarlar[alan] * self.fiyatlar[alan] for alan in self.alanlar},
+            toplam=self.toplam[i],
+            altin_gram=self.altin_gram[i],
+            nisab=bool(self.nisab[i]),
+        )
+
+PORTFOY_DEFTERI = PortfolioBook(PORTFOY_ALANLARI)
+PORTFOY_DEFTERI.load(PORTFOY.all())
+_NISAB_GOREVLERI = set()
+
+def portfoyleri_degerle(snaps):
+    """Snapshot'lar değiştiyse tüm portföyleri yeniden değerler, geçişleri bildirir."""
+    if PORTFOY_DEFTERI.guncel_mi(snaps):
+        return
+    gecenler = PORTFOY_DEFTERI.revalue(snaps)
+    if gecenler and NISAB_BILDIRIM and BOT_INSTANCE is not None and lider_mi():
+        task = asyncio.ensure_future(nisab_bildir(BOT_INSTANCE, gecenler))
+        _NISAB_GOREVLERI.add(task)
+        task.add_done_callback(_NISAB_GOREVLERI.discard)
+
+async def nisab_bildir(bot, gecenler):
+    """Nisab eşiğini geçen kullanıcılara iki toplu mesaj gönderir."""
+    for durum, yon, metin in (
+        (True, "asti", f"🕌 Portföyünüz nisab miktarını ({ZEKAT_NISAB}g altın) aştı, zekâta tâbisiniz.\n"
+                       f"Ayrıntı için /kasa"),
+        (False, "dustu", f"🕌 Portföyünüz nisab miktarının ({ZEKAT_NISAB}g altın) altına düştü.\n"
+                         f"Ayrıntı için /kasa"),
+    ):
+        chat_ids = [int(user_id) for user_id, d in gecenler if d is durum]
+        if chat_ids:
+            gonderilen, _ = await BROADCASTER.send(bot, chat_ids, metin)
+            NISAB_NOTIFICATIONS.inc(yon, amount=gonderilen)
+
+async def degerleme_dinleyici(snap, onceki):
+    """Değerlemeyi etkileyen bir kaynak yenilenince toplu değerlemeyi çalıştırır."""
+    if snap.kaynak not in DEGERLEME_KAYNAKLARI or not len(PORTFOY_DEFTERI):
+        return
+    snaps = tuple(PRICE_CACHE.peek(k) for k in DEGERLEME_KAYNAKLARI)
+    if all(s is not None for s in snaps):
+        portfoyleri_degerle(snaps)
+
+PRICE_CACHE.subscribe(degerleme_dinleyici)
+
+# ========== AKIŞLI YANITLAR ==========
+# Kaynaklar önbellekte taze değilse önce bir iskelet mesaj gönderilir, her
+# kaynak geldikçe aynı mesaj edit_message_text ile yerinde güncellenir.
+# Kullanıcı ilk yanıtı tek bir Bot API gidiş-dönüşünde görür. Ara
+# düzenlemeler STREAM_EDIT_INTERVAL saniyede bire birleştirilir (yalnızca
+# en son metin gönderilir); son metin beklemeden yazılır.
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_MAX_METIN = 4096
+
+STREAM_EDITS = METRICS.register(Counter(
+    "finbot_stream_edits_total", "Akışlı yanıt düzenlemeleri", ("sonuc",)))
+
+KAYNAK_ADLARI = {
+    "gram": "Gram altın",
+    "altin_turleri": "Altın türleri",
+    "para": "Döviz kurları",
+    "borsa": "Borsa",
+    "kripto": "Kripto",
+}
+
+def bekleyen_notu(kaynaklar, snaps):
+    """Henüz gelmemiş kaynaklar için '⏳ ... yükleniyor' satırları."""
+    return "\n".join(f"⏳ {KAYNAK_ADLARI[k]} yükleniyor..." for k in kaynaklar if k not in snaps)
+
+def mesaj_parcala(bolumler):
+    """Bölümleri boş satırla birleştirir; Telegram sınırını aşarsa birden çok mesaja böler."""
+    parcalar = []
+    for bolum in bolumler:
+        if parcalar and len(parcalar[-1]) + 2 + len(bolum) <= TELEGRAM_MAX_METIN:
+            parcalar[-1] += "\n\n" + bolum
+        else:
+            parcalar.append(bolum)
+    return parcalar
+
+class CanliMesaj:
+    """Yerinde güncellenen tek bir yanıt; ara düzenlemeleri birleştirir."""
+
+    def __init__(self, message, aralik=None):
+        self.message = message
+        self.aralik = STREAM_EDIT_INTERVAL if aralik is None else aralik
+        self.gonderilen = None
+        self.gosterilen = None
+        self._bekleyen = None
+        self._son_duzenleme = 0.0
+        self._gorev = None
+
+    async def gonder(self, metin):
+        self.gonderilen = await self.message.reply_text(metin)
+        self.gosterilen = metin
+        self._son_duzenleme = time.monotonic()
+
+    def guncelle(self, metin):
+        """Ara metni bekletir; aralık dolunca yalnızca en son metin yazılır."""
+        self._bekleyen = metin
+        if self._gorev is None:
+            self._gorev = asyncio.ensure_future(self._bosalt())
+
+    async def _bosalt(self):
+        try:
+            bekle = self._son_duzenleme + self.aralik - time.monotonic()
+            if bekle > 0:
+                await asyncio.sleep(bekle)
+            metin, self._bekleyen = self._bekleyen, None
+            await self._duzenle(metin)
+        except RetryAfter:
+            # Ara düzenleme atlanır, son metin bitir() ile yine yazılır
+            STREAM_EDITS.inc("atlandi")
+        except Exception as e:
+            report_error("telegram", f"Akışlı düzenleme hatası: {e}")
+        finally:
+            self._gorev = None
+
+    async def _duzenle(self, metin):
+        if metin is None or metin == self.gosterilen:
+            STREAM_EDITS.inc("birlesti")
+            return
+        await self.gonderilen.edit_text(metin)
+        self.gosterilen = metin
+        self._son_duzenleme = time.monotonic()
+        STREAM_EDITS.inc("gonderildi")
+
+    async def bitir(self, parcalar):
+        """Son metni yazar; bekleyen ara düzenleme iptal edilir, taşan parçalar ayrı gönderilir."""
+        if self._gorev is not None:
+            self._gorev.cancel()
+            self._gorev = None
+        try:
+            await self._duzenle(parcalar[0])
+        except RetryAfter as e:
+            await asyncio.sleep(retry_after_saniye(e))
+            await self._duzenle(parcalar[0])
+        for parca in parcalar[1:]:
+            await self.message.reply_text(parca)
+
+async def akisli_yanit(message, kaynaklar, olustur):
+    """
+    olustur(snaps) ile üretilen bölümleri gönderir; snaps yalnızca gelmiş
+    kaynakları içerir. Tüm kaynaklar önbellekte (taze ya da arka planda
+    yenilenen bayat) varsa doğrudan son metin, değilse iskelet + yerinde
+    düzenleme ile yanıt verilir.
+    """
+    hazir = [PRICE_CACHE.peek(k) for k in kaynaklar]
+    if not STREAM_REPLIES or all(PRICE_CACHE.beklemeden_sunulur(s) for s in hazir):
+        snaps = await get_snapshots(*kaynaklar)
+        with phase("render"):
+            parcalar = mesaj_parcala(olustur(snaps))
+        for parca in parcalar:
+            await message.reply_text(parca)
+        return
+    
+    snaps = {}
+    canli = CanliMesaj(message)
+    await canli.gonder(mesaj_parcala(olustur(snaps))[0])
+    with phase("fetch"):
+        for gelen in asyncio.as_completed([snapshot_bekle(k) for k in kaynaklar]):
+            snap = await gelen
+            snaps[snap.kaynak] = snap
+            if len(snaps) < len(kaynaklar):
+                canli.guncelle(mesaj_parcala(olustur(snaps))[0])
+    with phase("render"):
+        parcalar = mesaj_parcala(olustur(snaps))
+    await canli.bitir(parcalar)
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Yardım mesajı gösterir."""
+    try:
+        help_msg = (
+            "🤖 Finans Botu\n\n"
+            "/au - Altın fiyatları\n"
+            "/para - USD/EUR\n"
+            "/borsa - BIST 100/30\n"
+            "/kripto - BTC/ETH\n"
+            "/all - Tüm veriler\n"
+            "/duzenle - Portföy gir\n"
+            "/kasa - Portföy değeri\n"
+            "/grafik - Fiyat geçmişi\n"
+            "/alarm - Fiyat alarmı\n"
+            "/ekle - İzleme listesine sembol ekle\n"
+            "/liste - İzleme listesi\n"
+            "/abone - Günlük özet aboneliği\n\n"
+            "💬 Her sohbette: @botadı altın | usd | btc\n\n"
+            "💡Furkan ÖZTÜRK sunar... 🚀"
+        )
+        if update.message is not None:
+            await update.message.reply_text(help_msg)
+    except Exception as e:
+        report_error("handler", f"Start hatası: {e}")
+
+async def duzenle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Kullanıcı portföy verilerini kaydeder."""
+    try:
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        user_id = str(update.message.from_user.id)
+        
+        if not context.args:
+            await update.message.reply_text(
+                "📝 Portföy Düzenleme\n\n"
+                "/duzenle enpara_gr, ziraat_gr, ata, ceyrek, borsa, kripto, diger\n\n"
+                "Örnek: /duzenle 30,35,2,3,50000,1000,25000"
+            )
+            return
+        
         raw = " ".join(context.args).strip()
         parcalar = raw.split(",")
         
@@ -462,206 +2827,1485 @@ async def duzenle(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Sayısal değerler giriniz!")
             return
         
-        tum_veriler = load_user_data()
-        tum_veriler[user_id] = veriler
-        
-        if save_user_data(tum_veriler):
+        if await run_blocking(PORTFOY.put, user_id, veriler):
+            PORTFOY_DEFTERI.upsert(user_id, veriler)
+            await update.message.reply_text(
+                f"✅ Kaydedildi!\n"
+                f"Enpara: {veriler['enpara_gr']}g | Ziraat: {veriler['ziraat_gr']}g\n"
+                f"Ata: {veriler['ata']} | Çeyrek: {veriler['ceyrek']}\n"
+                f"Borsa: {veriler['borsa']:,.0f}₺ | Kripto: {veriler['kripto']:,.0f}$ | Diğer: {veriler['diger']:,.0f}₺"
+            )
+        else:
+            await update.message.reply_text("❌ Kaydetme hatası!")
+            
+    except Exception as e:
+        report_error("handler", f"Düzenle hatası: {e}")
+
+def kasa_mesaji(user_id, snaps):
+    """/kasa metni; değerleme kaynaklarından biri henüz gelmediyse iskelet döner."""
+    if any(k not in snaps for k in DEGERLEME_KAYNAKLARI):
+        return "💰 KASA\n\n" + bekleyen_notu(DEGERLEME_KAYNAKLARI, snaps)
+    gram_snap, tur_snap, para_snap = (snaps[k] for k in DEGERLEME_KAYNAKLARI)
+    
+    # Değerleme snapshot'lar değiştiyse tüm kullanıcılar için bir kez
+    # yapılır, burada yalnızca satır okunur
+    portfoyleri_degerle((gram_snap, tur_snap, para_snap))
+    d = PORTFOY_DEFTERI.lookup(user_id)
+    v, t = d.miktarlar, d.tutarlar
+    
+    # Fiyatı alınamayan kalem 0₺ sayılır; toplam ve nisab sonucu yanıltmasın
+    eksik = [
+        PORTFOY_FIYATLARI[alan][1] for alan, fiyat in PORTFOY_DEFTERI.fiyatlar.items()
+        if not fiyat and v[alan]
+    ]
+    if not PORTFOY_DEFTERI.gram_has:
+        eksik.append("Gram Has Altın")
+    
+    if eksik:
+        zekat_durumu = (
+            f"⚠️ Fiyatı alınamayan: {', '.join(eksik)}\n"
+            "Toplam eksik, nisab durumu belirlenemedi."
+        )
+    else:
+        zekat_durumu = "Zekâta tâbiisiniz 😎" if d.nisab else "Nisab miktarına ulaşılmadı."
+    
+    return (
+        f"💰 KASA\n\n"
+        f"Enpara ({v['enpara_gr']}g): {t['enpara_gr']:,.0f}₺\n"
+        f"Ziraat ({v['ziraat_gr']}g): {t['ziraat_gr']:,.0f}₺\n"
+        f"Ata ({v['ata']:.0f}): {t['ata']:,.0f}₺\n"
+        f"Çeyrek ({v['ceyrek']:.0f}): {t['ceyrek']:,.0f}₺\n"
+        f"Borsa: {t['borsa']:,.0f}₺\n"
+        f"Kripto ({v['kripto']:.0f}$): {t['kripto']:,.0f}₺\n"
+        f"Diğer: {t['diger']:,.0f}₺\n\n"
+        f"🏆 TOPLAM: {d.toplam:,.0f}₺\n\n"
+        f"⚖️ Altın Karşılığı (gr) : {d.altin_gram:,.2f}g\n\n"
+        f"{zekat_durumu}"
+        f"{format_snapshot_footer(gram_snap, tur_snap, para_snap)}"
+        f"{bayatlik_notu(gram_snap, tur_snap, para_snap)}"
+    )
+
+async def kasa(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Portföy toplam değerini hesaplar."""
+    try:
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        user_id = str(update.message.from_user.id)
+        if user_id not in PORTFOY_DEFTERI.satir:
+            await update.message.reply_text("❌ Portföy yok! /duzenle ile girin.")
+            return
+        
+        await akisli_yanit(update.message, DEGERLEME_KAYNAKLARI, lambda snaps: [kasa_mesaji(user_id, snaps)])
+        
+    except Exception as e:
+        report_error("handler", f"Kasa hatası: {e}")
+
+def au_mesaji(snaps):
+    """/au metni; gelmemiş kaynak için 'yükleniyor' satırı eklenir."""
+    if "gram" in snaps and "altin_turleri" in snaps:
+        # Fiyatlar değişmedikçe hazır metin kullanılır
+        return render_au(snaps["gram"], snaps["altin_turleri"])
+    gram_data = snaps["gram"].data if "gram" in snaps else {}
+    tur_data = snaps["altin_turleri"].data if "altin_turleri" in snaps else {}
+    govde = format_au_message(gram_data, tur_data) if gram_data or tur_data else "📊 Altın Fiyatları\n"
+    return f"{govde}\n{bekleyen_notu(('gram', 'altin_turleri'), snaps)}"
+
+async def au(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tüm altın fiyatlarını gösterir (gram altın kaynakları + altın türleri)."""
+    try:
+        if update.message is None:
+            report_error("handler", "Au komutu: mesaj nesnesi bulunamadı.")
+            return
+        
+        # Gram altın kaynakları (Kapalıçarşı, Enpara, Ziraat) ve
+        # altın türleri (Gram Has, Çeyrek, Yarım, Ata) eşzamanlı çekilir
+        await akisli_yanit(update.message, ("gram", "altin_turleri"), lambda snaps: [au_mesaji(snaps)])
+    except Exception as e:
+        report_error("handler", f"Au komutu hatası: {e}")
+
+async def para(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """USD ve EUR döviz kurlarını gösterir."""
+    try:
+        snap = (await get_snapshots("para"))["para"]
+        with phase("render"):
+            message = render_snapshot(snap)
+        if update.message is not None:
+            await update.message.reply_text(message)
+        else:
+            report_error("handler", "Para komutu: mesaj nesnesi bulunamadı.")
+    except Exception as e:
+        report_error("handler", f"Para komutu hatası: {e}")
+
+async def borsa(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """BIST 100 ve BIST 30 verilerini gösterir."""
+    try:
+        snap = (await get_snapshots("borsa"))["borsa"]
+        with phase("render"):
+            message = render_snapshot(snap)
+        if update.message is not None:
+            await update.message.reply_text(message)
+        else:
+            report_error("handler", "Borsa komutu: mesaj nesnesi bulunamadı.")
+    except Exception as e:
+        report_error("handler", f"Borsa komutu hatası: {e}")
+
+async def kripto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """BTC ve ETH kripto verilerini gösterir."""
+    try:
+        snap = (await get_snapshots("kripto"))["kripto"]
+        with phase("render"):
+            message = render_snapshot(snap)
+        if update.message is not None:
+            await update.message.reply_text(message)
+        else:
+            report_error("handler", "Kripto komutu: mesaj nesnesi bulunamadı.")
+    except Exception as e:
+        report_error("handler", f"Kripto komutu hatası: {e}")
+
+TUM_KAYNAKLAR = ("gram", "altin_turleri", "para", "borsa", "kripto")
+
+def build_all_messages(snaps):
+    """
+    /all bölümlerini (altın, döviz, borsa, kripto) ayrı mesajlar olarak üretir.
+    Verisi alınamayan kaynağın bölümü atlanır, henüz gelmemiş kaynağın
+    yerine 'yükleniyor' satırı konur.
+    """
+    mesajlar = []
+    
+    # 1. Altın verileri
+    if "gram" not in snaps or "altin_turleri" not in snaps:
+        mesajlar.append(au_mesaji(snaps))
+    elif snaps["gram"].data or snaps["altin_turleri"].data:
+        mesajlar.append(render_au(snaps["gram"], snaps["altin_turleri"]))
+    
+    # 2. Döviz, 3. Borsa, 4. Kripto verileri
+    for kaynak in ("para", "borsa", "kripto"):
+        snap = snaps.get(kaynak)
+        if snap is None:
+            mesajlar.append(bekleyen_notu((kaynak,), snaps))
+        elif snap.data:
+            mesajlar.append(render_snapshot(snap))
+    
+    return mesajlar
+
+async def all_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tüm finansal verileri gösterir."""
+    try:
+        if update.message is None:
+            return
+        
+        # Tüm kaynaklar aynı anda çekilir; alınamayan kaynağın bölümü
+        # atlanır. Akışlı modda bölümler tek mesajda, geldikçe doldurulur.
+        if STREAM_REPLIES:
+            await akisli_yanit(
+                update.message, TUM_KAYNAKLAR,
+                lambda snaps: build_all_messages(snaps) or ["❌ Veri alınamadı."],
+            )
+            return
+        
+        snaps = await get_snapshots(*TUM_KAYNAKLAR)
+        with phase("render"):
+            mesajlar = build_all_messages(snaps)
+        
+        if not mesajlar:
+            mesajlar.append("❌ Veri alınamadı.")
+        
+        for mesaj in mesajlar:
+            await update.message.reply_text(mesaj)
+        
+    except Exception as e:
+        report_error("handler", f"All komutu hatası: {e}")
+
+async def grafik(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bir enstrümanın geçmiş değişimini, min/maks/ortalamasını gösterir."""
+    try:
+        if update.message is None:
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                "📉 Fiyat Geçmişi\n\n"
+                "/grafik sembol [1s|24s|7g|30g]\n\n"
+                "Örnek: /grafik usd 24s\n\n"
+                "Semboller: " + ", ".join(ENSTRUMANLAR)
+            )
+            return
+        
+        args = list(context.args)
+        sure = 86400
+        if len(args) > 1 and args[-1].lower() in PERIYOTLAR:
+            sure = PERIYOTLAR[args.pop().lower()]
+        
+        sembol = find_enstruman(" ".join(args))
+        if sembol is None:
+            await update.message.reply_text("❌ Bilinmeyen sembol! /grafik ile listeyi görün.")
+            return
+        
+        kayitlar = await run_blocking(PRICE_HISTORY.range, sembol, time.time() - sure)
+        await update.message.reply_text(format_grafik_message(sembol, sure, kayitlar))
+        
+    except Exception as e:
+        report_error("handler", f"Grafik komutu hatası: {e}")
+
+async def alarm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Fiyat alarmı kurar: /alarm sembol [alis|satis] >|< değer"""
+    try:
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        kullanim = (
+            "🔔 Fiyat Alarmı\n\n"
+            "/alarm sembol [alis|satis] >|< değer\n\n"
+            "Örnek: /alarm çeyrek alış > 5000\n"
+            "Örnek: /alarm usd satış < 40\n\n"
+            "/alarmlar - Alarmlarım\n"
+            "/alarmsil no - Alarmı sil"
+        )
+        args = list(context.args or [])
+        if len(args) < 3:
+            await update.message.reply_text(kullanim)
+            return
+        
+        # Fiyatlar Türkçe biçimde yazılır: 5.000 -> 5000, 39,5 -> 39.5
+        esik = parse_price(args.pop())
+        if esik is None:
+            await update.message.reply_text("❌ Sayısal bir eşik girin!")
+            return
+        yon = args.pop()
+        if yon not in (">", "<"):
+            await update.message.reply_text(kullanim)
+            return
+        alan = "satis"
+        if args and slugify(args[-1]) in ALARM_ALANLARI:
+            alan = ALARM_ALANLARI[slugify(args.pop())]
+        
+        sembol = find_enstruman(" ".join(args)) if args else None
+        if sembol is None:
+            await update.message.reply_text("❌ Bilinmeyen sembol! /grafik ile listeyi görün.")
+            return
+        
+        user_id = str(update.message.from_user.id)
+        if len(ALARMLAR.user_alarms(user_id)) >= MAX_ALARM_PER_USER:
+            await update.message.reply_text(f"❌ En fazla {MAX_ALARM_PER_USER} alarm kurabilirsiniz.")
+            return
+        
+        simdi = son_fiyat(sembol, alan)
+        if simdi is not None and (simdi > esik if yon == ">" else simdi < esik):
+            await update.message.reply_text(f"ℹ️ Koşul şu an zaten sağlanıyor ({format_sayi(simdi)}).")
+            return
+        
+        kayit = await run_blocking(ALARMLAR.add, user_id, update.message.chat_id, sembol, alan, yon, esik)
+        await update.message.reply_text(f"✅ Alarm kuruldu: {format_alarm(kayit)}")
+        
+    except Exception as e:
+        report_error("handler", f"Alarm komutu hatası: {e}")
+
+async def alarmlar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Kullanıcının kurulu alarmlarını listeler."""
+    try:
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        liste = ALARMLAR.user_alarms(str(update.message.from_user.id))
+        if not liste:
+            await update.message.reply_text("🔕 Kurulu alarm yok. /alarm ile ekleyin.")
+            return
+        
+        await update.message.reply_text("🔔 Alarmlarım\n\n" + "\n".join(format_alarm(a) for a in liste))
+        
+    except Exception as e:
+        report_error("handler", f"Alarmlar komutu hatası: {e}")
+
+async def alarmsil(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Kullanıcının bir alarmını siler."""
+    try:
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        try:
+            alarm_id = int(context.args[0].lstrip("#"))
+        except (IndexError, TypeError, ValueError):
+            await update.message.reply_text("❌ Alarm numarası girin! Örnek: /alarmsil 3")
+            return
+        
+        mevcut = ALARMLAR.alarms.get(alarm_id)
+        if mevcut is None or mevcut.user_id != str(update.message.from_user.id):
+            await update.message.reply_text("❌ Böyle bir alarmınız yok.")
+            return
+        
+        await run_blocking(ALARMLAR.remove, alarm_id)
+        await update.message.reply_text(f"🗑️ Silindi: {format_alarm(mevcut)}")
+        
+    except Exception as e:
+        report_error("handler", f"Alarmsil komutu hatası: {e}")
+
+async def abone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sohbeti günlük özet yayınlarına abone eder."""
+    try:
+        if update.message is None:
+            return
+        
+        if await run_blocking(ABONELER.add, update.message.chat_id):
+            await update.message.reply_text(
+                "📣 Abone oldunuz!\n"
+                f"Sabah özeti ({BROADCAST_SABAH}) ve borsa kapanışı ({BROADCAST_KAPANIS}) gönderilecek.\n"
+                "İptal: /abonelikiptal"
+            )
+        else:
+            await update.message.reply_text("ℹ️ Zaten abonesiniz. İptal: /abonelikiptal")
+        
+    except Exception as e:
+        report_error("handler", f"Abone komutu hatası: {e}")
+
+async def abonelikiptal(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sohbetin yayın aboneliğini iptal eder."""
+    try:
+        if update.message is None:
+            return
+        
+        if await run_blocking(ABONELER.remove, update.message.chat_id):
+            await update.message.reply_text("🔕 Abonelik iptal edildi.")
+        else:
+            await update.message.reply_text("ℹ️ Abone değilsiniz. Abone olmak için: /abone")
+        
+    except Exception as e:
+        report_error("handler", f"Abonelik iptal hatası: {e}")
+
+async def ekle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """İzleme listesine sembol ekler: /ekle gbp"""
+    try:
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        if not context.args:
             await update.message.reply_text(
-                f"✅ Kaydedildi!\n"
-                f"Enpara: {veriler['enpara_gr']}g | Ziraat: {veriler['ziraat_gr']}g\n"
-                f"Ata: {veriler['ata']} | Çeyrek: {veriler['ceyrek']}\n"
-                f"Borsa: {veriler['borsa']:,.0f}₺ | Kripto: {veriler['kripto']:,.0f}$ | Diğer: {veriler['diger']:,.0f}₺"
+                "⭐ İzleme Listesi\n\n"
+                "/ekle sembol\n\n"
+                "Örnek: /ekle gbp, /ekle sol\n\n"
+                "Semboller: " + ", ".join(ENSTRUMANLAR)
             )
+            return
+        
+        user_id = str(update.message.from_user.id)
+        sembol = find_enstruman(" ".join(context.args))
+        if sembol is None:
+            await update.message.reply_text("❌ Bilinmeyen sembol! /ekle ile listeyi görün.")
+            return
+        
+        if len(IZLEME.get(user_id)) >= MAX_WATCHLIST:
+            await update.message.reply_text(f"❌ En fazla {MAX_WATCHLIST} sembol izleyebilirsiniz.")
+            return
+        
+        ad = ENSTRUMANLAR[sembol][2]
+        if await run_blocking(IZLEME.add, user_id, sembol):
+            await update.message.reply_text(f"✅ {ad} izleme listenize eklendi. /liste ile görün.")
         else:
-            await update.message.reply_text("❌ Kaydetme hatası!")
-            
+            await update.message.reply_text(f"ℹ️ {ad} zaten listenizde.")
+        
     except Exception as e:
-        print(f"Düzenle hatası: {e}")
+        report_error("handler", f"Ekle komutu hatası: {e}")
 
-async def kasa(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Portföy toplam değerini hesaplar."""
+async def cikar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """İzleme listesinden sembol çıkarır: /cikar gbp"""
     try:
         if update.message is None or update.message.from_user is None:
             return
         
         user_id = str(update.message.from_user.id)
-        tum_veriler = load_user_data()
+        sembol = find_enstruman(" ".join(context.args)) if context.args else None
+        if sembol is None:
+            await update.message.reply_text("❌ Kullanım: /cikar sembol (ör. /cikar gbp)")
+            return
         
-        if user_id not in tum_veriler:
-            await update.message.reply_text("❌ Portföy yok! /duzenle ile girin.")
+        if await run_blocking(IZLEME.remove, user_id, sembol):
+            await update.message.reply_text(f"🗑️ {ENSTRUMANLAR[sembol][2]} listeden çıkarıldı.")
+        else:
+            await update.message.reply_text("❌ Bu sembol listenizde yok.")
+        
+    except Exception as e:
+        report_error("handler", f"Çıkar komutu hatası: {e}")
+
+async def liste(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """İzleme listesindeki sembollerin güncel fiyatlarını gösterir."""
+    try:
+        if update.message is None or update.message.from_user is None:
             return
         
-        v = tum_veriler[user_id]
-        
-        # Fiyatları çek
-        gram_data = get_gold_data()
-        altin_tur = get_altin_turleri_data()
-        para_data = get_para_data()
-        
-        # Hesaplamalar
-        ziraat_fiyat = gram_data.get("Ziraat Bankası", {}).get("alis", 0)
-        enpara_fiyat = gram_data.get("Enpara", {}).get("alis", 0)
-        
-        ata_fiyat = altin_tur.get("Ata Altın", {}).get("alis", 0)
-        ceyrek_fiyat = altin_tur.get("Çeyrek Altın", {}).get("alis", 0)
-        gram_has_fiyat = altin_tur.get("Gram Has Altın", {}).get("alis", 0)
-        usd = para_data.get("USD", {}).get("alis", 0)
-        
-        # Toplamlar
-        t_enpara = v["enpara_gr"] * enpara_fiyat
-        t_ziraat = v["ziraat_gr"] * ziraat_fiyat
-        t_ata = v["ata"] * ata_fiyat
-        t_ceyrek = v["ceyrek"] * ceyrek_fiyat
-        t_borsa = v["borsa"]
-        t_kripto = v["kripto"] * usd
-        t_diger = v["diger"]
-        toplam = t_enpara + t_ziraat + t_ata + t_ceyrek + t_borsa + t_kripto + t_diger
-        
-        # Gram Has Altın cinsinden toplam değer
-        toplam_gram = toplam / gram_has_fiyat if gram_has_fiyat > 0 else 0
-        
-        # Zekat kontrolü (80.18 gram nisab)
-        ZEKAT_NISAB = 80.18
-        zekat_durumu = "Zekâta tâbiisiniz 😎" if toplam_gram > ZEKAT_NISAB else "Nisab miktarına ulaşılmadı."
-        
-        msg = (
-            f"💰 KASA\n\n"
-            f"Enpara ({v['enpara_gr']}g): {t_enpara:,.0f}₺\n"
-            f"Ziraat ({v['ziraat_gr']}g): {t_ziraat:,.0f}₺\n"
-            f"Ata ({v['ata']:.0f}): {t_ata:,.0f}₺\n"
-            f"Çeyrek ({v['ceyrek']:.0f}): {t_ceyrek:,.0f}₺\n"
-            f"Borsa: {t_borsa:,.0f}₺\n"
-            f"Kripto ({v['kripto']:.0f}$): {t_kripto:,.0f}₺\n"
-            f"Diğer: {t_diger:,.0f}₺\n\n"
-            f"🏆 TOPLAM: {toplam:,.0f}₺\n\n"
-            f"⚖️ Altın Karşılığı (gr) : {toplam_gram:,.2f}g\n\n"
-            f"{zekat_durumu}"
-        )
+        semboller = IZLEME.get(str(update.message.from_user.id))
+        if not semboller:
+            await update.message.reply_text("⭐ Listeniz boş. /ekle ile sembol ekleyin.")
+            return
+        
+        # Yalnızca listedeki sembollerin sayfaları çekilir
+        kaynaklar = list(dict.fromkeys(ENSTRUMANLAR[s][0] for s in semboller))
+        snaps = await get_snapshots(*kaynaklar)
         
-        await update.message.reply_text(msg)
+        with phase("render"):
+            satirlar = ["⭐ İzleme Listeniz"]
+            for sembol in semboller:
+                kaynak, anahtar, ad = ENSTRUMANLAR[sembol]
+                info = snaps[kaynak].data.get(anahtar)
+                satirlar.append(enstruman_satiri(sembol, info) if info else f"• {ad}\n  ❌ Veri alınamadı")
+            kullanilan = [snaps[k] for k in kaynaklar]
+            message = "\n\n".join(satirlar) + "\n" + format_snapshot_footer(*kullanilan) + bayatlik_notu(*kullanilan)
+        
+        await update.message.reply_text(message)
         
     except Exception as e:
-        print(f"Kasa hatası: {e}")
+        report_error("handler", f"Liste komutu hatası: {e}")
 
-async def au(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Tüm altın fiyatlarını gösterir (gram altın kaynakları + altın türleri)."""
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Yöneticilere komut bazında gecikme yüzdeliklerini gösterir."""
     try:
-        # Gram altın kaynakları (Kapalıçarşı, Enpara, Ziraat)
-        gram_data = get_gold_data()
-        
-        # Altın türleri (Gram Has, Çeyrek, Yarım, Ata)
-        tur_data = get_altin_turleri_data()
-        
-        # Tek mesaj olarak birleştir
-        message = "📊 Altın Fiyatları\n"
-        
-        # Gram altın kaynakları
-        for kaynak in KAYNAKLAR.keys():
-            if kaynak in gram_data:
-                info = gram_data[kaynak]
-                emoji = KAYNAKLAR[kaynak]
-                message += f"\n{emoji} {kaynak}\n"
-                message += f"Alış: {info['alis']:.2f} TL\n"
-                message += f"Satış: {info['satis']:.2f} TL\n"
-                message += f"Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:.2f} TL\n"
-        
-        # Altın türleri
-        for isim in ALTIN_TURLERI.keys():
-            if isim in tur_data:
-                info = tur_data[isim]
-                message += f"\n {isim}\n"
-                message += f"  Alış: {info['alis']:,.2f} TL\n"
-                message += f"  Satış: {info['satis']:,.2f} TL\n"
-                message += f"  Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:,.2f} TL\n"
+        if update.message is None or update.message.from_user is None:
+            return
+        
+        if update.message.from_user.id not in ADMIN_IDS:
+            await update.message.reply_text("⛔ Bu komut yalnızca yöneticiler içindir.")
+            return
+        
+        ozet = COMMAND_STATS.summary()
+        if not ozet:
+            await update.message.reply_text("📊 Henüz ölçüm yok.")
+            return
+        
+        satirlar = [f"📊 Komut süreleri (ms, son {PROFILE_WINDOW} çağrı)", "ölçüm: p50 / p95 / p99"]
+        for komut, olcumler in sorted(ozet.items()):
+            n = olcumler["total"][0]
+            satirlar.append(f"\n/{komut} (n={n})")
+            for ad in ("total", *PHASES):
+                _n, p50, p95, p99 = olcumler[ad]
+                if p99 > 0:
+                    satirlar.append(f"  {ad}: {p50 * 1000:.1f} / {p95 * 1000:.1f} / {p99 * 1000:.1f}")
+        
+        if PROFILE_MODE:
+            satirlar.append(f"\n🔬 En yavaş profiller ({PROFILE_DIR}):")
+            for sure, dosya in SLOW_PROFILES.listing():
+                satirlar.append(f"  {sure * 1000:.0f} ms  {os.path.basename(dosya)}")
+        
+        await update.message.reply_text("\n".join(satirlar))
         
-        if update.message is not None:
-            await update.message.reply_text(message)
-        else:
-            print("Mesaj nesnesi bulunamadı.")
     except Exception as e:
-        print(f"Au komutu hatası: {e}")
+        report_error("handler", f"Stats komutu hatası: {e}")
 
-async def para(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """USD ve EUR döviz kurlarını gösterir."""
-    try:
-        data = get_para_data()
-        message = format_para_message(data)
-        if update.message is not None:
-            await update.message.reply_text(message)
+# ========== INLINE SORGULAR ==========
+# "@bot altın", "@bot usd", "@bot btc" gibi sorgular hiçbir zaman scraping
+# tetiklemez: sonuçlar her yeni snapshot'ta önceden hazırlanır ve sorgu
+# yalnızca sıralı bir anahtar kelime listesinde önek araması yapar.
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "30"))
+INLINE_MAX_RESULTS = 50  # Telegram'ın tek yanıttaki üst sınırı
+
+# grup adı -> (başlık, kaynaklar)
+INLINE_GRUPLARI = {
+    "altin": ("📊 Altın Fiyatları", ("gram", "altin_turleri")),
+    "doviz": ("💱 Döviz Kurları", ("para",)),
+    "borsa": ("📈 Borsa İstanbul", ("borsa",)),
+    "kripto": ("₿ Kripto Paralar", ("kripto",)),
+}
+
+# Ek arama kelimeleri -> grup adı ya da enstrüman sembolü
+INLINE_TAKMA_ADLAR = {
+    "kur": "doviz",
+    "dolar": "usd",
+    "euro": "eur",
+    "bist": "borsa",
+    "bitcoin": "btc",
+    "ethereum": "eth",
+}
+
+# Adlar harf/rakam dışı karakterlerden bölünür; sorgudan da bunlar (tire hariç) atılır
+_KELIME_DISI = re.compile(r"[^a-z0-9]+")
+_SORGU_DISI = re.compile(r"[^a-z0-9-]+")
+
+class InlineIndex:
+    """
+    Önceden hazırlanmış InlineQueryResultArticle'lar ve önek indeksi.
+    Sonuçlar snapshot dinleyicisi tarafından yenilenir; arama sırasında
+    yalnızca bisect ile sıralı kelime listesi taranır.
+    """
+
+    def __init__(self):
+        # sonuç anahtarı (grup adı ya da sembol) -> hazır article
+        self._articles = {}
+        # sonuç anahtarlarının gösterim sırası: önce gruplar, sonra enstrümanlar
+        self._sira = {anahtar: i for i, anahtar in enumerate([*INLINE_GRUPLARI, *ENSTRUMANLAR])}
+        # sonuç anahtarı -> beslendiği kaynaklar
+        self._kaynaklar = {grup: kaynaklar for grup, (_baslik, kaynaklar) in INLINE_GRUPLARI.items()}
+        self._kaynaklar.update({sembol: (kaynak,) for sembol, (kaynak, _a, _ad) in ENSTRUMANLAR.items()})
+        kelimeler = set()
+        for grup in INLINE_GRUPLARI:
+            kelimeler.add((grup, grup))
+        for sembol, (_kaynak, _anahtar, ad) in ENSTRUMANLAR.items():
+            kelimeler.add((sembol, sembol))
+            # "XU100 (% değişim)" -> xu100, degisim; "(%" gibi noktalama parçaları indekslenmez
+            for kelime in _KELIME_DISI.split(slugify(ad)):
+                if kelime:
+                    kelimeler.add((kelime, sembol))
+        for kelime, hedef in INLINE_TAKMA_ADLAR.items():
+            kelimeler.add((kelime, hedef))
+        self._kelimeler = sorted(kelimeler)
+        self._anahtarlar = [k for k, _ in self._kelimeler]
+
+    def rebuild(self, kaynak):
+        """Kaynağa ait enstrüman ve grup sonuçlarını son snapshot'lardan yeniden üretir."""
+        snap = PRICE_CACHE.peek(kaynak)
+        if snap is None or not snap.data:
+            return
+        footer = format_snapshot_footer(snap)
+        for sembol, (e_kaynak, anahtar, ad) in ENSTRUMANLAR.items():
+            info = snap.data.get(anahtar)
+            if e_kaynak != kaynak or info is None:
+                continue
+            self._articles[sembol] = InlineQueryResultArticle(
+                id=f"{sembol}:{snap.version}",
+                title=ad,
+                description=enstruman_ozeti(kaynak, info),
+                input_message_content=InputTextMessageContent(enstruman_satiri(sembol, info) + footer),
+            )
+        for grup, (baslik, kaynaklar) in INLINE_GRUPLARI.items():
+            if kaynak not in kaynaklar:
+                continue
+            snaps = [PRICE_CACHE.peek(k) or Snapshot(k, {}, 0, 0.0) for k in kaynaklar]
+            metin = render_au(*snaps) if grup == "altin" else render_snapshot(snaps[0])
+            self._articles[grup] = InlineQueryResultArticle(
+                id=f"{grup}:{'-'.join(str(s.version) for s in snaps)}",
+                title=baslik,
+                description="Tüm liste",
+                input_message_content=InputTextMessageContent(metin),
+            )
+
+    async def on_snapshot(self, snap, onceki):
+        self.rebuild(snap.kaynak)
+
+    def search(self, sorgu):
+        """
+        Sorgunun önek olarak eşleştiği hazır sonuçları ve bu sonuçları besleyen
+        kaynakları döndürür; boş sorguda grupları.
+        """
+        aranan = _SORGU_DISI.sub("", slugify(sorgu)).strip("-")
+        if not aranan:
+            hedefler = set(INLINE_GRUPLARI)
         else:
-            print("Mesaj nesnesi bulunamadı.")
-    except Exception as e:
-        print(f"Para komutu hatası: {e}")
+            hedefler = set()
+            i = bisect.bisect_left(self._anahtarlar, aranan)
+            while i < len(self._anahtarlar) and self._anahtarlar[i].startswith(aranan):
+                hedefler.add(self._kelimeler[i][1])
+                i += 1
+        sonuclar = [self._articles[h] for h in sorted(hedefler, key=self._sira.__getitem__) if h in self._articles]
+        kaynaklar = {k for h in hedefler for k in self._kaynaklar[h]}
+        return sonuclar[:INLINE_MAX_RESULTS], kaynaklar
 
-async def borsa(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """BIST 100 ve BIST 30 verilerini gösterir."""
+INLINE_INDEX = InlineIndex()
+PRICE_CACHE.subscribe(INLINE_INDEX.on_snapshot)
+
+async def inline_sorgu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline sorguyu hazır sonuçlardan yanıtlar."""
     try:
-        data = get_borsa_data()
-        message = format_borsa_message(data)
-        if update.message is not None:
-            await update.message.reply_text(message)
-        else:
-            print("Mesaj nesnesi bulunamadı.")
+        sorgu = update.inline_query
+        if sorgu is None:
+            return
+        
+        sonuclar, kaynaklar = INLINE_INDEX.search(sorgu.query)
+        
+        # Eksik ya da bayat kaynak arka planda yenilenir; bu sorgu beklemez
+        eksik = False
+        for kaynak in kaynaklar:
+            PRICE_CACHE.touch(kaynak)
+            snap = PRICE_CACHE.peek(kaynak)
+            if snap is None or not PRICE_CACHE.is_fresh(snap):
+                eksik = eksik or snap is None
+                PRICE_CACHE.revalidate(kaynak)
+        
+        await sorgu.answer(
+            sonuclar,
+            # Önbellek doluyken istemci/sunucu tarafı önbellek süresi uygulanır
+            cache_time=0 if eksik else INLINE_CACHE_TIME,
+            is_personal=False,
+        )
+        
     except Exception as e:
-        print(f"Borsa komutu hatası: {e}")
+        report_error("handler", f"Inline sorgu hatası: {e}")
 
-async def kripto(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """BTC ve ETH kripto verilerini gösterir."""
+# ========== ARKA PLAN YENİLEYİCİ ==========
+# Fiyatlar komut beklemeden, kaynak başına ayrı aralıklarla yenilenir.
+# Komutlar yayınlanan snapshot'ı bellekten okur; scrape yükü kullanıcı
+# sayısından bağımsız olarak sabit kalır.
+# Aralıklar (saniye) "piyasa açık, piyasa kapalı" şeklinde env ile
+# ezilebilir: REFRESH_INTERVAL_GRAM="60,300" gibi.
+REFRESH_ENABLED = os.getenv("REFRESH_ENABLED", "1") == "1"
+
+# enstrumanlar.json'daki "aralik" alanı; kripto 7/24 işlem gördüğü için kısa
+REFRESH_INTERVALS_VARSAYILAN = {
+    kaynak: tuple(ayar.get("aralik", (CACHE_TTL_VARSAYILAN, CACHE_TTL_VARSAYILAN)))
+    for kaynak, ayar in REGISTRY.kaynaklar.items()
+}
+
+def _parse_intervals(kaynak, varsayilan):
+    raw = os.getenv(f"REFRESH_INTERVAL_{kaynak.upper()}")
+    if not raw:
+        return varsayilan
     try:
-        data = get_kripto_data()
-        message = format_kripto_message(data)
-        if update.message is not None:
-            await update.message.reply_text(message)
-        else:
-            print("Mesaj nesnesi bulunamadı.")
-    except Exception as e:
-        print(f"Kripto komutu hatası: {e}")
+        acik, kapali = (float(x) for x in raw.split(","))
+        return acik, kapali
+    except ValueError:
+        report_error("config", f"Geçersiz REFRESH_INTERVAL_{kaynak.upper()}: {raw}")
+        return varsayilan
 
-async def all_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Tüm finansal verileri tek tek mesaj olarak gönderir."""
+REFRESH_INTERVALS = {
+    kaynak: _parse_intervals(kaynak, varsayilan)
+    for kaynak, varsayilan in REFRESH_INTERVALS_VARSAYILAN.items()
+}
+
+# BIST sürekli işlem seansı (İstanbul saati)
+BIST_ACILIS = (10, 0)
+BIST_KAPANIS = (18, 10)
+
+def piyasa_acik_mi(now=None):
+    """Hafta içi BIST seans saatlerinde True döner."""
+    now = now or datetime.now(TR_TZ)
+    if now.weekday() >= 5:
+        return False
+    return BIST_ACILIS <= (now.hour, now.minute) < BIST_KAPANIS
+
+class PriceRefresher:
+    """Her kaynağı kendi aralığında yenileyen asyncio görevleri."""
+
+    def __init__(self, cache, intervals):
+        self.cache = cache
+        self.intervals = intervals
+        self._tasks = []
+
+    def interval(self, kaynak):
+        acik, kapali = self.intervals.get(kaynak, (CACHE_TTL_VARSAYILAN, CACHE_TTL_VARSAYILAN))
+        return acik if piyasa_acik_mi() else kapali
+
+    def max_age(self, kaynak):
+        # Yenileyici bir turu kaçırsa bile komutlar inline scrape yapmasın
+        return 2 * self.interval(kaynak) + SOURCE_TIMEOUT
+
+    async def _dongu(self, kaynak):
+        while True:
+            try:
+                # Hiçbir liste, alarm ya da yakın tarihli komut istemiyorsa sayfa çekilmez;
+                # ilk talep eden komut önbellekten çekimi kendisi başlatır
+                if lider_mi() and kaynak in talep_edilen_kaynaklar():
+                    await self.cache.refresh(kaynak)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                report_error("background", f"{kaynak} arka plan yenileme hatası: {e}")
+            await asyncio.sleep(self.interval(kaynak))
+
+    def start(self):
+        if self._tasks:
+            return
+        self.cache.refresher = self
+        self._tasks = [asyncio.create_task(self._dongu(k)) for k in self.intervals]
+        logger.info("🔄 Arka plan fiyat yenileyici başlatıldı.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.cache.refresher = None
+
+REFRESHER = PriceRefresher(PRICE_CACHE, REFRESH_INTERVALS)
+
+# ========== YAYIN (BROADCAST) ==========
+# Sabah özeti ve borsa kapanışı CHAT_ID'ye ve /abone ile kaydolan sohbetlere
+# gönderilir. Mesaj bir kez üretilir, ardından token bucket ile hız sınırlı
+# işçilerle dağıtılır: genel limit (Telegram ~30 mesaj/sn, etkileşimli
+# komutlara pay bırakmak için varsayılan 25) ve sohbet başına limit uygulanır.
+# RetryAfter gelirse tüm gönderimler istenen süre kadar duraklatılır.
+BROADCAST_ENABLED = os.getenv("BROADCAST_ENABLED", "1") == "1"
+BROADCAST_SABAH = os.getenv("BROADCAST_SABAH", "09:30")
+BROADCAST_KAPANIS = os.getenv("BROADCAST_KAPANIS", "18:15")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_MAX_DENEME = 3
+
+class SubscriberStore:
+    """Yayın abonelerini (chat id) SQLite'ta saklar."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS aboneler (chat_id INTEGER PRIMARY KEY, created_at REAL NOT NULL)"
+        )
+        degisiklik_tablosu(self._conn)
+        self._veri_surumu = tablo_surumu(self._conn, "aboneler")
+        self.chat_ids = {row[0] for row in self._conn.execute("SELECT chat_id FROM aboneler")}
+
+    def yenile(self):
+        """Başka bir replikanın eklediği/sildiği aboneleri yükler."""
+        with self._lock:
+            surum = tablo_surumu(self._conn, "aboneler")
+            if surum == self._veri_surumu:
+                return False
+            self._veri_surumu = surum
+            self.chat_ids = {row[0] for row in self._conn.execute("SELECT chat_id FROM aboneler")}
+        return True
+
+    def add(self, chat_id):
+        with self._lock:
+            if chat_id in self.chat_ids:
+                return False
+            self._conn.execute(
+                "INSERT OR IGNORE INTO aboneler (chat_id, created_at) VALUES (?, ?)", (chat_id, time.time())
+            )
+            self._veri_surumu = tablo_degisti(self._conn, "aboneler", self._veri_surumu)
+            self.chat_ids.add(chat_id)
+        return True
+
+    def remove(self, chat_id):
+        with self._lock:
+            if chat_id not in self.chat_ids:
+                return False
+            self._conn.execute("DELETE FROM aboneler WHERE chat_id = ?", (chat_id,))
+            self._veri_surumu = tablo_degisti(self._conn, "aboneler", self._veri_surumu)
+            self.chat_ids.discard(chat_id)
+        return True
+
+ABONELER = SubscriberStore(DB_PATH)
+
+class TokenBucket:
+    """Saniyede rate token üreten, en fazla capacity biriktiren kova."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def pause(self, saniye):
+        """RetryAfter sonrası kovayı verilen süre boyunca kilitler."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + saniye)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self):
+        """Token varsa harcayıp 0, yoksa beklemeden gereken süreyi döndürür."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+def retry_after_saniye(hata):
+    """RetryAfter.retry_after int veya timedelta olabilir."""
+    sure = hata.retry_after
+    return sure.total_seconds() if hasattr(sure, "total_seconds") else float(sure)
+
+class Broadcaster:
+    """Önceden üretilmiş mesajı hız sınırlarına uyarak çok sayıda sohbete gönderir."""
+
+    def __init__(self, rate, chat_rate, workers):
+        self.global_bucket = TokenBucket(rate)
+        self.chat_rate = chat_rate
+        self.workers = workers
+
+    async def send(self, bot, chat_ids, metin):
+        """metin'i chat_ids'e dağıtır; (gönderilen, başarısız) döndürür."""
+        kuyruk = asyncio.Queue()
+        for chat_id in chat_ids:
+            kuyruk.put_nowait((chat_id, 0))
+        chat_buckets = {}
+        sayac = {"ok": 0, "hata": 0}
+
+        async def isci():
+            while True:
+                try:
+                    chat_id, deneme = kuyruk.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                bucket = chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, 1))
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    await bot.send_message(chat_id, metin)
+                    sayac["ok"] += 1
+                except RetryAfter as e:
+                    # Tüm işçiler beklesin, mesaj tekrar kuyruğa
+                    self.global_bucket.pause(retry_after_saniye(e))
+                    if deneme + 1 < BROADCAST_MAX_DENEME:
+                        kuyruk.put_nowait((chat_id, deneme + 1))
+                    else:
+                        sayac["hata"] += 1
+                except Forbidden:
+                    # Bot engellenmiş veya gruptan çıkarılmış
+                    await run_blocking(ABONELER.remove, chat_id)
+                    sayac["hata"] += 1
+                except Exception as e:
+                    report_error("telegram", f"Yayın hatası ({chat_id}): {e}")
+                    sayac["hata"] += 1
+
+        await asyncio.gather(*(isci() for _ in range(self.workers)))
+        return sayac["ok"], sayac["hata"]
+
+BROADCASTER = Broadcaster(BROADCAST_RATE, BROADCAST_CHAT_RATE, BROADCAST_WORKERS)
+
+def yayin_alicilari():
+    """CHAT_ID ve abone sohbetlerin birleşimi."""
+    alicilar = set(ABONELER.chat_ids)
+    if CHAT_ID:
+        try:
+            alicilar.add(int(CHAT_ID))
+        except ValueError:
+            report_error("config", f"Geçersiz CHAT_ID: {CHAT_ID}")
+    return alicilar
+
+async def build_morning_summary():
+    snaps = await get_snapshots(*TUM_KAYNAKLAR)
+    mesajlar = build_all_messages(snaps)
+    if not mesajlar:
+        return None
+    return "☀️ Günaydın! Piyasa özeti\n\n" + "\n\n".join(mesajlar)
+
+async def build_close_summary():
+    snap = await PRICE_CACHE.refresh("borsa")
+    if not snap.data:
+        return None
+    return "🔔 Borsa kapanışı\n\n" + render_snapshot(snap)
+
+# ad -> (saat, yalnızca hafta içi mi, mesaj üreten fonksiyon)
+YAYIN_PLANI = {
+    "sabah": (BROADCAST_SABAH, False, build_morning_summary),
+    "kapanis": (BROADCAST_KAPANIS, True, build_close_summary),
+}
+
+def sonraki_calisma(saat, hafta_ici, now=None):
+    """SS:DD biçimindeki saatin bir sonraki gerçekleşeceği zamanı (TR saati) döndürür."""
+    now = now or datetime.now(TR_TZ)
+    ss, dd = (int(x) for x in saat.split(":"))
+    aday = now.replace(hour=ss, minute=dd, second=0, microsecond=0)
+    if aday <= now:
+        aday += timedelta(days=1)
+    while hafta_ici and aday.weekday() >= 5:
+        aday += timedelta(days=1)
+    return aday
+
+async def run_broadcast(ad, bot):
+    _saat, _hafta_ici, uretici = YAYIN_PLANI[ad]
+    alicilar = yayin_alicilari()
+    if not alicilar:
+        return
+    metin = await uretici()
+    if not metin:
+        logger.info(f"📣 {ad} yayını atlandı: veri yok")
+        return
+    baslangic = time.monotonic()
+    ok, hata = await BROADCASTER.send(bot, alicilar, metin)
+    logger.info(f"📣 {ad} yayını: {ok}/{len(alicilar)} gönderildi, {hata} hata ({time.monotonic() - baslangic:.1f} sn)")
+
+async def broadcast_scheduler(bot):
+    """Planlanan yayınları zamanı gelince arka planda başlatır."""
+    while True:
+        now = datetime.now(TR_TZ)
+        ad, zaman = min(
+            ((ad, sonraki_calisma(saat, hafta_ici, now)) for ad, (saat, hafta_ici, _u) in YAYIN_PLANI.items()),
+            key=lambda x: x[1],
+        )
+        await asyncio.sleep((zaman - now).total_seconds())
+        try:
+            if lider_mi():
+                await run_broadcast(ad, bot)
+        except Exception as e:
+            report_error("background", f"{ad} yayın hatası: {e}")
+        # Aynı dakikada tekrar tetiklenmesin
+        await asyncio.sleep(1)
+
+# ========== SICAK BAŞLANGIÇ ==========
+# Kapanışta son snapshot'lar ve hazır mesajlar WARM_STATE_PATH'e yazılır,
+# açılışta geri yüklenir. Yeniden başlatma sonrası ilk komut diskteki veriyle
+# (gerekirse bayatlık notuyla) hemen yanıtlanır; bayat kaynaklar aynı anda
+# arka planda yenilenir ve bağlantı havuzları ısınır. Boş değer kapatır.
+WARM_STATE_PATH = os.getenv("WARM_STATE_PATH", "/tmp/finbot_sicak.json")
+
+def sicak_durumu_kaydet():
+    durum = {
+        "kaydedildi": time.time(),
+        "snapshots": PRICE_CACHE.dump(),
+        "mesajlar": RENDER_CACHE.dump(),
+    }
+    gecici = f"{WARM_STATE_PATH}.tmp"
+    # Snapshot verileri salt okunur MappingProxyType; json için dict'e çevrilir
+    with open(gecici, "w", encoding="utf-8") as f:
+        json.dump(durum, f, ensure_ascii=False, default=dict)
+    os.replace(gecici, WARM_STATE_PATH)
+    return len(durum["snapshots"])
+
+def sicak_durumu_oku():
     try:
-        if update.message is None:
+        with open(WARM_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        report_error("storage", f"Sıcak başlangıç dosyası okunamadı: {e}")
+        return None
+
+async def sicak_baslat():
+    """Kayıtlı snapshot'ları yükler, bayat olanları arka planda yeniler; yüklenen sayısını döndürür."""
+    durum = await run_blocking(sicak_durumu_oku)
+    if not durum:
+        return 0
+    snaps = PRICE_CACHE.restore(durum.get("snapshots", {}))
+    RENDER_CACHE.restore(durum.get("mesajlar", []))
+    for snap in snaps:
+        INLINE_INDEX.rebuild(snap.kaynak)
+        if not PRICE_CACHE.is_fresh(snap):
+            # Yenileme sürerken get() bayat snapshot'ı beklemeden döndürür
+            PRICE_CACHE.revalidate(snap.kaynak)
+    return len(snaps)
+
+BACKGROUND_TASKS = []
+
+async def on_startup(application):
+    """Bot başlarken arka plan görevlerini başlatır."""
+    global BOT_INSTANCE
+    BOT_INSTANCE = application.bot
+    if WARM_STATE_PATH:
+        try:
+            yuklenen = await sicak_baslat()
+            if yuklenen:
+                logger.info(f"♨️ {yuklenen} kaynak diskteki son veriden yüklendi.")
+        except Exception as e:
+            report_error("storage", f"Sıcak başlangıç hatası: {e}")
+    if REFRESH_ENABLED:
+        REFRESHER.start()
+    if BROADCAST_ENABLED:
+        BACKGROUND_TASKS.append(asyncio.create_task(broadcast_scheduler(application.bot)))
+    if REPLICA_MODE:
+        BACKGROUND_TASKS.append(asyncio.create_task(replika_esitleyici()))
+
+async def on_shutdown(application):
+    """Bot kapanırken arka plan görevlerini durdurur."""
+    for task in BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+    BACKGROUND_TASKS.clear()
+    await REFRESHER.stop()
+    if WARM_STATE_PATH:
+        try:
+            await run_blocking(sicak_durumu_kaydet)
+        except Exception as e:
+            report_error("storage", f"Sıcak başlangıç dosyası yazılamadı: {e}")
+    if LIDER is not None:
+        # Kira hemen bırakılır; diğer kopya süre dolmasını beklemeden devralır
+        await LIDER.birak()
+
+# ========== HTTP SUNUCUSU (HEALTH + WEBHOOK) ==========
+# Koyeb'in port kontrolü ve (webhook modunda) Telegram güncellemeleri PORT
+# üzerinde tek bir asyncio HTTP sunucusundan karşılanır; ayrı thread yoktur.
+# WEBHOOK_URL tanımlıysa bot webhook modunda çalışır: gelen güncelleme gizli
+# token ile doğrulanır, Application kuyruğuna atılır ve hemen 200 dönülür.
+# Böylece birden fazla replika bir load balancer arkasında çalışabilir.
+PORT = int(os.environ.get("PORT", 8000))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Tanımlı değilse tüm replikalarda aynı olacak şekilde token'dan türetilir
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32]
+HTTP_MAX_BODY = 1024 * 1024
+# Başlık/gövde bu sürede gelmezse (boşta keep-alive dahil) bağlantı kapatılır
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+# Replikalar tek tek yeniden başlarken kuyruktaki güncellemeler diğer
+# kopyalarındır; her açılışta atılırsa kaybolur
+WEBHOOK_DROP_PENDING = os.getenv("WEBHOOK_DROP_PENDING", "0" if REPLICA_MODE else "1") == "1"
+
+HTTP_DURUMLARI = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+class HttpRequest(NamedTuple):
+    method: str
+    path: str
+    headers: dict
+    body: bytes
+
+class HttpServer:
+    """Keep-alive destekli, route tablosuyla çalışan küçük asyncio HTTP sunucusu."""
+
+    def __init__(self, port):
+        self.port = port
+        # (method, path) -> async handler(request) -> (durum, content-type, gövde)
+        self.routes = {}
+        self._server = None
+
+    def route(self, method, path, handler):
+        self.routes[(method, path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, "0.0.0.0", self.port)
+        logger.info(f"🔌 HTTP sunucusu {self.port} portunda başlatıldı.")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                if isinstance(request, int):
+                    await self._write(writer, request, "text/plain", HTTP_DURUMLARI[request].encode(), False)
+                    break
+                durum, content_type, govde = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await self._write(writer, durum, content_type, govde, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            report_error("http", f"HTTP bağlantı hatası: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        try:
+            baslik = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HTTP_READ_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return None
+        except asyncio.LimitOverrunError:
+            return 400
+        satirlar = baslik.decode("latin-1").split("\r\n")
+        try:
+            method, hedef, _surum = satirlar[0].split(" ", 2)
+        except ValueError:
+            return 400
+        headers = {}
+        for satir in satirlar[1:]:
+            if ":" in satir:
+                ad, deger = satir.split(":", 1)
+                headers[ad.strip().lower()] = deger.strip()
+        try:
+            uzunluk = int(headers.get("content-length", "0"))
+        except ValueError:
+            return 400
+        if uzunluk > HTTP_MAX_BODY:
+            return 413
+        try:
+            body = await asyncio.wait_for(reader.readexactly(uzunluk), HTTP_READ_TIMEOUT) if uzunluk else b""
+        except asyncio.TimeoutError:
+            return None
+        return HttpRequest(method.upper(), urlsplit(hedef).path, headers, body)
+
+    async def _dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _m, path in self.routes):
+                return 405, "text/plain", b"Method Not Allowed"
+            return 404, "text/plain", b"Not Found"
+        try:
+            return await handler(request)
+        except Exception as e:
+            report_error("http", f"HTTP handler hatası ({request.path}): {e}")
+            return 500, "text/plain", b"Internal Server Error"
+
+    @staticmethod
+    async def _write(writer, durum, content_type, govde, keep_alive):
+        basliklar = (
+            f"HTTP/1.1 {durum} {HTTP_DURUMLARI.get(durum, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(govde)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(basliklar.encode("latin-1") + govde)
+        await writer.drain()
+
+async def health_route(request):
+    return 200, "text/plain; charset=utf-8", b"OK - Bot Calisiyor"
+
+def webhook_route(application):
+    """Telegram güncellemelerini doğrulayıp Application kuyruğuna atan route."""
+    async def handler(request):
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            return 403, "text/plain", b"Forbidden"
+        try:
+            veri = json.loads(request.body)
+            # Geçerli JSON ama nesne olmayan gövdede ([], "x") de_json None döner
+            update = Update.de_json(veri, application.bot) if isinstance(veri, dict) else None
+        except (ValueError, TypeError, KeyError):
+            update = None
+        if not isinstance(update, Update):
+            return 400, "text/plain", b"Bad Request"
+        # İşleme beklenmeden hemen onay dönülür
+        application.update_queue.put_nowait(update)
+        return 200, "text/plain", b"OK"
+    return handler
+
+# Talep edilen kaynaklardan son başarılı çekimi bundan eski olan "stale" sayılır (saniye)
+HEALTH_MAX_AGE = float(os.getenv("HEALTH_MAX_AGE", "900"))
+
+def health_report():
+    """
+    Kaynak başına snapshot yaşı ve son başarı/başarısızlık zamanları.
+    Yenileme talebe bağlı olduğundan yalnızca talep edilen kaynakların yaşı
+    sağlığa sayılır; kimsenin sormadığı kaynak eskise de bot sağlıklıdır.
+    """
+    now = time.time()
+    talep = talep_edilen_kaynaklar()
+    kaynaklar = {}
+    for kaynak in SCRAPERS:
+        snap = PRICE_CACHE.peek(kaynak)
+        hata = PRICE_CACHE.last_failure.get(kaynak)
+        kaynaklar[kaynak] = {
+            "snapshot_age": round(now - snap.fetched_at, 1) if snap else None,
+            "version": snap.version if snap else None,
+            "last_success": datetime.fromtimestamp(snap.fetched_at, TR_TZ).isoformat() if snap else None,
+            "last_failure": datetime.fromtimestamp(hata, TR_TZ).isoformat() if hata else None,
+            "demanded": kaynak in talep,
+            "stale": kaynak in talep and (snap is None or now - snap.fetched_at > HEALTH_MAX_AGE),
+        }
+    stale = sum(1 for k in kaynaklar.values() if k["stale"])
+    if stale == 0:
+        durum = "ok"
+    elif stale < len(talep & kaynaklar.keys()):
+        durum = "degraded"
+    else:
+        durum = "down"
+    return {"status": durum, "uptime": round(now - STARTED_AT, 1), "sources": kaynaklar}
+
+async def healthz_route(request):
+    rapor = health_report()
+    durum = 503 if rapor["status"] == "down" else 200
+    return durum, "application/json", json.dumps(rapor, ensure_ascii=False).encode()
+
+async def metrics_route(request):
+    return 200, "text/plain; version=0.0.4; charset=utf-8", METRICS.render().encode()
+
+def _snapshot_yaslari():
+    now = time.time()
+    return {
+        (kaynak,): round(now - snap.fetched_at, 3)
+        for kaynak in SCRAPERS
+        if (snap := PRICE_CACHE.peek(kaynak)) is not None
+    }
+
+def _cache_hit_orani():
+    oranlar = {}
+    for kaynak in SCRAPERS:
+        hit = CACHE_REQUESTS.value(kaynak, "hit")
+        toplam = hit + CACHE_REQUESTS.value(kaynak, "miss")
+        if toplam:
+            oranlar[(kaynak,)] = round(hit / toplam, 4)
+    return oranlar
+
+METRICS.register(Gauge(
+    "finbot_snapshot_age_seconds", "Kaynağın son snapshot yaşı", ("kaynak",), callback=_snapshot_yaslari))
+METRICS.register(Gauge(
+    "finbot_cache_hit_ratio", "Snapshot önbelleği isabet oranı", ("kaynak",), callback=_cache_hit_orani))
+
+HTTP_SERVER = HttpServer(PORT)
+HTTP_SERVER.route("GET", "/", health_route)
+HTTP_SERVER.route("GET", "/health", health_route)
+HTTP_SERVER.route("GET", "/healthz", healthz_route)
+HTTP_SERVER.route("GET", "/metrics", metrics_route)
+
+class MetricsRequest(HTTPXRequest):
+    """Bot API isteklerinin süresini method bazında ölçen istek katmanı."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        baslangic = time.perf_counter()
+        try:
+            with phase("reply"):
+                return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            ERRORS.inc("telegram")
+            raise
+        finally:
+            TELEGRAM_DURATION.observe(time.perf_counter() - baslangic, url.rsplit("/", 1)[-1])
+
+# ========== KOMUT KISITLAMA VE BİRLEŞTİRME ==========
+# Kaynak çeken komutlar (/all, /kasa, /liste, /au ...) kullanıcı ve sohbet başına
+# token kovasından geçer; kovası boşalan kısa bir bekleme notu alır, scrape
+# tetiklenmez. Aynı sohbetten gelen aynı komut (aynı argümanlarla) ilki
+# sürerken gelirse ikinci kez hesaplanmaz; ilkinin yanıtı sohbete gider.
+# İlki bittikten sonra gelen tekrar normal çalışır ve yanıt alır (fiyatlar
+# önbellekten, görünüm RenderCache'ten gelir). Yöneticiler kısıtlanmaz.
+# Sınırlar kopya başınadır (replika modunda her kopya kendi kovasını tutar).
+USER_RATE_PER_MIN = float(os.getenv("USER_RATE_PER_MIN", "10"))
+USER_BURST = float(os.getenv("USER_BURST", "5"))
+CHAT_RATE_PER_MIN = float(os.getenv("CHAT_RATE_PER_MIN", "30"))
+CHAT_BURST = float(os.getenv("CHAT_BURST", "10"))
+# Kısıtlanan komutlar; sonucu kullanıcıya özel olanlar birleştirmede kullanıcıyı da anahtara katar
+PAHALI_KOMUTLAR = {"au", "para", "borsa", "kripto", "all", "kasa", "grafik", "liste"}
+KISIYE_OZEL_KOMUTLAR = {"kasa", "liste"}
+# Bu kadar kova birikince dolmuş (boşta) olanlar atılır
+KOVA_SINIRI = 10000
+
+THROTTLED = METRICS.register(Counter(
+    "finbot_throttled_total", "Kova boş olduğu için reddedilen komutlar", ("komut", "kapsam")))
+COALESCED = METRICS.register(Counter(
+    "finbot_coalesced_total", "Süren aynı komuta katılıp tekrar hesaplanmayan komutlar", ("komut",)))
+
+class KovaHavuzu:
+    """Anahtar başına TokenBucket; boşta kalan kovalar zamanla temizlenir."""
+
+    def __init__(self, dakikada, kapasite):
+        self.rate = dakikada / 60
+        self.capacity = kapasite
+        self._kovalar = {}
+
+    def al(self, anahtar):
+        kova = self._kovalar.get(anahtar)
+        if kova is None:
+            if len(self._kovalar) >= KOVA_SINIRI:
+                self._temizle()
+            kova = self._kovalar[anahtar] = TokenBucket(self.rate, self.capacity)
+        return kova
+
+    def _temizle(self):
+        now = time.monotonic()
+        self._kovalar = {
+            k: v for k, v in self._kovalar.items()
+            if v.tokens + (now - v.updated) * v.rate < v.capacity
+        }
+
+class KomutKisitlayici:
+    def __init__(self):
+        self.kullanicilar = KovaHavuzu(USER_RATE_PER_MIN, USER_BURST)
+        self.sohbetler = KovaHavuzu(CHAT_RATE_PER_MIN, CHAT_BURST)
+        # Sürmekte olan komutların birleştirme anahtarları
+        self._surenler = set()
+        # kullanıcı -> bekleme notunun geçerli olduğu an; not bir kez gönderilir
+        self._bildirilen = {}
+
+    def bekleme(self, user_id, chat_id):
+        """Komut çalışabilirse 0, yoksa (kapsam, saniye) döndürür."""
+        kova = self.kullanicilar.al(user_id)
+        sure = kova.try_acquire()
+        if sure:
+            return "kullanici", sure
+        if chat_id != user_id:
+            sure = self.sohbetler.al(chat_id).try_acquire()
+            if sure:
+                # Sohbet dolu; kullanıcının token'ı boşa harcanmasın
+                kova.refund()
+                return "sohbet", sure
+        return 0
+
+    def bildirilsin_mi(self, user_id, sure):
+        now = time.monotonic()
+        if self._bildirilen.get(user_id, 0) > now:
+            return False
+        if len(self._bildirilen) >= KOVA_SINIRI:
+            self._bildirilen = {k: v for k, v in self._bildirilen.items() if v > now}
+        self._bildirilen[user_id] = now + sure
+        return True
+
+    def basla(self, anahtar):
+        """Aynı komut sürmüyorsa anahtarı kaydedip True döndürür."""
+        if anahtar in self._surenler:
+            return False
+        self._surenler.add(anahtar)
+        return True
+
+    def bitir(self, anahtar):
+        """Komut bitti ya da reddedildi; sonraki tekrar normal çalışır."""
+        self._surenler.discard(anahtar)
+
+KISITLAYICI = KomutKisitlayici()
+
+def kisitli(komut, handler):
+    """Pahalı komutları birleştiren ve kullanıcı/sohbet başına kısıtlayan sarmalayıcı."""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        user = update.effective_user
+        chat = update.effective_chat
+        if update.message is None or user is None or chat is None or user.id in ADMIN_IDS:
+            return await handler(update, context)
+        
+        anahtar = (chat.id, komut, tuple(a.lower() for a in context.args or ()))
+        if komut in KISIYE_OZEL_KOMUTLAR:
+            anahtar += (user.id,)
+        if not KISITLAYICI.basla(anahtar):
+            # Aynı komut sürüyor; yanıtı sohbete zaten gidecek
+            COALESCED.inc(komut)
+            return
+        sonuc = KISITLAYICI.bekleme(user.id, chat.id)
+        if sonuc:
+            kapsam, sure = sonuc
+            THROTTLED.inc(komut, kapsam)
+            KISITLAYICI.bitir(anahtar)
+            if KISITLAYICI.bildirilsin_mi(user.id, sure):
+                await update.message.reply_text(
+                    f"⏳ Çok sık istek gönderildi. Lütfen {int(sure) + 1} sn sonra tekrar deneyin."
+                )
+            return
+        try:
+            return await handler(update, context)
+        finally:
+            KISITLAYICI.bitir(anahtar)
+    return wrapper
+
+def komut_handler(komut, handler):
+    """
+    Ölçülen handler; PAHALI_KOMUTLAR'dakiler kısıtlayıcıdan geçer. kisitli
+    dışta kalır, reddedilen ya da birleştirilen çağrılar /stats'a 0 ms örnek
+    eklemez.
+    """
+    wrapped = instrumented(komut, handler)
+    return kisitli(komut, wrapped) if komut in PAHALI_KOMUTLAR else wrapped
+
+# ========== EŞZAMANLI GÜNCELLEME İŞLEME ==========
+# Güncellemeler sırayla değil, en fazla UPDATE_CONCURRENCY tanesi aynı anda
+# işlenir; bir kullanıcının yavaş /all'ı diğerlerini bekletmez. Aynı
+# kullanıcının (kullanıcı yoksa sohbetin) güncellemeleri geliş sırasıyla tek
+# tek çalışır, iki /duzenle iç içe geçmez. UPDATE_CONCURRENCY=1 eski sıralı
+# davranıştır. Bot API bağlantı havuzu eşzamanlı yanıtlar ve yayın işçileri
+# aynı anda bağlantı bulacak şekilde boyutlandırılır.
+UPDATE_CONCURRENCY = max(1, int(os.getenv("UPDATE_CONCURRENCY", "32")))
+TELEGRAM_POOL_SIZE = int(os.getenv(
+    "TELEGRAM_POOL_SIZE", str(UPDATE_CONCURRENCY + BROADCAST_WORKERS + 4)))
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))
+
+class SiraliUpdateProcessor(BaseUpdateProcessor):
+    """
+    Kullanıcılar arasında eşzamanlı, kullanıcı içinde sıralı güncelleme işleyici.
+    PTB'nin semaforu do_process_update'ten önce alınır; kullanıcı kilidi onun
+    içinde beklenirse tek kullanıcının birikmiş komutları tüm yuvaları tutar.
+    Bu yüzden PTB'ye sınırsız eşzamanlılık bildirilir, asıl sınır kullanıcı
+    sırası beklendikten sonra alınan kendi semaforumuzdur.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(sys.maxsize)
+        self.yuva = max_concurrent_updates
+        self._yuvalar = asyncio.Semaphore(max_concurrent_updates)
+        # anahtar -> [asyncio.Lock, bekleyen güncelleme sayısı]
+        self._kilitler = {}
+        self.islenen = 0
+
+    @staticmethod
+    def sira_anahtari(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        anahtar = self.sira_anahtari(update)
+        if anahtar is None:
+            await self._calistir(coroutine)
             return
+        kayit = self._kilitler.get(anahtar)
+        if kayit is None:
+            kayit = self._kilitler[anahtar] = [asyncio.Lock(), 0]
+        kayit[1] += 1
+        try:
+            # asyncio.Lock bekleyenleri geliş sırasıyla uyandırır
+            async with kayit[0]:
+                await self._calistir(coroutine)
+        finally:
+            kayit[1] -= 1
+            if not kayit[1]:
+                del self._kilitler[anahtar]
+
+    async def _calistir(self, coroutine):
+        # Yuva yalnızca güncelleme gerçekten çalışacakken alınır
+        async with self._yuvalar:
+            self.islenen += 1
+            try:
+                await coroutine
+            finally:
+                self.islenen -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+UPDATE_PROCESSOR = SiraliUpdateProcessor(UPDATE_CONCURRENCY)
+METRICS.register(Gauge(
+    "finbot_updates_in_flight", "Aynı anda işlenen güncelleme sayısı",
+    callback=lambda: {(): UPDATE_PROCESSOR.islenen}))
+
+async def run_bot(application):
+    """
+    Application yaşam döngüsü: HTTP sunucusu, arka plan görevleri ve
+    polling ya da webhook ile güncelleme alımı. SIGINT/SIGTERM ile durur.
+    """
+    dur = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, dur.set)
+        except NotImplementedError:
+            pass
+    
+    async with application:
+        await on_startup(application)
+        if WEBHOOK_URL:
+            HTTP_SERVER.route("POST", WEBHOOK_PATH, webhook_route(application))
+        await HTTP_SERVER.start()
+        await application.start()
+        
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=WEBHOOK_DROP_PENDING,
+            )
+            logger.info(f"🪝 Webhook modunda çalışıyor: {WEBHOOK_URL}{WEBHOOK_PATH}")
+        else:
+            await application.updater.start_polling(
+                drop_pending_updates=WEBHOOK_DROP_PENDING,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info("📡 Polling modunda çalışıyor...")
         
-        # 1. Altın verileri
-        gram_data = get_gold_data()
-        tur_data = get_altin_turleri_data()
-        
-        au_message = "📊 Altın Fiyatları\n"
-        for kaynak in KAYNAKLAR.keys():
-            if kaynak in gram_data:
-                info = gram_data[kaynak]
-                emoji = KAYNAKLAR[kaynak]
-                au_message += f"\n{emoji} {kaynak}\n"
-                au_message += f"Alış: {info['alis']:.2f} TL\n"
-                au_message += f"Satış: {info['satis']:.2f} TL\n"
-                au_message += f"Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:.2f} TL\n"
-        for isim in ALTIN_TURLERI.keys():
-            if isim in tur_data:
-                info = tur_data[isim]
-                au_message += f"\n {isim}\n"
-                au_message += f"  Alış: {info['alis']:,.2f} TL\n"
-                au_message += f"  Satış: {info['satis']:,.2f} TL\n"
-                au_message += f"  Makas: %{info['makas_yuzde']:.2f} | {info['makas_tl']:,.2f} TL\n"
-        await update.message.reply_text(au_message)
-        
-        # 2. Döviz verileri
-        para_data = get_para_data()
-        para_message = format_para_message(para_data)
-        await update.message.reply_text(para_message)
-        
-        # 3. Borsa verileri
-        borsa_data = get_borsa_data()
-        borsa_message = format_borsa_message(borsa_data)
-        await update.message.reply_text(borsa_message)
-        
-        # 4. Kripto verileri
-        kripto_data = get_kripto_data()
-        kripto_message = format_kripto_message(kripto_data)
-        await update.message.reply_text(kripto_message)
-        
-    except Exception as e:
-        print(f"All komutu hatası: {e}")
+        hazir = time.perf_counter() - _SUREC_BASLANGIC
+        STARTUP_DURATION.set(hazir, "hazir")
+        logger.info(f"⚡ Başlangıç: {hazir * 1000:.0f} ms (modül yükleme {STARTUP_DURATION.value('import') * 1000:.0f} ms)")
+        
+        try:
+            await dur.wait()
+        finally:
+            logger.info("⏹️ Bot durduruluyor...")
+            if application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            await HTTP_SERVER.stop()
+            await on_shutdown(application)
 
 def main():
     """
@@ -669,37 +4313,53 @@ def main():
     Koyeb'de otomatik yeniden başlatma ile çalışır.
     """
     logger.info("🚀 Finans Botu başlatılıyor...")
-    logger.info(f"📁 Veri dosyası: {DATA_FILE}")
-
-    # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
-    # [EKLENDI] DUMMY SERVER BASLATMA (DAEMON THREAD OLARAK)
-    # Bu kod, bot polling'e geçmeden hemen önce çalışır.
-    # Daemon=True olduğu için ana program kapanınca bu da kapanır.
-    threading.Thread(target=run_dummy_server, daemon=True).start()
-    # +++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    if STORAGE_BACKEND == "json":
+        logger.info(f"📁 Veri dosyası: {DATA_FILE}")
+    else:
+        logger.info(f"📁 Veritabanı: {DB_PATH}")
+    if REPLICA_MODE:
+        logger.info(f"🧩 Replika modu: {REPLICA_ID} | ortak veri: {SHARED_DB_PATH}")
+        if STORAGE_BACKEND == "json":
+            logger.warning("⚠️ Replika modunda JSON deposu kopyalar arasında eşitlenmez; sqlite kullanın.")
     
     try:
         # Application oluştur
-        application = Application.builder().token(BOT_TOKEN).build()
+        # Bot API istekleri ölçülür; güncellemeler kullanıcı başına sıralı,
+        # kullanıcılar arasında eşzamanlı işlenir
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .request(MetricsRequest(
+                connection_pool_size=TELEGRAM_POOL_SIZE, pool_timeout=TELEGRAM_POOL_TIMEOUT))
+            .concurrent_updates(UPDATE_PROCESSOR)
+            .build()
+        )
         
         # Handler'ları ekle
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("au", au))
-        application.add_handler(CommandHandler("para", para))
-        application.add_handler(CommandHandler("borsa", borsa))
-        application.add_handler(CommandHandler("kripto", kripto))
-        application.add_handler(CommandHandler("all", all_data))
-        application.add_handler(CommandHandler("duzenle", duzenle))
-        application.add_handler(CommandHandler("kasa", kasa))
+        application.add_handler(CommandHandler("start", komut_handler("start", start)))
+        application.add_handler(CommandHandler("au", komut_handler("au", au)))
+        application.add_handler(CommandHandler("para", komut_handler("para", para)))
+        application.add_handler(CommandHandler("borsa", komut_handler("borsa", borsa)))
+        application.add_handler(CommandHandler("kripto", komut_handler("kripto", kripto)))
+        application.add_handler(CommandHandler("all", komut_handler("all", all_data)))
+        application.add_handler(CommandHandler("duzenle", komut_handler("duzenle", duzenle)))
+        application.add_handler(CommandHandler("kasa", komut_handler("kasa", kasa)))
+        application.add_handler(CommandHandler("grafik", komut_handler("grafik", grafik)))
+        application.add_handler(CommandHandler("alarm", komut_handler("alarm", alarm)))
+        application.add_handler(CommandHandler("alarmlar", komut_handler("alarmlar", alarmlar)))
+        application.add_handler(CommandHandler("alarmsil", komut_handler("alarmsil", alarmsil)))
+        application.add_handler(CommandHandler("abone", komut_handler("abone", abone)))
+        application.add_handler(CommandHandler("abonelikiptal", komut_handler("abonelikiptal", abonelikiptal)))
+        application.add_handler(CommandHandler("ekle", komut_handler("ekle", ekle)))
+        application.add_handler(CommandHandler("cikar", komut_handler("cikar", cikar)))
+        application.add_handler(CommandHandler("liste", komut_handler("liste", liste)))
+        application.add_handler(CommandHandler("stats", komut_handler("stats", stats)))
+        application.add_handler(InlineQueryHandler(instrumented("inline", inline_sorgu)))
         
         logger.info("✅ Bot başarıyla başlatıldı!")
-        logger.info("📡 Polling modunda çalışıyor...")
         
-        # Polling başlat (7/24 çalışır)
-        application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
+        # HTTP sunucusu + polling/webhook (7/24 çalışır)
+        asyncio.run(run_bot(application))
         
     except KeyboardInterrupt:
         logger.info("⏹️ Bot kullanıcı tarafından durduruldu.")
@@ -708,5 +4368,7 @@ def main():
         # Koyeb'in otomatik yeniden başlatması için exit code 1
         sys.exit(1)
 
+STARTUP_DURATION.set(time.perf_counter() - _SUREC_BASLANGIC, "import")
+
 if __name__ == "__main__":
     main()